@@ -1 +1,2 @@
-from .http_load_tester import HTTPLoadTester
\ No newline at end of file
+from .http_load_tester import HTTPLoadTester
+from .histogram import LatencyHistogram
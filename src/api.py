@@ -1,7 +1,16 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
 from flask_swagger_ui import get_swaggerui_blueprint
-from http_load_tester import HTTPLoadTester
+from http_load_tester import DRAIN_TIMEOUT, HTTPLoadTester, run_workers, shard_config
+from capacity_search import CapacitySearch
+from distributed import agent_stream, run_distributed
+from jobs import JobManager, FINISHED_STATES
+from metrics_exporter import OPENMETRICS_CONTENT_TYPE, PROMETHEUS_CONTENT_TYPE, render_metrics, wants_openmetrics
+from run_store import RunStore, SIGNIFICANCE_LEVEL
 import asyncio
+import json
+import threading
+import time
+import uuid
 import yaml
 import os
 import shutil
@@ -52,39 +61,104 @@ def index():
         return f"Error: {str(e)}", 500
 
 
-@app.route('/run-test', methods=['GET', 'POST'])
-def run_test():
-    if request.method == 'GET':
-        return jsonify({
-            "error": "Method Not Allowed",
-            "message": "This endpoint only accepts POST requests. Please use the web interface at the root URL or send a POST request with the appropriate JSON payload."
-        }), 405
+# Sample logs asked for through the API are written here, named after their run; clients
+# only switch them on, so they cannot make the server write anywhere else
+SAMPLE_LOG_DIR = os.path.join(current_dir, 'output', 'samples')
 
-    try:
-        config = request.json
-        load_tester = HTTPLoadTester(
-            url=config['url'],
-            qps=config['qps'],
-            duration=config['duration'],
-            method=config['method'],
-            headers=config.get('headers'),
-            data=config.get('data'),
-            concurrency=config.get('concurrency', 100)
-        )
 
-        asyncio.run(load_tester.run_test())
-        results = load_tester.generate_report()
+# Request corpora and scenario CSV files named in a payload are read from here only
+DATA_DIR = os.environ.get('LOAD_TEST_DATA_DIR', os.path.join(current_dir, 'data'))
 
-        if not results:
-            return jsonify({'error': 'No results generated from the test'}), 500
 
-        # Save plots
-        output_dir = os.path.join(current_dir, 'output')
-        os.makedirs(output_dir, exist_ok=True)
-        latency_plot_path = os.path.join(output_dir, 'latency_distribution.png')
-        status_plot_path = os.path.join(output_dir, 'status_code_distribution.png')
+def data_path(path):
+    """Resolve a file named in a payload under DATA_DIR, rejecting anything outside it."""
+    root = os.path.realpath(DATA_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"{path} is outside the data directory")
+    return resolved
+
+
+def data_scenario(scenario):
+    """Return a scenario with its CSV file resolved under DATA_DIR (see data_path)."""
+    if isinstance(scenario, dict) and scenario.get('csv'):
+        return {**scenario, 'csv': data_path(scenario['csv'])}
+    return scenario
+
+
+def build_tester_config(config, run_id=None):
+    """Map a TestConfig payload onto HTTPLoadTester arguments.
+
+    ``run_id`` names the sample log, if one is asked for (a new id by default).
+    """
+    return dict(
+        url=config['url'],
+        # A load profile supersedes qps and duration
+        qps=config.get('qps', 0),
+        duration=config.get('duration', 60),
+        method=config['method'],
+        headers=config.get('headers'),
+        data=config.get('data'),
+        concurrency=config.get('concurrency', 100),
+        arrival=config.get('arrival', 'constant'),
+        trace_phases=config.get('trace_phases', False),
+        connection_limit=config.get('connection_limit', 100),
+        connection_limit_per_host=config.get('connection_limit_per_host', 0),
+        keepalive_timeout=config.get('keepalive_timeout', 15),
+        dns_cache_ttl=config.get('dns_cache_ttl', 10),
+        force_close=config.get('force_close', False),
+        warmup_connections=config.get('warmup_connections', 0),
+        body_mode=config.get('body_mode', 'stream'),
+        connect_timeout=config.get('connect_timeout'),
+        read_timeout=config.get('read_timeout'),
+        total_timeout=config.get('total_timeout'),
+        drain_timeout=config.get('drain_timeout', DRAIN_TIMEOUT),
+        engine=config.get('engine', 'aiohttp'),
+        h2_connections=config.get('h2_connections', 1),
+        h2_max_streams=config.get('h2_max_streams', 100),
+        load_profile=config.get('load_profile'),
+        mode=config.get('mode', 'open'),
+        think_time=config.get('think_time', 0),
+        think_time_distribution=config.get('think_time_distribution', 'fixed'),
+        requests_file=data_path(config['requests_file']) if config.get('requests_file') else None,
+        requests_loop=config.get('requests_loop', False),
+        requests_shuffle=config.get('requests_shuffle', False),
+        replay_timestamps=config.get('replay_timestamps', False),
+        replay_speed=config.get('replay_speed', 1.0),
+        scenario=data_scenario(config.get('scenario')),
+        sample_log=os.path.join(SAMPLE_LOG_DIR, f'{run_id or uuid.uuid4().hex}.bin')
+        if config.get('sample_log') else None
+    )
+
+
+def sample_log_urls(tester_config, workers=1):
+    """Return the URLs of the sample logs a run writes (one per worker), or None without one."""
+    if not tester_config.get('sample_log'):
+        return None
+    shards = shard_config(tester_config, workers) if workers > 1 else [tester_config]
+    return ['/output/samples/' + os.path.basename(shard['sample_log']) for shard in shards]
+
+
+def job_view(job):
+    """Return a job's resource, with the URL of its sample log when it writes one."""
+    view = job.to_dict()
+    if job.config.get('sample_log'):
+        view['sample_logs'] = sample_log_urls(job.config)
+    return view
+
+
+def save_plots(load_tester, results, subdir=''):
+    """Save the result plots under output/ and return their URLs."""
+    output_dir = os.path.join(current_dir, 'output', subdir)
+    os.makedirs(output_dir, exist_ok=True)
+    url_prefix = '/output/' + (f'{subdir}/' if subdir else '')
+    latency_plot_path = os.path.join(output_dir, 'latency_distribution.png')
+    status_plot_path = os.path.join(output_dir, 'status_code_distribution.png')
+    timeline_plot_path = os.path.join(output_dir, 'timeline.png')
+    # pyplot keeps global state, so background jobs must not plot concurrently
+    with plot_lock:
         load_tester.plot_latency_distribution(
-            results['latencies'],
+            load_tester.latency_histogram,
             results['p50_latency'],
             results['p90_latency'],
             results['p95_latency'],
@@ -95,12 +169,242 @@ def run_test():
             results['status_codes'],
             status_plot_path
         )
+        load_tester.plot_timeline(results['timeseries'], timeline_plot_path)
+
+    return {
+        'latency_plot': url_prefix + 'latency_distribution.png',
+        'status_plot': url_prefix + 'status_code_distribution.png',
+        'timeline_plot': url_prefix + 'timeline.png'
+    }
+
+
+def results_response(load_tester, config, sample_logs=None):
+    """Build the JSON response for a finished test, save its plots and add it to the run history."""
+    results = load_tester.generate_report()
 
+    if not results:
+        return jsonify({'error': 'No results generated from the test'}), 500
+
+    response = {'results': results, **save_plots(load_tester, results),
+                'run_id': run_store.save(config, load_tester, results)}
+    if sample_logs:
+        response['sample_logs'] = sample_logs
+    return jsonify(response)
+
+
+def finish_job(job):
+    """Save a background test's plots and, unless it was cancelled, add it to the run history."""
+    artifacts = save_plots(job.load_tester, job.results, job.id)
+    if not job.load_tester.stop_requested:
+        artifacts['run_id'] = run_store.save(job.config, job.load_tester, job.results)
+    return artifacts
+
+
+# How often the event stream checks a test for new metrics windows, in seconds
+EVENT_POLL_INTERVAL = 0.25
+
+plot_lock = threading.Lock()
+# Kept outside output/, so /clear leaves the history alone
+run_store = RunStore(os.environ.get('RUN_HISTORY_DB', os.path.join(current_dir, 'history', 'runs.db')))
+job_manager = JobManager(
+    max_concurrent_tests=int(os.environ.get('MAX_CONCURRENT_TESTS', 2)),
+    on_finished=finish_job
+)
+
+
+@app.route('/run-test', methods=['GET', 'POST'])
+def run_test():
+    if request.method == 'GET':
         return jsonify({
-            'results': results,
-            'latency_plot': '/output/latency_distribution.png',
-            'status_plot': '/output/status_code_distribution.png'
-        })
+            "error": "Method Not Allowed",
+            "message": "This endpoint only accepts POST requests. Please use the web interface at the root URL or send a POST request with the appropriate JSON payload."
+        }), 405
+
+    try:
+        config = request.json
+        tester_config = build_tester_config(config)
+
+        workers = config.get('workers', 1)
+        if workers > 1:
+            load_tester = run_workers(tester_config, workers)
+        else:
+            load_tester = HTTPLoadTester(**tester_config)
+            asyncio.run(load_tester.run_test())
+
+        return results_response(load_tester, tester_config, sample_log_urls(tester_config, workers))
+    except Exception as e:
+        app.logger.error(f"An error occurred: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/search', methods=['POST'])
+def run_capacity_search():
+    try:
+        config = request.json
+        search = CapacitySearch(build_tester_config(config), **config.get('search', {}))
+    except Exception as e:
+        app.logger.error(f"Invalid search configuration: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        results = asyncio.run(search.run())
+        response = {'results': results}
+        if search.probes:
+            os.makedirs(os.path.join(current_dir, 'output'), exist_ok=True)
+            with plot_lock:
+                search.plot_latency_curve(os.path.join(current_dir, 'output', 'latency_curve.png'))
+            response['latency_curve_plot'] = '/output/latency_curve.png'
+        return jsonify(response)
+    except Exception as e:
+        app.logger.error(f"An error occurred: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/tests', methods=['POST'])
+def create_test():
+    try:
+        config = request.json
+        if config.get('workers', 1) > 1:
+            return jsonify({'error': 'Background tests run in a single process; use /run-test for workers > 1'}), 400
+        job_id = uuid.uuid4().hex
+        job = job_manager.submit(build_tester_config(config, job_id), job_id)
+    except Exception as e:
+        app.logger.error(f"Invalid test configuration: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(job_view(job)), 202, {'Location': f'/tests/{job.id}'}
+
+
+@app.route('/tests', methods=['GET'])
+def list_tests():
+    return jsonify({'tests': [{'id': job.id, 'status': job.status, 'created_at': job.created_at}
+                              for job in job_manager.list()]})
+
+
+@app.route('/tests/<job_id>', methods=['GET'])
+def get_test(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown test: {job_id}'}), 404
+    return jsonify(job_view(job))
+
+
+@app.route('/tests/<job_id>/events')
+def test_events(job_id):
+    """Stream the live per-second metrics of a test as Server-Sent Events."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown test: {job_id}'}), 404
+
+    def stream():
+        last_index = -1
+        while True:
+            # Read the status first so windows closed just before the end are sent
+            finished = job.status in FINISHED_STATES
+            for window in list(job.windows):
+                if window['index'] > last_index:
+                    last_index = window['index']
+                    yield f"data: {json.dumps(window)}\n\n"
+            if finished:
+                yield f"event: done\ndata: {json.dumps({'status': job.status})}\n\n"
+                return
+            time.sleep(EVENT_POLL_INTERVAL)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/tests/<job_id>', methods=['DELETE'])
+def cancel_test(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown test: {job_id}'}), 404
+    return jsonify(job_view(job)), 202
+
+
+@app.route('/metrics')
+def metrics():
+    """Expose the running totals of every known test job for Prometheus."""
+    openmetrics = wants_openmetrics(request.headers.get('Accept'))
+    # Finished jobs have dropped their testers and are rendered from their final snapshot
+    body = render_metrics([({'job_id': job.id, 'url': job.config['url']}, job.load_tester or job.metrics)
+                           for job in job_manager.list()], openmetrics)
+    return Response(body, content_type=OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+
+
+@app.route('/runs', methods=['GET'])
+def list_runs():
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify({'runs': run_store.list(request.args.get('url'), limit)})
+
+
+@app.route('/runs/<int:run_id>', methods=['GET'])
+def get_run(run_id):
+    run = run_store.get(run_id)
+    if run is None:
+        return jsonify({'error': f'Unknown run: {run_id}'}), 404
+    return jsonify(run)
+
+
+@app.route('/runs/<int:baseline_id>/diff/<int:run_id>', methods=['GET'])
+def diff_runs(baseline_id, run_id):
+    try:
+        return jsonify(run_store.diff(baseline_id, run_id, float(request.args.get('alpha', SIGNIFICANCE_LEVEL))))
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/runs/<int:run_id>/check', methods=['POST'])
+def check_run(run_id):
+    """Check a run against a baseline; the verdict is in ``passed``, so CI can gate on it."""
+    options = dict(request.get_json(silent=True) or {})
+    try:
+        return jsonify(run_store.check(run_id, options.pop('baseline_id', None),
+                                       options.pop('alpha', SIGNIFICANCE_LEVEL), **options))
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/agent/clock')
+def agent_clock():
+    return jsonify({'time': time.time()})
+
+
+@app.route('/agent/run-test', methods=['POST'])
+def agent_run_test():
+    try:
+        config = request.json
+        tester_config = build_tester_config(config)
+        tester_config['start_at'] = config.get('start_at')
+        tester_config['requests_shard'] = config.get('requests_shard')
+        # Validate the slice before committing to a streaming response
+        HTTPLoadTester(**tester_config).close()
+    except Exception as e:
+        app.logger.error(f"Invalid agent test slice: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+    return Response(stream_with_context(agent_stream(tester_config)), mimetype='application/x-ndjson')
+
+
+@app.route('/coordinator/run-test', methods=['POST'])
+def coordinator_run_test():
+    try:
+        config = request.json
+        agents = config.get('agents')
+        if not agents:
+            return jsonify({'error': 'At least one agent URL is required'}), 400
+
+        tester_config = build_tester_config(config)
+        load_tester = asyncio.run(run_distributed(tester_config, agents))
+
+        return results_response(load_tester, tester_config)
     except Exception as e:
         app.logger.error(f"An error occurred: {str(e)}")
         return jsonify({'error': str(e)}), 500
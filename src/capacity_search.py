@@ -0,0 +1,197 @@
+from typing import Any, Dict, List, Optional
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+try:
+    from .http_load_tester import HTTPLoadTester
+except ImportError:
+    from http_load_tester import HTTPLoadTester
+
+# How the next probe rate is chosen: halve the interval between the highest
+# passing and the lowest failing rate, or additive increase / multiplicative
+# decrease from the lowest rate
+SEARCH_STRATEGIES = ('bisect', 'aimd')
+
+
+class CapacitySearch:
+    """Find the highest rate at which a target still meets a latency and error SLO.
+
+    Every probe is a short constant-rate ``HTTPLoadTester`` run built from
+    ``config``. A probe passes when its p99 response time (measured from the
+    scheduled send time, so generator queueing counts against it) is at most
+    ``max_p99_ms``, its error rate is at most ``max_error_rate`` and no sends
+    were dropped at the concurrency limit. The search stops once the highest
+    passing and lowest failing rates are within ``tolerance`` (a fraction of
+    the failing rate) of each other, when ``max_qps`` passes, when
+    ``min_qps`` fails, or after ``max_probes`` probes.
+    """
+
+    def __init__(self, config: Dict[str, Any], max_p99_ms: float, max_error_rate: float = 0.01,
+                 strategy: str = 'bisect', min_qps: float = 1, max_qps: float = 1000,
+                 probe_duration: float = 10, tolerance: float = 0.05, max_probes: int = 20,
+                 aimd_increase: float = None, aimd_decrease: float = 0.5):
+        if strategy not in SEARCH_STRATEGIES:
+            raise ValueError(f"Unknown search strategy: {strategy!r} "
+                             f"(expected one of {', '.join(SEARCH_STRATEGIES)})")
+        if not 0 < min_qps < max_qps:
+            raise ValueError("min_qps must be positive and lower than max_qps")
+        if not 0 < aimd_decrease < 1:
+            raise ValueError("aimd_decrease must be between 0 and 1")
+        self.config = config
+        self.max_p99_ms = max_p99_ms
+        self.max_error_rate = max_error_rate
+        self.strategy = strategy
+        self.min_qps = min_qps
+        self.max_qps = max_qps
+        self.probe_duration = probe_duration
+        self.tolerance = tolerance
+        self.max_probes = max_probes
+        self.aimd_increase = aimd_increase or (max_qps - min_qps) / 10
+        self.aimd_decrease = aimd_decrease
+        self.probes: List[Dict[str, Any]] = []
+        # Highest passing and lowest failing rates found so far
+        self.sustainable_qps: Optional[float] = None
+        self.limit_qps: Optional[float] = None
+        self.stop_requested = False
+        self._load_tester: Optional[HTTPLoadTester] = None
+
+    def stop(self):
+        """Stop the running probe and end the search; safe to call from any thread."""
+        self.stop_requested = True
+        if self._load_tester:
+            self._load_tester.stop()
+
+    def converged(self) -> bool:
+        if self.limit_qps is None:
+            return self.sustainable_qps is not None and self.sustainable_qps >= self.max_qps
+        if self.sustainable_qps is None:
+            return self.limit_qps <= self.min_qps
+        return self.limit_qps - self.sustainable_qps <= self.tolerance * self.limit_qps
+
+    async def run(self) -> Dict[str, Any]:
+        if self.strategy == 'bisect':
+            rates = self._bisect_rates()
+        else:
+            rates = self._aimd_rates()
+
+        passed = None
+        while len(self.probes) < self.max_probes and not self.stop_requested and not self.converged():
+            rate = rates.send(passed) if self.probes else next(rates)
+            passed = await self.probe(rate)
+        return self.report()
+
+    def _bisect_rates(self):
+        """Yield probe rates, receiving whether each probe passed."""
+        # The bounds first: there is nothing to bisect if either settles it
+        if (yield self.max_qps):
+            return
+        if not (yield self.min_qps):
+            return
+        while True:
+            yield (self.sustainable_qps + self.limit_qps) / 2
+
+    def _aimd_rates(self):
+        """Yield probe rates, receiving whether each probe passed."""
+        rate = self.min_qps
+        step = self.aimd_increase
+        while True:
+            if (yield rate):
+                rate += step
+                # Never jump to or past a rate already known to fail
+                if self.limit_qps is not None and rate >= self.limit_qps:
+                    rate = (self.sustainable_qps + self.limit_qps) / 2
+                rate = min(rate, self.max_qps)
+            else:
+                step *= self.aimd_decrease
+                rate = max(rate * self.aimd_decrease, self.sustainable_qps or self.min_qps)
+                if self.sustainable_qps is not None and rate <= self.sustainable_qps:
+                    rate = (self.sustainable_qps + self.limit_qps) / 2
+
+    async def probe(self, rate: float) -> bool:
+        """Run one probe at ``rate`` requests per second and record whether it met the SLO."""
+        probe_config = dict(self.config, qps=rate, duration=self.probe_duration, load_profile=None,
+                            mode='open')
+        self._load_tester = HTTPLoadTester(**probe_config)
+        await self._load_tester.run_test()
+        results = self._load_tester.generate_report()
+
+        violations = []
+        if results is None:
+            violations.append('no_results')
+            results = {}
+        else:
+            if results['p99_response_time'] > self.max_p99_ms:
+                violations.append('p99_latency')
+            if results['error_rate'] > self.max_error_rate:
+                violations.append('error_rate')
+            if results['dropped_sends']:
+                violations.append('dropped_sends')
+        passed = not violations
+
+        # A probe cut short by stop() says nothing about the rate
+        if not self.stop_requested:
+            if passed:
+                self.sustainable_qps = max(self.sustainable_qps or 0, rate)
+            else:
+                self.limit_qps = min(self.limit_qps or rate, rate)
+        self.probes.append({
+            'index': len(self.probes),
+            'target_qps': rate,
+            'achieved_qps': results.get('achieved_qps', 0),
+            'total_requests': results.get('total_requests', 0),
+            'error_rate': results.get('error_rate', 0),
+            'dropped_sends': results.get('dropped_sends', 0),
+            'p50_latency': results.get('p50_latency', 0),
+            'p90_latency': results.get('p90_latency', 0),
+            'p99_latency': results.get('p99_latency', 0),
+            'p99_response_time': results.get('p99_response_time', 0),
+            'passed': passed,
+            'violations': violations
+        })
+        return passed
+
+    def report(self) -> Dict[str, Any]:
+        """Return the search outcome and the latency curve, one point per probe in rate order."""
+        return {
+            'strategy': self.strategy,
+            'max_p99_ms': self.max_p99_ms,
+            'max_error_rate': self.max_error_rate,
+            'tolerance': self.tolerance,
+            'sustainable_qps': self.sustainable_qps or 0,
+            'limit_qps': self.limit_qps,
+            'converged': self.converged(),
+            'probes': self.probes,
+            'latency_curve': sorted(
+                ({key: probe[key] for key in ('target_qps', 'achieved_qps', 'p50_latency', 'p90_latency',
+                                              'p99_latency', 'p99_response_time', 'error_rate', 'passed')}
+                 for probe in self.probes),
+                key=lambda point: point['target_qps']
+            )
+        }
+
+    def plot_latency_curve(self, output_path: str):
+        curve = self.report()['latency_curve']
+        rates = [point['target_qps'] for point in curve]
+
+        plt.figure(figsize=(12, 6))
+        for key, label in (('p50_latency', 'p50'), ('p90_latency', 'p90'), ('p99_response_time', 'p99')):
+            plt.plot(rates, [point[key] for point in curve], marker='o', label=label)
+        for point in curve:
+            if not point['passed']:
+                plt.scatter(point['target_qps'], point['p99_response_time'], color='red', zorder=3)
+
+        plt.axhline(self.max_p99_ms, color='red', linestyle='dashed', linewidth=1,
+                    label=f'p99 SLO: {self.max_p99_ms:.2f} ms')
+        if self.sustainable_qps:
+            plt.axvline(self.sustainable_qps, color='green', linestyle='dashed', linewidth=1,
+                        label=f'Sustainable: {self.sustainable_qps:.1f} req/s')
+
+        plt.title('Latency by Request Rate')
+        plt.xlabel('Target rate (req/s)')
+        plt.ylabel('Latency (ms)')
+        plt.legend()
+        plt.tight_layout()
+        plt.savefig(output_path)
+        plt.close()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List
+
+import aiohttp
+
+try:
+    from .http_load_tester import HTTPLoadTester, shard_config
+except ImportError:
+    from http_load_tester import HTTPLoadTester, shard_config
+
+# Seconds between partial results streamed by an agent
+PROGRESS_INTERVAL = 1.0
+
+
+def agent_stream(config: Dict[str, Any], progress_interval: float = PROGRESS_INTERVAL) -> Iterator[str]:
+    """Run one test slice and yield its results as newline-delimited JSON.
+
+    ``config`` holds ``HTTPLoadTester`` arguments, including the agent-local
+    ``start_at``. A ``progress`` message with the state recorded so far is
+    emitted every ``progress_interval`` seconds, followed by a final
+    ``result`` (or ``error``) message. If the stream is closed early, e.g.
+    because the coordinator went away, the test is stopped.
+    """
+    load_tester = HTTPLoadTester(**config)
+    outcome = {}
+
+    def run():
+        try:
+            asyncio.run(load_tester.run_test())
+        except Exception as e:
+            outcome['error'] = f"{type(e).__name__}: {e}"
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(progress_interval)
+            if thread.is_alive():
+                # Taken on the test's loop, which keeps recording meanwhile
+                state = load_tester.read_live(load_tester.export_state)
+                yield json.dumps({'type': 'progress', 'state': state}) + '\n'
+    finally:
+        # Nobody reads the results any more, so stop loading the target
+        if thread.is_alive():
+            load_tester.stop()
+
+    if 'error' in outcome:
+        yield json.dumps({'type': 'error', 'error': outcome['error']}) + '\n'
+    else:
+        yield json.dumps({'type': 'result', 'state': load_tester.export_state()}) + '\n'
+
+
+async def measure_clock_offset(session: aiohttp.ClientSession, agent_url: str) -> float:
+    """Estimate how far the agent's wall clock is ahead of ours, in seconds."""
+    sent = time.time()
+    async with session.get(f"{agent_url}/agent/clock") as response:
+        response.raise_for_status()
+        agent_time = (await response.json())['time']
+    received = time.time()
+    return agent_time - (sent + received) / 2
+
+
+async def run_on_agent(session: aiohttp.ClientSession, agent_url: str, config: Dict[str, Any],
+                       on_progress: Callable[[str, Dict[str, Any]], None] = None) -> Dict[str, Any]:
+    """Send a test slice to one agent and return its final exported state."""
+    async with session.post(f"{agent_url}/agent/run-test", json=config) as response:
+        response.raise_for_status()
+        async for line in response.content:
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if message['type'] == 'progress':
+                if on_progress:
+                    on_progress(agent_url, message['state'])
+            elif message['type'] == 'result':
+                return message['state']
+            else:
+                raise RuntimeError(f"Agent {agent_url} failed: {message['error']}")
+    raise RuntimeError(f"Agent {agent_url} closed the stream without a result")
+
+
+async def run_distributed(config: Dict[str, Any], agents: List[str], start_delay: float = 2.0,
+                          on_progress: Callable[[str, Dict[str, Any]], None] = None) -> HTTPLoadTester:
+    """Fan one test out across ``agents`` and merge their results.
+
+    The rate and pool sizes are split across the agents (see
+    ``shard_config``). The start time is fixed on the coordinator's clock
+    and translated to each agent's clock using a measured offset, so all
+    agents begin sending together. The returned tester holds the merged
+    results. If any agent fails, the others' streams are closed, which
+    stops their tests too.
+    """
+    agents = [agent.rstrip('/') for agent in agents]
+    if not agents:
+        raise ValueError("At least one agent is required")
+
+    # Agent streams stay open for the whole test, so only bound idle reads
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=start_delay + PROGRESS_INTERVAL + 30)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        offsets = await asyncio.gather(*(measure_clock_offset(session, agent) for agent in agents))
+        start_at = time.time() + start_delay
+
+        # zip stops early when there are more agents than requests per second
+        tasks = [asyncio.create_task(run_on_agent(session, agent, dict(agent_config, start_at=start_at + offset),
+                                                  on_progress))
+                 for agent, offset, agent_config in zip(agents, offsets, shard_config(config, len(agents)))]
+        try:
+            states = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    merged = HTTPLoadTester(**config)
+    # Only the agents send; the merged tester never reads the corpus
+    merged.close()
+    for state in states:
+        merged.merge_state(state)
+    return merged
@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import time
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+try:
+    from .http_load_tester import HTTPLoadTester
+except ImportError:
+    from http_load_tester import HTTPLoadTester
+
+# Engines the HTTP/1.1 stub server can serve
+BENCHMARK_ENGINES = ('aiohttp', 'raw')
+
+
+def run_stub_server(port: int, payload_size: int = 64, latency: float = 0, sock: socket.socket = None):
+    """Serve a fixed ``payload_size``-byte body on every path, ``latency`` seconds late, until killed.
+
+    ``sock``, an already bound socket, is served instead of ``port``.
+    """
+    body = b'x' * payload_size
+
+    async def handler(request):
+        if latency:
+            await asyncio.sleep(latency)
+        return web.Response(body=body)
+
+    app = web.Application()
+    app.router.add_route('*', '/{tail:.*}', handler)
+    if sock is not None:
+        web.run_app(app, sock=sock, print=None, access_log=None)
+    else:
+        web.run_app(app, host='127.0.0.1', port=port, print=None, access_log=None)
+
+
+async def wait_for_server(url: str, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            tester = HTTPLoadTester(url=url, qps=0, engine='raw')
+            async with tester._create_session() as session:
+                await tester.engine.send(session, 'GET', url, {}, None)
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def benchmark_engine(engine: str, url: str, duration: float, concurrency: int) -> Dict[str, Any]:
+    """Saturate the stub server with closed-loop users and measure the generator's CPU cost.
+
+    The server runs in its own process, so ``time.process_time()`` only
+    counts the load generator.
+    """
+    tester = HTTPLoadTester(url=url, qps=0, duration=duration, mode='closed', concurrency=concurrency,
+                            connection_limit=concurrency, engine=engine)
+    cpu_start = time.process_time()
+    await tester.run_test()
+    cpu_seconds = time.process_time() - cpu_start
+    results = tester.generate_report()
+    return {
+        'engine': engine,
+        'total_requests': results['total_requests'],
+        'error_rate': results['error_rate'],
+        'achieved_qps': results['achieved_qps'],
+        'cpu_seconds': cpu_seconds,
+        'requests_per_cpu_second': results['total_requests'] / cpu_seconds if cpu_seconds else 0,
+        'p99_latency': results['p99_latency']
+    }
+
+
+def run_benchmark(engines: List[str], port: int = 8099, duration: float = 5, concurrency: int = 64,
+                  payload_size: int = 64) -> Dict[str, Any]:
+    """Benchmark each engine in turn against a local stub server.
+
+    ``gain`` is each engine's requests per CPU-second relative to the first
+    engine in ``engines``.
+    """
+    url = f'http://127.0.0.1:{port}/'
+    server = multiprocessing.Process(target=run_stub_server, args=(port, payload_size), daemon=True)
+    server.start()
+    try:
+        asyncio.run(wait_for_server(url))
+        results = [asyncio.run(benchmark_engine(engine, url, duration, concurrency)) for engine in engines]
+    finally:
+        server.terminate()
+        server.join()
+
+    baseline = results[0]['requests_per_cpu_second']
+    for result in results:
+        result['gain'] = result['requests_per_cpu_second'] / baseline if baseline else None
+    return {'duration': duration, 'concurrency': concurrency, 'payload_size': payload_size, 'engines': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the requests per CPU-second of the HTTP engines')
+    parser.add_argument('--engines', type=str, nargs='+', default=list(BENCHMARK_ENGINES),
+                        choices=BENCHMARK_ENGINES,
+                        help='Engines to benchmark; gains are relative to the first')
+    parser.add_argument('--port', type=int, default=8099, help='Port of the local stub server')
+    parser.add_argument('--duration', type=float, default=5, help='Seconds to run each engine')
+    parser.add_argument('--concurrency', type=int, default=64, help='Closed-loop users and connections')
+    parser.add_argument('--payload-size', type=int, default=64, help='Response body size in bytes')
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(args.engines, args.port, args.duration, args.concurrency,
+                                   args.payload_size), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,812 @@
+import asyncio
+import collections
+import contextlib
+import ssl
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.errors
+    import h2.events
+    import h2.exceptions
+    import h2.settings
+except ImportError:
+    h2 = None
+
+BODY_CHUNK_SIZE = 64 * 1024
+
+# Statuses whose responses never have a body, whatever their headers say
+NO_BODY_STATUSES = (204, 304)
+
+
+class Engine:
+    """How requests go over the wire.
+
+    An engine opens a session (an async context manager holding its
+    connections) and sends one request at a time on it, returning the
+    response status and the number of body bytes read. It reads the
+    tester's connection pool, timeout and body settings. Engines that
+    support phase tracing fill ``trace_marks`` with ``PhaseTimings``
+    signals.
+    """
+
+    name = None
+    supports_tracing = False
+
+    def __init__(self, load_tester):
+        self.load_tester = load_tester
+        # Identity of the last prepared request and the result; the objects
+        # are held here, so their ids cannot be reused while cached
+        self._last_request = None
+        self._last_prepared = None
+
+    def create_session(self):
+        raise NotImplementedError
+
+    def prepare(self, method: str, url: str, headers: Dict[str, str], data: Any):
+        """Return ``_prepare``'s wire form of a request, reusing it while the same request is sent again.
+
+        The configured request is the same objects every time, so it is
+        only prepared once.
+        """
+        last = self._last_request
+        if last is not None and last[0] is method and last[1] is url and last[2] is headers and last[3] is data:
+            return self._last_prepared
+        self._last_prepared = self._prepare(method, url, headers, data)
+        self._last_request = (method, url, headers, data)
+        return self._last_prepared
+
+    def _prepare(self, method: str, url: str, headers: Dict[str, str], data: Any):
+        raise NotImplementedError
+
+    def report(self) -> Dict[str, Any]:
+        """Return engine-specific fields to add to the test report."""
+        return {}
+
+    def export_state(self) -> Any:
+        return None
+
+    def merge_state(self, state: Any):
+        pass
+
+    async def send(self, session, method: str, url: str, headers: Dict[str, str], data: Any,
+                   trace_marks: Dict[str, float] = None) -> Tuple[int, int]:
+        raise NotImplementedError
+
+
+class AiohttpEngine(Engine):
+    """The default engine: ``aiohttp.ClientSession`` with a configured ``TCPConnector``."""
+
+    name = 'aiohttp'
+    supports_tracing = True
+
+    def create_session(self) -> aiohttp.ClientSession:
+        tester = self.load_tester
+        connector = aiohttp.TCPConnector(
+            limit=tester.connection_limit,
+            limit_per_host=tester.connection_limit_per_host,
+            # aiohttp rejects a keep-alive timeout together with force_close
+            keepalive_timeout=None if tester.force_close else tester.keepalive_timeout,
+            ttl_dns_cache=tester.dns_cache_ttl,
+            force_close=tester.force_close
+        )
+        trace_configs = [tester.phase_timings.trace_config()] if tester.phase_timings else None
+        timeout = aiohttp.ClientTimeout(total=tester.total_timeout, sock_connect=tester.connect_timeout,
+                                        sock_read=tester.read_timeout)
+        return aiohttp.ClientSession(connector=connector, trace_configs=trace_configs, timeout=timeout)
+
+    async def send(self, session: aiohttp.ClientSession, method: str, url: str, headers: Dict[str, str],
+                   data: Any, trace_marks: Dict[str, float] = None) -> Tuple[int, int]:
+        request_options = {'trace_request_ctx': trace_marks} if trace_marks is not None else {}
+        async with session.request(method, url, headers=headers, data=data, **request_options) as response:
+            return response.status, await self.read_body(response)
+
+    async def read_body(self, response: aiohttp.ClientResponse) -> int:
+        """Consume the response body and return its size in bytes."""
+        if self.load_tester.body_mode == 'full':
+            body = await response.read()
+            await response.text()
+            return len(body)
+
+        nbytes = 0
+        async for chunk in response.content.iter_chunked(BODY_CHUNK_SIZE):
+            nbytes += len(chunk)
+        return nbytes
+
+
+def split_url(url: str) -> Tuple[str, str, int, str, str]:
+    """Return the scheme, host, port, request target and authority (host[:port]) of ``url``."""
+    parts = urlsplit(url)
+    scheme = parts.scheme or 'http'
+    port = parts.port or (443 if scheme == 'https' else 80)
+    target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+    default_port = (scheme == 'https' and port == 443) or (scheme == 'http' and port == 80)
+    authority = parts.hostname if default_port else f'{parts.hostname}:{port}'
+    return scheme, parts.hostname, port, target, authority
+
+
+def encode_body(data: Any, engine: str) -> Optional[bytes]:
+    if isinstance(data, str):
+        return data.encode()
+    if data is None or isinstance(data, (bytes, bytearray)):
+        return data
+    raise TypeError(f"The {engine} engine sends str or bytes bodies, not {type(data).__name__}")
+
+
+class HTTPResponseParser:
+    """Minimal incremental HTTP/1.1 response parser.
+
+    Handles Content-Length, chunked and close-delimited bodies. Body bytes
+    are counted and dropped unless ``keep_body`` is set.
+    """
+
+    def __init__(self, method: str = 'GET', keep_body: bool = False):
+        self.method = method
+        self.keep_body = keep_body
+        self.buffer = bytearray()
+        self.status = None
+        self.headers: Dict[str, str] = {}
+        self.body = bytearray()
+        self.nbytes = 0
+        self.keep_alive = True
+        self.done = False
+        # 'length', 'chunked' or 'close' once the headers are in
+        self._framing = None
+        self._remaining = 0
+        # Chunked framing: expecting a 'size' line, chunk 'data', the CRLF at its 'data_end', or 'trailers'
+        self._chunk_state = 'size'
+
+    def feed(self, data: bytes) -> bool:
+        """Add received bytes; return True once the response is complete."""
+        self.buffer += data
+        if self.status is None and not self._parse_head():
+            return False
+        if self._framing == 'length':
+            n = min(len(self.buffer), self._remaining)
+            self._take(n)
+            self._remaining -= n
+            if self._remaining == 0:
+                self.done = True
+        elif self._framing == 'chunked':
+            self._parse_chunks()
+        elif self._framing == 'close':
+            self._take(len(self.buffer))
+        return self.done
+
+    def connection_lost(self) -> bool:
+        """Return True if the connection closing completes the response."""
+        if self._framing == 'close':
+            self.done = True
+            self.keep_alive = False
+        return self.done
+
+    def _take(self, n: int):
+        """Consume ``n`` body bytes from the buffer."""
+        if self.keep_body:
+            self.body += self.buffer[:n]
+        self.nbytes += n
+        del self.buffer[:n]
+
+    def _parse_head(self) -> bool:
+        end = self.buffer.find(b'\r\n\r\n')
+        if end == -1:
+            return False
+        lines = bytes(self.buffer[:end]).decode('latin-1').split('\r\n')
+        del self.buffer[:end + 4]
+        version, status = lines[0].split(' ', 2)[:2]
+        self.status = int(status)
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+
+        connection = self.headers.get('connection', '').lower()
+        self.keep_alive = connection != 'close' and (version != 'HTTP/1.0' or connection == 'keep-alive')
+        if self.method == 'HEAD' or self.status in NO_BODY_STATUSES:
+            self.done = True
+        elif 'chunked' in self.headers.get('transfer-encoding', '').lower():
+            self._framing = 'chunked'
+        elif 'content-length' in self.headers:
+            self._framing = 'length'
+            self._remaining = int(self.headers['content-length'])
+            self.done = self._remaining == 0
+        else:
+            self._framing = 'close'
+            self.keep_alive = False
+        return True
+
+    def _parse_chunks(self):
+        while not self.done:
+            if self._chunk_state == 'data':
+                n = min(len(self.buffer), self._remaining)
+                if not n:
+                    return
+                self._take(n)
+                self._remaining -= n
+                if self._remaining == 0:
+                    self._chunk_state = 'data_end'
+            else:
+                end = self.buffer.find(b'\r\n')
+                if end == -1:
+                    return
+                line = bytes(self.buffer[:end])
+                del self.buffer[:end + 2]
+                if self._chunk_state == 'size':
+                    self._remaining = int(line.split(b';', 1)[0], 16)
+                    self._chunk_state = 'data' if self._remaining else 'trailers'
+                elif self._chunk_state == 'data_end':
+                    # The CRLF after chunk data
+                    self._chunk_state = 'size'
+                else:
+                    # An empty line ends the trailers and the response
+                    self.done = not line
+
+
+class ReadTimer:
+    """Fails a response when no data arrived for ``timeout`` seconds.
+
+    Arrivals only move a timestamp; the timer callback reschedules itself
+    for the remainder, so data does not cost a timer per chunk.
+    """
+
+    def __init__(self, timeout: float, on_timeout):
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.loop = asyncio.get_running_loop()
+        self.last_data = self.loop.time()
+        self.handle = self.loop.call_at(self.last_data + timeout, self._check)
+
+    def _check(self):
+        deadline = self.last_data + self.timeout
+        if self.loop.time() >= deadline:
+            self.on_timeout(asyncio.TimeoutError(f"No response data for {self.timeout:g} s"))
+        else:
+            self.handle = self.loop.call_at(deadline, self._check)
+
+    def data_received(self):
+        self.last_data = self.loop.time()
+
+    def cancel(self):
+        self.handle.cancel()
+
+
+class _ConnectionProtocol(asyncio.Protocol):
+    """One keep-alive HTTP/1.1 connection, running one request at a time."""
+
+    def __init__(self, read_timeout: float = None):
+        self.transport = None
+        self.parser: Optional[HTTPResponseParser] = None
+        self.waiter: Optional[asyncio.Future] = None
+        self.closed = False
+        self.idle_since = time.monotonic()
+        self.read_timeout = read_timeout
+        self._read_timer: Optional[ReadTimer] = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data: bytes):
+        if self.parser is None:
+            return
+        if self._read_timer is not None:
+            self._read_timer.data_received()
+        try:
+            done = self.parser.feed(data)
+        except Exception as e:
+            self._finish(exception=e)
+            self.transport.close()
+            return
+        if done:
+            self._finish()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        if self.parser is not None and not self.parser.connection_lost():
+            self._finish(exception=exc or ConnectionResetError("Connection closed before the response completed"))
+        elif self.parser is not None:
+            self._finish()
+
+    def _timed_out(self, exception: Exception):
+        self._finish(exception=exception)
+        self.transport.close()
+
+    def _finish(self, exception: Exception = None):
+        if self._read_timer is not None:
+            self._read_timer.cancel()
+            self._read_timer = None
+        waiter, self.waiter = self.waiter, None
+        if waiter is not None and not waiter.done():
+            if exception is None:
+                waiter.set_result(self.parser)
+            else:
+                waiter.set_exception(exception)
+
+    def request(self, payload: bytes, parser: HTTPResponseParser) -> asyncio.Future:
+        self.parser = parser
+        self.waiter = asyncio.get_running_loop().create_future()
+        self.transport.write(payload)
+        if self.read_timeout:
+            self._read_timer = ReadTimer(self.read_timeout, self._timed_out)
+        return self.waiter
+
+
+class RawConnectionPool:
+    """Keep-alive connections per origin, bounded like ``aiohttp.TCPConnector``."""
+
+    def __init__(self, limit: int = 100, keepalive_timeout: float = 15, force_close: bool = False,
+                 connect_timeout: float = None, read_timeout: float = None):
+        self.keepalive_timeout = keepalive_timeout
+        self.force_close = force_close
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._limit = asyncio.Semaphore(limit) if limit else None
+        self._idle: Dict[Tuple[str, str, int], collections.deque] = collections.defaultdict(collections.deque)
+        self._ssl_context = None
+
+    async def __aenter__(self) -> 'RawConnectionPool':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for connections in self._idle.values():
+            for protocol in connections:
+                protocol.transport.close()
+        self._idle.clear()
+
+    async def acquire(self, origin: Tuple[str, str, int]) -> Tuple[_ConnectionProtocol, bool]:
+        """Return a connection to ``origin`` and whether it was reused."""
+        if self._limit:
+            await self._limit.acquire()
+        try:
+            idle = self._idle[origin]
+            now = time.monotonic()
+            while idle:
+                protocol = idle.pop()
+                if not protocol.closed and now - protocol.idle_since < self.keepalive_timeout:
+                    return protocol, True
+                protocol.transport.close()
+            return await self._connect(origin), False
+        except BaseException:
+            if self._limit:
+                self._limit.release()
+            raise
+
+    async def _connect(self, origin: Tuple[str, str, int]) -> _ConnectionProtocol:
+        scheme, host, port = origin
+        ssl_context = None
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        loop = asyncio.get_running_loop()
+        _, protocol = await asyncio.wait_for(
+            loop.create_connection(lambda: _ConnectionProtocol(self.read_timeout), host, port, ssl=ssl_context,
+                                   server_hostname=host if ssl_context else None),
+            self.connect_timeout)
+        return protocol
+
+    def release(self, origin: Tuple[str, str, int], protocol: _ConnectionProtocol, reusable: bool):
+        if reusable and not protocol.closed and not self.force_close:
+            protocol.parser = None
+            protocol.idle_since = time.monotonic()
+            self._idle[origin].append(protocol)
+        else:
+            protocol.transport.close()
+        if self._limit:
+            self._limit.release()
+
+
+class RawHTTPEngine(Engine):
+    """Low-overhead HTTP/1.1 engine built directly on ``asyncio.Protocol``.
+
+    Request bytes are serialized once per distinct request (the configured
+    request is serialized exactly once) and responses go through a minimal
+    parser that counts body bytes without building response objects. No
+    redirects, cookies, proxies, compression or phase tracing.
+    """
+
+    name = 'raw'
+
+    def create_session(self) -> RawConnectionPool:
+        tester = self.load_tester
+        return RawConnectionPool(limit=tester.connection_limit, keepalive_timeout=tester.keepalive_timeout,
+                                 force_close=tester.force_close, connect_timeout=tester.connect_timeout,
+                                 read_timeout=tester.read_timeout)
+
+    def _prepare(self, method: str, url: str, headers: Dict[str, str], data: Any) \
+            -> Tuple[Tuple[str, str, int], bytes]:
+        """Return the origin and the bytes of an HTTP/1.1 request."""
+        scheme, host, port, target, authority = split_url(url)
+        body = encode_body(data, self.name)
+
+        names = {name.lower() for name in headers}
+        lines = [f'{method} {target} HTTP/1.1']
+        if 'host' not in names:
+            lines.append(f'Host: {authority}')
+        if 'user-agent' not in names:
+            lines.append('User-Agent: http-load-tester')
+        if 'accept' not in names:
+            lines.append('Accept: */*')
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        if body is not None or method in ('POST', 'PUT', 'PATCH'):
+            lines.append(f'Content-Length: {len(body or b"")}')
+        if self.load_tester.force_close:
+            lines.append('Connection: close')
+        payload = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b'')
+        return (scheme, host, port), payload
+
+    async def send(self, session: RawConnectionPool, method: str, url: str, headers: Dict[str, str],
+                   data: Any, trace_marks: Dict[str, float] = None) -> Tuple[int, int]:
+        if self.load_tester.total_timeout:
+            return await asyncio.wait_for(self._send(session, method, url, headers, data),
+                                          self.load_tester.total_timeout)
+        return await self._send(session, method, url, headers, data)
+
+    async def _send(self, session: RawConnectionPool, method: str, url: str, headers: Dict[str, str],
+                    data: Any) -> Tuple[int, int]:
+        origin, payload = self.prepare(method, url, headers, data)
+        keep_body = self.load_tester.body_mode == 'full'
+        protocol, reused = await session.acquire(origin)
+        parser = HTTPResponseParser(method, keep_body)
+        try:
+            try:
+                await protocol.request(payload, parser)
+            except ConnectionError:
+                # The server may close an idle keep-alive connection just as
+                # it is reused; retry once on a new connection
+                if not reused or parser.status is not None:
+                    raise
+                session.release(origin, protocol, reusable=False)
+                protocol, _ = await session.acquire(origin)
+                parser = HTTPResponseParser(method, keep_body)
+                await protocol.request(payload, parser)
+        except BaseException:
+            session.release(origin, protocol, reusable=False)
+            raise
+        session.release(origin, protocol, reusable=parser.keep_alive)
+        if keep_body:
+            # Decode like the aiohttp engine's full mode does, so the modes cost the same
+            bytes(parser.body).decode(errors='replace')
+        return parser.status, parser.nbytes
+
+
+# HTTP/1.1 connection headers that are not allowed in HTTP/2
+H2_CONNECTION_HEADERS = ('connection', 'host', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'upgrade')
+
+
+class _H2Stream:
+    def __init__(self, keep_body: bool):
+        self.keep_body = keep_body
+        self.status = None
+        self.body = bytearray()
+        self.nbytes = 0
+        self.done = asyncio.get_running_loop().create_future()
+        self.read_timer: Optional[ReadTimer] = None
+
+
+class H2ConnectionStats:
+    """Stream concurrency seen by one HTTP/2 connection."""
+
+    def __init__(self):
+        self.streams = 0
+        self.max_concurrent_streams = 0
+        # Sum of the streams open as each stream started, for the mean
+        self._concurrency_sum = 0
+
+    def stream_opened(self, active: int):
+        self.streams += 1
+        self.max_concurrent_streams = max(self.max_concurrent_streams, active)
+        self._concurrency_sum += active
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'streams': self.streams,
+            'max_concurrent_streams': self.max_concurrent_streams,
+            'mean_concurrent_streams': self._concurrency_sum / self.streams if self.streams else 0,
+            'concurrency_sum': self._concurrency_sum
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> 'H2ConnectionStats':
+        stats = cls()
+        stats.streams = state['streams']
+        stats.max_concurrent_streams = state['max_concurrent_streams']
+        stats._concurrency_sum = state['concurrency_sum']
+        return stats
+
+
+class _H2Protocol(asyncio.Protocol):
+    """One HTTP/2 connection multiplexing many streams."""
+
+    def __init__(self, stats: H2ConnectionStats, read_timeout: float = None):
+        self.stats = stats
+        self.read_timeout = read_timeout
+        self.connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=True,
+                                                                             header_encoding=None))
+        self.transport = None
+        self.streams: Dict[int, _H2Stream] = {}
+        self.closed = False
+        # Set whenever streams close, flow-control windows open or settings change
+        self.changed = asyncio.Event()
+        # Resolved by the server's first SETTINGS frame, which carries its stream limit
+        self.settings_received = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.connection.initiate_connection()
+        self.transport.write(self.connection.data_to_send())
+
+    @property
+    def max_streams(self) -> int:
+        return self.connection.remote_settings.max_concurrent_streams
+
+    def data_received(self, data: bytes):
+        try:
+            events = self.connection.receive_data(data)
+        except Exception as e:
+            self._fail(e)
+            self.transport.close()
+            return
+        for event in events:
+            if isinstance(event, h2.events.ResponseReceived):
+                stream = self.streams.get(event.stream_id)
+                if stream is not None:
+                    stream.status = int(dict(event.headers)[b':status'])
+                    if stream.read_timer is not None:
+                        stream.read_timer.data_received()
+            elif isinstance(event, h2.events.DataReceived):
+                stream = self.streams.get(event.stream_id)
+                if stream is not None:
+                    stream.nbytes += len(event.data)
+                    if stream.keep_body:
+                        stream.body += event.data
+                    if stream.read_timer is not None:
+                        stream.read_timer.data_received()
+                self.connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                self._end_stream(event.stream_id)
+            elif isinstance(event, h2.events.StreamReset):
+                self._end_stream(event.stream_id, ConnectionResetError(
+                    f"Stream reset by the server (error code {event.error_code})"))
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self._fail(ConnectionResetError(f"Connection closed by the server (error code {event.error_code})"))
+                self.transport.close()
+            elif isinstance(event, h2.events.RemoteSettingsChanged):
+                if not self.settings_received.done():
+                    self.settings_received.set_result(None)
+                self.changed.set()
+            elif isinstance(event, h2.events.WindowUpdated):
+                self.changed.set()
+        self.flush()
+
+    def connection_lost(self, exc):
+        self._fail(exc or ConnectionResetError("Connection closed"))
+
+    def flush(self):
+        data = self.connection.data_to_send()
+        if data and not self.closed:
+            self.transport.write(data)
+
+    def _end_stream(self, stream_id: int, exception: Exception = None):
+        stream = self.streams.pop(stream_id, None)
+        if stream is not None and stream.read_timer is not None:
+            stream.read_timer.cancel()
+        if stream is not None and not stream.done.done():
+            if exception is None:
+                stream.done.set_result(None)
+            else:
+                stream.done.set_exception(exception)
+        self.changed.set()
+
+    def _abandon(self, stream_id: int, exception: Exception):
+        """Reset a stream the client gave up on (timed out or cancelled), keeping the connection."""
+        if stream_id not in self.streams:
+            return
+        self._end_stream(stream_id, exception)
+        if not self.closed:
+            with contextlib.suppress(h2.exceptions.ProtocolError):
+                self.connection.reset_stream(stream_id, h2.errors.ErrorCodes.CANCEL)
+            self.flush()
+
+    def _fail(self, exception: Exception):
+        self.closed = True
+        if not self.settings_received.done():
+            self.settings_received.set_exception(exception)
+        for stream_id in list(self.streams):
+            self._end_stream(stream_id, exception)
+
+    async def request(self, headers, body: Optional[bytes], keep_body: bool) -> _H2Stream:
+        if self.closed:
+            raise ConnectionResetError("Connection closed")
+        stream_id = self.connection.get_next_available_stream_id()
+        stream = self.streams[stream_id] = _H2Stream(keep_body)
+        self.stats.stream_opened(len(self.streams))
+        self.connection.send_headers(stream_id, headers, end_stream=not body)
+        self.flush()
+        try:
+            sent = 0
+            while body and sent < len(body):
+                window = min(self.connection.local_flow_control_window(stream_id),
+                             self.connection.max_outbound_frame_size)
+                if window <= 0:
+                    self.changed.clear()
+                    await self.changed.wait()
+                    if stream.done.done():
+                        break
+                    continue
+                chunk = body[sent:sent + window]
+                sent += len(chunk)
+                self.connection.send_data(stream_id, chunk, end_stream=sent == len(body))
+                self.flush()
+            if self.read_timeout and not stream.done.done():
+                stream.read_timer = ReadTimer(self.read_timeout,
+                                              lambda exception: self._abandon(stream_id, exception))
+            await stream.done
+        except asyncio.CancelledError:
+            self._abandon(stream_id, ConnectionResetError("Stream cancelled"))
+            raise
+        return stream
+
+
+class H2ConnectionPool:
+    """A fixed number of HTTP/2 connections per origin, streams spread over the least busy one."""
+
+    def __init__(self, connections: int = 1, max_streams: int = 100, all_stats: list = None,
+                 connect_timeout: float = None, read_timeout: float = None):
+        self.connections = connections
+        self.max_streams = max_streams
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.all_stats = all_stats if all_stats is not None else []
+        self._open: Dict[Tuple[str, str, int], list] = {}
+        self._lock = asyncio.Lock()
+        self._ssl_context = None
+
+    async def __aenter__(self) -> 'H2ConnectionPool':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for protocols in self._open.values():
+            for protocol in protocols:
+                protocol.connection.close_connection()
+                protocol.flush()
+                protocol.transport.close()
+        self._open.clear()
+
+    async def _connect(self, origin: Tuple[str, str, int]) -> _H2Protocol:
+        scheme, host, port = origin
+        ssl_context = None
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+                self._ssl_context.set_alpn_protocols(['h2'])
+            ssl_context = self._ssl_context
+        stats = H2ConnectionStats()
+        loop = asyncio.get_running_loop()
+
+        async def connect():
+            # Cleartext targets get HTTP/2 with prior knowledge (h2c), without an upgrade
+            _, protocol = await loop.create_connection(lambda: _H2Protocol(stats, self.read_timeout), host, port,
+                                                       ssl=ssl_context, server_hostname=host if ssl_context else None)
+            # Streams opened before the server's settings arrive could exceed its limit
+            try:
+                await protocol.settings_received
+            except BaseException:
+                protocol.transport.close()
+                raise
+            return protocol
+
+        # The connect timeout covers the handshake up to the server's settings
+        protocol = await asyncio.wait_for(connect(), self.connect_timeout)
+        # Only connections that got that far are reported
+        self.all_stats.append(stats)
+        return protocol
+
+    async def acquire(self, origin: Tuple[str, str, int]) -> _H2Protocol:
+        """Return the connection with the fewest open streams, waiting while all of them are full."""
+        while True:
+            protocols = self._open.get(origin)
+            if protocols is None or any(protocol.closed for protocol in protocols):
+                async with self._lock:
+                    protocols = [protocol for protocol in self._open.get(origin, []) if not protocol.closed]
+                    while len(protocols) < self.connections:
+                        protocols.append(await self._connect(origin))
+                    self._open[origin] = protocols
+            protocol = min(protocols, key=lambda protocol: len(protocol.streams))
+            if len(protocol.streams) < min(self.max_streams, protocol.max_streams):
+                return protocol
+            # Every connection is at its stream limit: wait for any stream to end
+            waits = [asyncio.ensure_future(protocol.changed.wait()) for protocol in protocols]
+            for protocol in protocols:
+                protocol.changed.clear()
+            try:
+                await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for wait in waits:
+                    wait.cancel()
+
+
+class H2Engine(Engine):
+    """HTTP/2 engine multiplexing streams over ``h2_connections`` connections per origin.
+
+    Needs the optional ``h2`` package. ``https`` targets negotiate HTTP/2
+    through ALPN; ``http`` targets speak cleartext HTTP/2 (h2c) with prior
+    knowledge. Each connection carries at most ``h2_max_streams``
+    concurrent streams (fewer if the server says so); new requests go to
+    the connection with the fewest open streams and wait when all are full.
+    The report gains ``h2_connections`` with the stream concurrency of every
+    connection.
+    """
+
+    name = 'h2'
+
+    def __init__(self, load_tester):
+        if h2 is None:
+            raise ValueError("The h2 engine needs the h2 package (pip install h2)")
+        super().__init__(load_tester)
+        self.connection_stats: List[H2ConnectionStats] = []
+
+    def create_session(self) -> H2ConnectionPool:
+        tester = self.load_tester
+        return H2ConnectionPool(connections=tester.h2_connections, max_streams=tester.h2_max_streams,
+                                all_stats=self.connection_stats, connect_timeout=tester.connect_timeout,
+                                read_timeout=tester.read_timeout)
+
+    def _prepare(self, method: str, url: str, headers: Dict[str, str], data: Any):
+        """Return the origin, the HTTP/2 header list and the body of a request."""
+        scheme, host, port, target, authority = split_url(url)
+        body = encode_body(data, self.name)
+        h2_headers = [(':method', method), (':scheme', scheme), (':authority', authority), (':path', target)]
+        names = {name.lower() for name in headers}
+        if 'user-agent' not in names:
+            h2_headers.append(('user-agent', 'http-load-tester'))
+        if 'accept' not in names:
+            h2_headers.append(('accept', '*/*'))
+        h2_headers.extend((name.lower(), value) for name, value in headers.items()
+                          if name.lower() not in H2_CONNECTION_HEADERS)
+        if body is not None:
+            h2_headers.append(('content-length', str(len(body))))
+        return (scheme, host, port), h2_headers, body
+
+    async def send(self, session: H2ConnectionPool, method: str, url: str, headers: Dict[str, str],
+                   data: Any, trace_marks: Dict[str, float] = None) -> Tuple[int, int]:
+        if self.load_tester.total_timeout:
+            return await asyncio.wait_for(self._send(session, method, url, headers, data),
+                                          self.load_tester.total_timeout)
+        return await self._send(session, method, url, headers, data)
+
+    async def _send(self, session: H2ConnectionPool, method: str, url: str, headers: Dict[str, str],
+                    data: Any) -> Tuple[int, int]:
+        origin, h2_headers, body = self.prepare(method, url, headers, data)
+        keep_body = self.load_tester.body_mode == 'full'
+        protocol = await session.acquire(origin)
+        stream = await protocol.request(h2_headers, body, keep_body)
+        if keep_body:
+            # Decode like the aiohttp engine's full mode does, so the modes cost the same
+            bytes(stream.body).decode(errors='replace')
+        return stream.status, stream.nbytes
+
+    def report(self) -> Dict[str, Any]:
+        connections = [stats.to_dict() for stats in self.connection_stats]
+        for connection in connections:
+            del connection['concurrency_sum']
+        return {'h2_connections': connections}
+
+    def export_state(self) -> Any:
+        return [stats.to_dict() for stats in self.connection_stats]
+
+    def merge_state(self, state: Any):
+        self.connection_stats.extend(H2ConnectionStats.from_dict(stats) for stats in state or [])
+
+
+# Engines selectable by name
+ENGINES = {engine.name: engine for engine in (AiohttpEngine, RawHTTPEngine, H2Engine)}
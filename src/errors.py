@@ -0,0 +1,110 @@
+import asyncio
+import errno
+import logging
+import socket
+import ssl
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger('http_load_tester.errors')
+
+# Classes every failed request is counted under, in the order they are checked
+ERROR_CLASSES = ('timeout', 'tls', 'dns', 'connection_refused', 'connection_reset', 'payload', 'other')
+
+# Distinct messages kept per error class, and how often each class may be logged
+ERROR_SAMPLES = 5
+ERROR_LOG_INTERVAL = 1.0
+
+_TIMEOUT_ERRORS = (asyncio.TimeoutError, TimeoutError, socket.timeout)
+_TLS_ERRORS = (ssl.SSLError, ssl.CertificateError, aiohttp.ClientSSLError)
+_DNS_ERRORS = (socket.gaierror,) + ((aiohttp.ClientConnectorDNSError,)
+                                   if hasattr(aiohttp, 'ClientConnectorDNSError') else ())
+_RESET_ERRORS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, aiohttp.ServerDisconnectedError,
+                 asyncio.IncompleteReadError)
+_PAYLOAD_ERRORS = (aiohttp.ClientPayloadError, aiohttp.ClientResponseError)
+_RESET_ERRNOS = (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE)
+
+
+def _classify_one(exception: BaseException) -> str:
+    if isinstance(exception, _TIMEOUT_ERRORS):
+        return 'timeout'
+    if isinstance(exception, _TLS_ERRORS):
+        return 'tls'
+    if isinstance(exception, _DNS_ERRORS):
+        return 'dns'
+    if isinstance(exception, ConnectionRefusedError) or getattr(exception, 'errno', None) == errno.ECONNREFUSED:
+        return 'connection_refused'
+    if isinstance(exception, _RESET_ERRORS) or getattr(exception, 'errno', None) in _RESET_ERRNOS:
+        return 'connection_reset'
+    if isinstance(exception, _PAYLOAD_ERRORS) or type(exception).__module__.startswith('h2.'):
+        return 'payload'
+    # The raw engine's parser fails with a ValueError on malformed responses;
+    # a bad URL is a configuration problem, not a response one
+    if isinstance(exception, ValueError) and not isinstance(exception, aiohttp.InvalidURL):
+        return 'payload'
+    return 'other'
+
+
+def classify_error(exception: BaseException) -> str:
+    """Return the ERROR_CLASSES entry a request failure belongs to.
+
+    Wrapped causes are checked too, so e.g. an aiohttp connector error
+    around a refused connection counts as ``connection_refused``.
+    """
+    for candidate in (exception, getattr(exception, 'os_error', None), exception.__cause__,
+                      exception.__context__):
+        if candidate is not None:
+            error_class = _classify_one(candidate)
+            if error_class != 'other':
+                return error_class
+    return 'other'
+
+
+class ErrorLog:
+    """Sampled messages and rate-limited logging of request failures.
+
+    The first ``samples`` distinct messages of every error class are kept
+    for the report. Each class is logged at most once per ``log_interval``
+    seconds, with the number of failures skipped since, so a target
+    failing thousands of times a second costs a counter increment per
+    failure instead of a line of console output.
+    """
+
+    def __init__(self, samples: int = ERROR_SAMPLES, log_interval: float = ERROR_LOG_INTERVAL):
+        self.samples_per_class = samples
+        self.log_interval = log_interval
+        self.samples: Dict[str, List[str]] = {}
+        self._next_log: Dict[str, float] = {}
+        self._suppressed = Counter()
+
+    def record(self, error_class: str, exception: BaseException):
+        samples = self.samples.setdefault(error_class, [])
+        now = time.monotonic()
+        log_due = now >= self._next_log.get(error_class, 0)
+        if len(samples) >= self.samples_per_class and not log_due:
+            self._suppressed[error_class] += 1
+            return
+
+        message = f'{type(exception).__name__}: {exception}'
+        if len(samples) < self.samples_per_class and message not in samples:
+            samples.append(message)
+        if log_due:
+            suppressed = self._suppressed.pop(error_class, 0)
+            logger.warning('Request failed (%s): %s%s', error_class, message,
+                           f' ({suppressed} more since the last message)' if suppressed else '')
+            self._next_log[error_class] = now + self.log_interval
+        else:
+            self._suppressed[error_class] += 1
+
+    def export_state(self) -> Dict[str, List[str]]:
+        return {error_class: list(samples) for error_class, samples in self.samples.items()}
+
+    def merge_state(self, state: Optional[Dict[str, Any]]):
+        for error_class, samples in (state or {}).items():
+            merged = self.samples.setdefault(error_class, [])
+            for message in samples:
+                if len(merged) < self.samples_per_class and message not in merged:
+                    merged.append(message)
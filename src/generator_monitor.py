@@ -0,0 +1,150 @@
+import asyncio
+import time
+from typing import Any, Dict, List
+
+try:
+    from .histogram import LatencyHistogram
+except ImportError:
+    from histogram import LatencyHistogram
+
+# How often the monitor wakes up to measure event-loop lag and sample the in-flight count
+MONITOR_INTERVAL = 0.05
+
+# A run is flagged as generator-bound when the p99 event-loop lag or send
+# drift goes past these, or the process uses this much of a CPU core
+LOOP_LAG_THRESHOLD_MS = 20
+SEND_DRIFT_THRESHOLD_MS = 20
+CPU_THRESHOLD_PERCENT = 90
+
+
+class GeneratorMonitor:
+    """Self-instrumentation of the load generator.
+
+    Tracks event-loop lag (how late a periodic wake-up fires), send drift
+    (how late each scheduled send started), requests in flight against the
+    ``concurrency`` limit and the process CPU usage, overall and per live
+    metrics window. When the generator is the bottleneck these go up
+    before the target's latency does, so a run that exceeds the
+    thresholds is flagged as generator-bound rather than blamed on the
+    target.
+    """
+
+    def __init__(self, concurrency: int, significant_digits: int = 3):
+        self.concurrency = concurrency
+        self.loop_lag = LatencyHistogram(significant_digits)
+        self.send_drift = LatencyHistogram(significant_digits)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # In-flight counts sampled every MONITOR_INTERVAL, for the mean
+        self._in_flight_sum = 0
+        self._in_flight_samples = 0
+        self.cpu_seconds = 0.0
+        self.cpu_percent = 0.0
+        self._cpu_start = None
+        self._wall_start = None
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_lag = 0.0
+        self._window_drift = 0.0
+        self._window_in_flight = self.in_flight
+        self._window_cpu = time.process_time()
+
+    def start(self):
+        self._cpu_start = time.process_time()
+        self._wall_start = time.monotonic()
+        self._reset_window()
+
+    def stop(self):
+        if self._cpu_start is None:
+            return
+        self.cpu_seconds = time.process_time() - self._cpu_start
+        wall_seconds = time.monotonic() - self._wall_start
+        self.cpu_percent = self.cpu_seconds / wall_seconds * 100 if wall_seconds > 0 else 0
+        self._cpu_start = None
+
+    async def run(self):
+        """Measure event-loop lag and sample the in-flight count until cancelled."""
+        while True:
+            expected = time.monotonic() + MONITOR_INTERVAL
+            await asyncio.sleep(MONITOR_INTERVAL)
+            lag = max(0.0, (time.monotonic() - expected) * 1000)
+            self.loop_lag.record(lag)
+            self._window_lag = max(self._window_lag, lag)
+            self._in_flight_sum += self.in_flight
+            self._in_flight_samples += 1
+
+    def request_started(self, drift_ms: float = None):
+        """Count a request going out; ``drift_ms`` is how late it is against its schedule."""
+        if drift_ms is not None:
+            self.send_drift.record(max(0.0, drift_ms))
+            self._window_drift = max(self._window_drift, drift_ms)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self._window_in_flight = max(self._window_in_flight, self.in_flight)
+
+    def request_finished(self):
+        self.in_flight -= 1
+
+    def close_window(self, duration: float) -> Dict[str, Any]:
+        """Return the live metrics of the window that just ended and start a new one."""
+        cpu = time.process_time() - self._window_cpu
+        summary = {
+            'event_loop_lag_ms': self._window_lag,
+            'send_drift_ms': self._window_drift,
+            'max_in_flight': self._window_in_flight,
+            'cpu_percent': cpu / duration * 100 if duration > 0 else 0
+        }
+        self._reset_window()
+        return summary
+
+    def bound_reasons(self, dropped_sends: int = 0) -> List[str]:
+        """Return which thresholds the run exceeded; any means it was generator-bound."""
+        reasons = []
+        if self.loop_lag.percentile(99) > LOOP_LAG_THRESHOLD_MS:
+            reasons.append('event_loop_lag')
+        if self.send_drift.percentile(99) > SEND_DRIFT_THRESHOLD_MS:
+            reasons.append('send_drift')
+        if self.cpu_percent >= CPU_THRESHOLD_PERCENT:
+            reasons.append('cpu')
+        # Scheduled sends were skipped because the generator's own in-flight limit was reached
+        if dropped_sends:
+            reasons.append('concurrency_limit')
+        return reasons
+
+    def export_state(self) -> Dict[str, Any]:
+        return {
+            'loop_lag': self.loop_lag.to_dict(),
+            'send_drift': self.send_drift.to_dict(),
+            'max_in_flight': self.max_in_flight,
+            'in_flight_sum': self._in_flight_sum,
+            'in_flight_samples': self._in_flight_samples,
+            'cpu_seconds': self.cpu_seconds,
+            'cpu_percent': self.cpu_percent
+        }
+
+    def merge_state(self, state: Dict[str, Any]):
+        """Fold in another process's measurements; CPU usage is per process, so the busiest one counts."""
+        self.loop_lag.merge(LatencyHistogram.from_dict(state['loop_lag']))
+        self.send_drift.merge(LatencyHistogram.from_dict(state['send_drift']))
+        self.max_in_flight = max(self.max_in_flight, state['max_in_flight'])
+        self._in_flight_sum += state['in_flight_sum']
+        self._in_flight_samples += state['in_flight_samples']
+        self.cpu_seconds += state['cpu_seconds']
+        self.cpu_percent = max(self.cpu_percent, state['cpu_percent'])
+
+    def report(self, dropped_sends: int = 0) -> Dict[str, Any]:
+        reasons = self.bound_reasons(dropped_sends)
+        return {
+            'event_loop_lag': self.loop_lag.summary(),
+            'send_drift': self.send_drift.summary(),
+            'in_flight': {
+                'max': self.max_in_flight,
+                'mean': self._in_flight_sum / self._in_flight_samples if self._in_flight_samples else 0,
+                'limit': self.concurrency
+            },
+            'cpu_seconds': self.cpu_seconds,
+            'cpu_percent': self.cpu_percent,
+            'bound': bool(reasons),
+            'bound_reasons': reasons
+        }
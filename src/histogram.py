@@ -0,0 +1,224 @@
+import base64
+import functools
+import math
+import zlib
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def _value_ranges(counts_length: int, sub_bucket_half_count_magnitude: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the lowest and highest raw value represented by every counter, for vectorized reads."""
+    sub_bucket_half_count = 1 << sub_bucket_half_count_magnitude
+    indices = np.arange(counts_length)
+    bucket_indices = np.maximum((indices >> sub_bucket_half_count_magnitude) - 1, 0)
+    sub_bucket_indices = np.where(
+        indices < sub_bucket_half_count,
+        indices,
+        (indices & (sub_bucket_half_count - 1)) + sub_bucket_half_count
+    )
+    lowest_values = sub_bucket_indices << bucket_indices
+    highest_values = lowest_values + (1 << bucket_indices) - 1
+    lowest_values.setflags(write=False)
+    highest_values.setflags(write=False)
+    return lowest_values, highest_values
+
+
+class LatencyHistogram:
+    """Constant-memory log-linear latency recorder (HdrHistogram layout).
+
+    Values are recorded in milliseconds and stored as integer multiples of
+    ``resolution_ms`` in an array of counters. Every power-of-two range is
+    split into enough linear sub-buckets to keep ``significant_digits`` of
+    precision, so memory depends only on the configured range, never on the
+    number of samples. Recording is O(1); percentiles come from one
+    cumulative pass over the counters.
+    """
+
+    def __init__(self, significant_digits: int = 3, highest_trackable_ms: float = 3_600_000,
+                 resolution_ms: float = 0.001):
+        if not 1 <= significant_digits <= 5:
+            raise ValueError("significant_digits must be between 1 and 5")
+        self.significant_digits = significant_digits
+        self.highest_trackable_ms = highest_trackable_ms
+        self.resolution_ms = resolution_ms
+
+        self._scale = 1 / resolution_ms
+        self._highest_value = int(math.ceil(highest_trackable_ms * self._scale))
+        sub_bucket_count_magnitude = int(math.ceil(math.log2(2 * 10 ** significant_digits)))
+        self._sub_bucket_half_count_magnitude = sub_bucket_count_magnitude - 1
+        self._sub_bucket_half_count = 1 << self._sub_bucket_half_count_magnitude
+        self._sub_bucket_mask = (1 << sub_bucket_count_magnitude) - 1
+
+        bucket_count = 1
+        smallest_untrackable = 1 << sub_bucket_count_magnitude
+        while smallest_untrackable <= self._highest_value:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self.counts = np.zeros((bucket_count + 1) * self._sub_bucket_half_count, dtype=np.int64)
+        # Shared by every histogram with the same layout
+        self._lowest_values, self._highest_values = _value_ranges(len(self.counts),
+                                                                  self._sub_bucket_half_count_magnitude)
+
+        self.reset()
+
+    def reset(self):
+        self.counts[:] = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _counts_index(self, value_ms: float) -> int:
+        value = int(value_ms * self._scale + 0.5)
+        if value < 0:
+            value = 0
+        elif value > self._highest_value:
+            value = self._highest_value
+        bucket_index = (value | self._sub_bucket_mask).bit_length() - self._sub_bucket_half_count_magnitude - 1
+        return ((bucket_index + 1) << self._sub_bucket_half_count_magnitude) + \
+            (value >> bucket_index) - self._sub_bucket_half_count
+
+    def record(self, value_ms: float, count: int = 1):
+        self.counts[self._counts_index(value_ms)] += count
+        self.count += count
+        self.total += value_ms * count
+        if value_ms < self.min:
+            self.min = value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def _check_compatible(self, other: 'LatencyHistogram'):
+        if (other.significant_digits, other.highest_trackable_ms, other.resolution_ms) != \
+                (self.significant_digits, self.highest_trackable_ms, self.resolution_ms):
+            raise ValueError("Cannot merge histograms with different layouts")
+
+    def merge(self, other: 'LatencyHistogram') -> 'LatencyHistogram':
+        """Add the samples of ``other`` (e.g. from another worker) to this histogram."""
+        self._check_compatible(other)
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def copy(self) -> 'LatencyHistogram':
+        return LatencyHistogram.from_dict(self.to_dict())
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def percentiles(self, percentiles: Iterable[float]) -> List[float]:
+        """Return the value at or below which each percentile of samples falls.
+
+        Values are the highest value equivalent to the matching bucket,
+        clamped to the exact recorded min and max.
+        """
+        percentiles = list(percentiles)
+        if not self.count:
+            return [0] * len(percentiles)
+        ranks = np.maximum(np.ceil(np.asarray(percentiles, dtype=float) / 100 * self.count), 1)
+        indices = np.searchsorted(np.cumsum(self.counts), ranks)
+        values = (self._highest_values[indices] + 1) / self._scale
+        return [float(v) for v in np.clip(values, self.min, self.max)]
+
+    def percentile(self, percentile: float) -> float:
+        return self.percentiles([percentile])[0]
+
+    def summary(self) -> Dict[str, float]:
+        """Return count, mean, min, max and the usual percentiles."""
+        p50, p90, p95, p99 = self.percentiles([50, 90, 95, 99])
+        return {
+            'count': self.count,
+            'avg': self.mean,
+            'min': self.min if self.count else 0,
+            'max': self.max if self.count else 0,
+            'p50': p50,
+            'p90': p90,
+            'p95': p95,
+            'p99': p99
+        }
+
+    def buckets(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the lowest value (ms) and count of every non-empty bucket."""
+        nonzero = np.nonzero(self.counts)[0]
+        return self._lowest_values[nonzero] / self._scale, self.counts[nonzero]
+
+    def cumulative_counts(self, bounds_ms: Iterable[float]) -> List[int]:
+        """Return the number of values at or below every bound, and then the total, like Prometheus buckets.
+
+        Read off the counters in one cumulative pass, so nothing has to be
+        recorded per bound; a counter straddling a bound is counted below
+        it, which is exact to the histogram's precision.
+        """
+        cumulative = np.cumsum(self.counts)
+        bounds = np.floor(np.asarray(list(bounds_ms), dtype=float) * self._scale + 0.5)
+        ends = np.searchsorted(self._lowest_values, bounds, side='right')
+        return [int(cumulative[end - 1]) if end else 0 for end in ends] + [int(cumulative[-1])]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to a JSON-friendly dict with zlib-compressed counters."""
+        return {
+            'significant_digits': self.significant_digits,
+            'highest_trackable_ms': self.highest_trackable_ms,
+            'resolution_ms': self.resolution_ms,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'counts': base64.b64encode(zlib.compress(self.counts.tobytes())).decode('ascii')
+        }
+
+    def ks_test(self, other: 'LatencyHistogram') -> Tuple[float, float]:
+        """Two-sample Kolmogorov-Smirnov test between this histogram's samples and ``other``'s.
+
+        Returns the statistic (the largest distance between the two
+        cumulative distributions, compared bucket by bucket) and its
+        asymptotic p-value: the probability of a distance at least that
+        large if both runs sampled the same latency distribution.
+        """
+        self._check_compatible(other)
+        if not self.count or not other.count:
+            return 0.0, 1.0
+        distance = np.abs(np.cumsum(self.counts) / self.count - np.cumsum(other.counts) / other.count)
+        statistic = float(distance.max())
+        return statistic, ks_p_value(statistic, self.count, other.count)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        histogram = cls(data['significant_digits'], data['highest_trackable_ms'], data['resolution_ms'])
+        counts = np.frombuffer(zlib.decompress(base64.b64decode(data['counts'])), dtype=np.int64)
+        if len(counts) != len(histogram.counts):
+            raise ValueError("Serialized histogram does not match its layout")
+        histogram.counts[:] = counts
+        histogram.count = data['count']
+        histogram.total = data['total']
+        if data['count']:
+            histogram.min = data['min']
+            histogram.max = data['max']
+        return histogram
+
+
+def ks_p_value(statistic: float, n1: int, n2: int) -> float:
+    """Asymptotic p-value of a two-sample Kolmogorov-Smirnov statistic.
+
+    Sums the alternating series of the Kolmogorov distribution, with
+    Stephens' small-sample correction; the series only converges poorly
+    for tiny distances, where the answer is 1 anyway.
+    """
+    effective_n = math.sqrt(n1 * n2 / (n1 + n2))
+    lam = (effective_n + 0.12 + 0.11 / effective_n) * statistic
+    total = 0.0
+    previous_term = 0.0
+    sign = 2.0
+    for j in range(1, 101):
+        term = sign * math.exp(-2 * j * j * lam * lam)
+        total += term
+        if abs(term) <= 0.001 * previous_term or abs(term) <= 1e-8 * total:
+            return min(max(total, 0.0), 1.0)
+        sign = -sign
+        previous_term = abs(term)
+    return 1.0
@@ -1,93 +1,883 @@
 import argparse
 import asyncio
 import aiohttp
+import concurrent.futures
+import contextlib
+import itertools
+import math
+import random
 import time
-import statistics
-from collections import Counter
-from typing import List, Dict, Any
+from collections import Counter, deque
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 import json
+import multiprocessing
 import matplotlib.pyplot as plt
-import numpy as np
 import os
+import queue
+import threading
 import matplotlib
 matplotlib.use('Agg')
 
+try:
+    from .engines import ENGINES
+    from .errors import ERROR_CLASSES, ErrorLog, classify_error
+    from .generator_monitor import GeneratorMonitor
+    from .histogram import LatencyHistogram
+    from .load_profile import LoadProfile
+    from .request_sources import PreparedRequest, RequestCorpus
+    from .sample_log import SampleLog
+    from .scenario import Scenario
+    from .timeseries import STATUS_CLASSES, TimeSeries, bucket_percentiles
+except ImportError:
+    from engines import ENGINES
+    from errors import ERROR_CLASSES, ErrorLog, classify_error
+    from generator_monitor import GeneratorMonitor
+    from histogram import LatencyHistogram
+    from load_profile import LoadProfile
+    from request_sources import PreparedRequest, RequestCorpus
+    from sample_log import SampleLog
+    from scenario import Scenario
+    from timeseries import STATUS_CLASSES, TimeSeries, bucket_percentiles
+
+# Inter-arrival distributions supported by the open-loop scheduler
+ARRIVAL_DISTRIBUTIONS = ('constant', 'poisson', 'uniform')
+
+# Open loop sends on a rate-driven schedule; closed loop runs ``concurrency``
+# virtual users that each wait for their response (and think) before sending again
+LOAD_MODES = ('open', 'closed')
+THINK_TIME_DISTRIBUTIONS = ('fixed', 'exponential')
+
+# How response bodies are consumed: streamed and discarded, or fully read and
+# decoded (for validating responses only, it costs CPU and memory per request)
+BODY_MODES = ('stream', 'full')
+
+# How long run_workers waits for worker processes to start up or to report back
+WORKER_STARTUP_TIMEOUT = 60
+
+# Longest the scheduler sleeps before re-checking for a stop request
+STOP_POLL_INTERVAL = 0.1
+
+# Live metrics: window length and how many closed windows are kept
+WINDOW_INTERVAL = 1.0
+MAX_WINDOWS = 3600
+
+# Request phases timed through aiohttp tracing, in the order they happen
+REQUEST_PHASES = ('dns', 'connection_acquire', 'connect', 'ttfb', 'body')
+
+# A send that starts this long after its scheduled time is counted as late
+LATE_SEND_THRESHOLD_MS = 10
+
+# Seconds requests still in flight when sending ends get to complete before they are cancelled
+DRAIN_TIMEOUT = 30
+
+
+class MetricsWindow:
+    """One live-metrics interval, read off the run's ``TimeSeries``.
+
+    Requests are only recorded in the time series: the window keeps its
+    totals at the start of the interval, and the interval's counters and
+    coarse latency histogram are whatever has been added since.
+    """
+
+    def __init__(self, timeseries: TimeSeries, start: float):
+        self.timeseries = timeseries
+        self.reset(start)
+
+    def reset(self, start: float):
+        self.start = start
+        self._totals = self.timeseries.totals()
+
+    @property
+    def requests(self) -> int:
+        return int(self.timeseries.totals()['requests'] - self._totals['requests'])
+
+    def summary(self, index: int, test_start: float, end: float) -> Dict[str, Any]:
+        totals = self.timeseries.totals()
+        window = {name: total - self._totals[name] for name, total in totals.items()}
+        requests = int(window['requests'])
+        duration = end - self.start
+        p50, p90, p99 = bucket_percentiles(window['latency'].reshape(1, -1), [50, 90, 99])[0]
+        return {
+            'index': index,
+            'start': self.start - test_start,
+            'duration': duration,
+            'requests': requests,
+            'qps': requests / duration if duration > 0 else 0,
+            'errors': int(window['errors']),
+            'error_classes': {name: int(count) for name, count in zip(ERROR_CLASSES, window['error_classes'])
+                              if count},
+            'bytes_received': int(window['bytes_received']),
+            'status_classes': {name: int(count) for name, count in zip(STATUS_CLASSES, window['status_classes'])
+                               if count},
+            'p50_latency': float(p50),
+            'p90_latency': float(p90),
+            'p99_latency': float(p99)
+        }
+
+
+class PhaseTimings:
+    """Per-phase request timing collected through ``aiohttp.TraceConfig``.
+
+    Each traced request carries a dict of trace signal timestamps; once the
+    body has been read they are turned into one sample per phase. aiohttp
+    does not signal the end of the TCP handshake on its own, so for HTTPS
+    the ``connect`` phase includes the TLS handshake.
+    """
+
+    SIGNALS = ('dns_resolvehost_start', 'dns_resolvehost_end',
+               'connection_queued_start', 'connection_queued_end',
+               'connection_create_start', 'connection_create_end',
+               'request_headers_sent', 'request_end')
+
+    def __init__(self, significant_digits: int = 3):
+        self.histograms = {phase: LatencyHistogram(significant_digits) for phase in REQUEST_PHASES}
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        for signal in self.SIGNALS:
+            getattr(trace_config, f'on_{signal}').append(self._timestamp_handler(signal))
+        return trace_config
+
+    @staticmethod
+    def _timestamp_handler(signal: str):
+        async def handler(session, trace_config_ctx, params):
+            # Warm-up requests are sent without a context and are not timed
+            if trace_config_ctx.trace_request_ctx is not None:
+                trace_config_ctx.trace_request_ctx[signal] = time.monotonic()
+        return handler
+
+    def record(self, marks: Dict[str, float], end_time: float):
+        """Record the phases of one request from its trace timestamps."""
+        def span(start, end):
+            if start in marks and end in marks:
+                return (marks[end] - marks[start]) * 1000
+            return None
+
+        # Connection creation resolves the host first, so take DNS out of connect
+        dns = span('dns_resolvehost_start', 'dns_resolvehost_end')
+        connect = span('connection_create_start', 'connection_create_end')
+        if connect is not None and dns is not None:
+            connect -= dns
+        body = (end_time - marks['request_end']) * 1000 if 'request_end' in marks else None
+        phases = {
+            'dns': dns,
+            'connection_acquire': span('connection_queued_start', 'connection_queued_end'),
+            'connect': connect,
+            'ttfb': span('request_headers_sent', 'request_end'),
+            'body': body
+        }
+        for phase, value in phases.items():
+            if value is not None:
+                self.histograms[phase].record(value)
+
+        if 'connection_create_end' in marks:
+            self.new_connections += 1
+        elif 'request_headers_sent' in marks:
+            self.reused_connections += 1
+
+    def export_state(self) -> Dict[str, Any]:
+        return {
+            'histograms': {phase: histogram.to_dict() for phase, histogram in self.histograms.items()},
+            'new_connections': self.new_connections,
+            'reused_connections': self.reused_connections
+        }
+
+    def merge_state(self, state: Dict[str, Any]):
+        for phase, histogram in state['histograms'].items():
+            self.histograms[phase].merge(LatencyHistogram.from_dict(histogram))
+        self.new_connections += state['new_connections']
+        self.reused_connections += state['reused_connections']
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'phases': {phase: histogram.summary() for phase, histogram in self.histograms.items()},
+            'new_connections': self.new_connections,
+            'reused_connections': self.reused_connections
+        }
+
+
+class BreakdownStats:
+    """Latency, status and error counts for one slice of a test, e.g. a load profile stage."""
+
+    def __init__(self, significant_digits: int = 3):
+        self.latency_histogram = LatencyHistogram(significant_digits)
+        self.status_codes = Counter()
+        self.error_count = 0
+
+    def record_result(self, latency: float, status: int):
+        self.latency_histogram.record(latency)
+        self.status_codes[status] += 1
+
+    def record_error(self):
+        self.error_count += 1
+
+    def export_state(self) -> Dict[str, Any]:
+        return {
+            'latency_histogram': self.latency_histogram.to_dict(),
+            'status_codes': dict(self.status_codes),
+            'error_count': self.error_count
+        }
+
+    def merge_state(self, state: Dict[str, Any]):
+        self.latency_histogram.merge(LatencyHistogram.from_dict(state['latency_histogram']))
+        self.status_codes.update({int(code): count for code, count in state['status_codes'].items()})
+        self.error_count += state['error_count']
+
+    def report(self, duration: float = None) -> Dict[str, Any]:
+        total_requests = self.latency_histogram.count + self.error_count
+        return {
+            'total_requests': total_requests,
+            'achieved_qps': total_requests / duration if duration else 0,
+            'error_rate': self.error_count / total_requests if total_requests else 0,
+            'latency': self.latency_histogram.summary(),
+            'status_codes': dict(self.status_codes)
+        }
+
+
 class HTTPLoadTester:
     def __init__(self, url: str, qps: int, duration: int = 60,
                  method: str = 'GET', headers: Dict[str, str] = None,
-                 data: Any = None, concurrency: int = 100):
+                 data: Any = None, concurrency: int = 100,
+                 arrival: str = 'constant', significant_digits: int = 3,
+                 start_at: float = None, trace_phases: bool = False,
+                 connection_limit: int = 100, connection_limit_per_host: int = 0,
+                 keepalive_timeout: float = 15, dns_cache_ttl: int = 10,
+                 force_close: bool = False, warmup_connections: int = 0,
+                 body_mode: str = 'stream', load_profile: List[Dict[str, Any]] = None,
+                 mode: str = 'open', think_time: float = 0, think_time_distribution: str = 'fixed',
+                 requests_file: str = None, requests_loop: bool = False, requests_shuffle: bool = False,
+                 replay_timestamps: bool = False, replay_speed: float = 1.0, requests_shard: List[int] = None,
+                 scenario: Dict[str, Any] = None, engine: str = 'aiohttp', h2_connections: int = 1,
+                 h2_max_streams: int = 100, connect_timeout: float = None, read_timeout: float = None,
+                 total_timeout: float = None, drain_timeout: Optional[float] = DRAIN_TIMEOUT,
+                 sample_log: str = None):
+        if arrival not in ARRIVAL_DISTRIBUTIONS:
+            raise ValueError(f"Unknown arrival distribution: {arrival!r} "
+                             f"(expected one of {', '.join(ARRIVAL_DISTRIBUTIONS)})")
+        if mode not in LOAD_MODES:
+            raise ValueError(f"Unknown load mode: {mode!r} (expected one of {', '.join(LOAD_MODES)})")
+        if think_time_distribution not in THINK_TIME_DISTRIBUTIONS:
+            raise ValueError(f"Unknown think time distribution: {think_time_distribution!r} "
+                             f"(expected one of {', '.join(THINK_TIME_DISTRIBUTIONS)})")
+        if mode == 'closed' and load_profile:
+            raise ValueError("Load profiles set a request rate and need the open-loop mode")
+        if requests_file and scenario:
+            raise ValueError("Replay a requests file or run a scenario, not both")
+        if replay_timestamps and (mode == 'closed' or load_profile):
+            raise ValueError("Timestamp replay sets its own schedule and needs the open-loop mode without a profile")
+        if body_mode not in BODY_MODES:
+            raise ValueError(f"Unknown body mode: {body_mode!r} (expected one of {', '.join(BODY_MODES)})")
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine!r} (expected one of {', '.join(ENGINES)})")
+        if trace_phases and not ENGINES[engine].supports_tracing:
+            raise ValueError(f"The {engine} engine does not support phase tracing")
+        if h2_connections < 1 or h2_max_streams < 1:
+            raise ValueError("h2_connections and h2_max_streams must be at least 1")
+        if any(timeout is not None and timeout < 0
+               for timeout in (connect_timeout, read_timeout, total_timeout, drain_timeout)):
+            raise ValueError("Timeouts cannot be negative")
         self.url = url
-        self.qps = qps
-        self.duration = duration
+        # A load profile replaces the fixed rate; qps then reports its mean rate
+        if load_profile:
+            self.load_profile = LoadProfile(load_profile)
+            self.qps = self.load_profile.mean_rate
+            self.duration = self.load_profile.duration
+        else:
+            # Closed-loop tests have no rate
+            self.load_profile = LoadProfile.constant(qps or 0, duration)
+            self.qps = qps
+            self.duration = duration
         self.method = method
         self.headers = headers or {}
         self.data = data
         self.concurrency = concurrency
-        self.results: List[Dict[str, Any]] = []
+        self.arrival = arrival
+        self.body_mode = body_mode
+        self.mode = mode
+        # Mean pause in seconds between a virtual user's response and its next request
+        self.think_time = think_time
+        self.think_time_distribution = think_time_distribution
+        # Requests replayed from a JSONL corpus instead of the single url/method/headers/data
+        self.corpus = RequestCorpus(requests_file, base_url=url, loop=requests_loop, shuffle=requests_shuffle,
+                                    replay_timestamps=replay_timestamps, replay_speed=replay_speed,
+                                    shard=requests_shard) if requests_file else None
+        # Weighted mix of templated requests, the other alternative to the single request
+        self.scenario = Scenario(scenario, base_url=url, shard=requests_shard) if scenario else None
+        # Connection pool settings; the defaults match aiohttp's own
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.force_close = force_close
+        self.warmup_connections = warmup_connections
+        # HTTP/2 engine: connections per origin and concurrent streams per connection
+        self.h2_connections = h2_connections
+        self.h2_max_streams = h2_max_streams
+        # Per-request timeouts in seconds, None (or 0) for no limit: establishing a
+        # connection, the longest gap between response data, and the whole request
+        self.connect_timeout = connect_timeout or None
+        self.read_timeout = read_timeout or None
+        self.total_timeout = total_timeout or None
+        # How long in-flight requests may take to complete once sending ends before they
+        # are cancelled and counted as timeouts; None waits for them however long it takes
+        # 0 means no limit, as for the request timeouts
+        self.drain_timeout = drain_timeout or None
+        # Wall-clock (time.time()) instant to start sending, shared by workers
+        self.start_at = start_at
+        # File every request is streamed to as a raw binary record, if any (see sample_log.py)
+        self.sample_log = sample_log
+        self._sample_log: Optional[SampleLog] = None
+        # Service time and schedule-corrected response time, in milliseconds
+        self.latency_histogram = LatencyHistogram(significant_digits)
+        self.response_time_histogram = LatencyHistogram(significant_digits)
+        self.status_codes = Counter()
         self.error_count = 0
+        # Errors by exception class name and by errors.ERROR_CLASSES class
+        self.error_types = Counter()
+        self.error_classes = Counter()
+        # A few messages of every error class, and their rate-limited logging
+        self.error_log = ErrorLog()
+        self.bytes_received = 0
+        # DNS / connect / TTFB / body breakdown, only when tracing is enabled
+        self.phase_timings = PhaseTimings(significant_digits) if trace_phases else None
+        # Per-stage breakdown, only when the test follows an explicit load profile
+        self.stage_stats = [BreakdownStats(significant_digits) for _ in self.load_profile.stages] \
+            if load_profile else None
+        # Per-endpoint (corpus) or per-template (scenario) breakdown, keyed by PreparedRequest.endpoint
+        self.endpoint_stats: Dict[str, BreakdownStats] = {} if self.corpus or self.scenario else None
+        self._significant_digits = significant_digits
+        # Sends that started behind schedule / were skipped at the concurrency limit
+        self.late_sends = 0
+        self.dropped_sends = 0
+        # Length of the sending window actually observed, set by run_test
+        self.send_duration = None
+        self.stop_requested = False
+        # time.monotonic() instant the schedule starts from, set by run_test
+        self._start_time = None
+        # Event loop of the running test, set by run_test; see read_live
+        self._loop = None
+        # Closed live-metrics windows, oldest first
+        self.windows = deque(maxlen=MAX_WINDOWS)
+        # Every interval of the whole run, in fixed memory, for the report, the timeline plot and
+        # the live windows
+        self.timeseries = TimeSeries()
+        self._window = MetricsWindow(self.timeseries, time.monotonic())
+        self._window_count = 0
+        # Event-loop lag, send drift, in-flight count and CPU usage of the generator itself
+        self.monitor = GeneratorMonitor(concurrency, significant_digits)
+        # Sends requests and owns the connections; built last, it reads the settings above
+        self.engine = ENGINES[engine](self)
+
+    def _unit_arrivals(self) -> Iterator[float]:
+        """Yield arrival times of the configured distribution at one request per second."""
+        if self.arrival == 'constant':
+            # Counting rather than accumulating, so float error cannot add a send
+            yield from itertools.count()
+        arrival = 0.0
+        while True:
+            yield arrival
+            if self.arrival == 'poisson':
+                arrival += random.expovariate(1)
+            else:
+                arrival += random.uniform(0, 2)
+
+    def _send_offsets(self) -> Iterator[float]:
+        """Yield the scheduled send times in seconds from the start of the test.
+
+        Unit-rate arrivals are mapped through the load profile's cumulative
+        request count, so every arrival distribution follows ramps and steps.
+        The generator ends with the profile.
+        """
+        for arrival in self._unit_arrivals():
+            offset = self.load_profile.time_at(arrival)
+            if offset is None:
+                return
+            yield offset
+
+    def _schedule(self) -> Iterator[Tuple[float, Optional[PreparedRequest]]]:
+        """Yield ``(offset, request)`` pairs; ``request`` is None for the configured single request.
+
+        The schedule ends early when a corpus that does not loop runs out.
+        """
+        if self.corpus and self.corpus.replay_timestamps:
+            return self.corpus.timed_requests()
+        return zip(self._send_offsets(), self._requests() or itertools.repeat(None))
+
+    def _requests(self) -> Optional[Iterator[PreparedRequest]]:
+        """Return the corpus or scenario requests, or None to send the configured request."""
+        if self.corpus:
+            return self.corpus.requests()
+        if self.scenario:
+            return self.scenario.requests()
+        return None
+
+    def _create_session(self):
+        return self.engine.create_session()
+
+    async def warm_up(self, session):
+        """Open ``warmup_connections`` pooled connections before measuring.
+
+        Engines only open connections for requests, so this sends that many
+        concurrent requests and discards their results.
+        """
+        await asyncio.gather(*(self.engine.send(session, self.method, self.url, self.headers, self.data)
+                               for _ in range(self.warmup_connections)),
+                             return_exceptions=True)
 
     async def run_test(self):
-        start_time = time.time()
-        tasks = []
-        async with aiohttp.ClientSession() as session:
-            while time.time() - start_time < self.duration:
-                if len(tasks) < self.concurrency:
-                    tasks.append(asyncio.create_task(self.send_request(session)))
+        self._loop = asyncio.get_running_loop()
+        if self.sample_log:
+            self._sample_log = SampleLog(self.sample_log)
+        try:
+            await self._run_test()
+        finally:
+            if self._sample_log is not None:
+                self._sample_log.close()
+                self._sample_log = None
+            self.close()
+            self._loop = None
 
-                if len(tasks) >= self.qps:
-                    done, pending = await asyncio.wait(tasks, timeout=1)
-                    tasks = list(pending)
+    def read_live(self, read: Callable[[], Any]) -> Any:
+        """Return ``read()``, called on the event loop of the running test if there is one.
 
-                await asyncio.sleep(1 / self.qps)
+        The loop mutates the counters, histograms and breakdowns on every
+        request, so another thread (an API handler, an agent stream) that
+        reads them while a test runs gets torn state or a "dictionary
+        changed size" error. Handing the read to the loop avoids both.
+        """
+        loop = self._loop
+        if loop is None:
+            return read()
+        try:
+            if asyncio.get_running_loop() is loop:
+                return read()
+        except RuntimeError:
+            pass
+        future = concurrent.futures.Future()
 
-            # Wait for remaining tasks to complete
-            await asyncio.gather(*tasks)
+        def call():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(read())
+                except BaseException as e:
+                    future.set_exception(e)
 
-    async def send_request(self, session: aiohttp.ClientSession):
-        start_time = time.time()
         try:
-            async with session.request(self.method, self.url, headers=self.headers, data=self.data) as response:
-                await response.text()
-                end_time = time.time()
-                latency = (end_time - start_time) * 1000  # Convert to milliseconds
-                self.results.append({
-                    'latency': latency,
-                    'status': response.status
-                })
+            loop.call_soon_threadsafe(call)
+        except RuntimeError:
+            # The loop has closed, so nothing mutates the state any more
+            return read()
+        while True:
+            try:
+                return future.result(timeout=STOP_POLL_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                # The test ended before the loop got to the read
+                if self._loop is not loop and future.cancel():
+                    return read()
+
+    async def _run_test(self):
+        async with self._create_session() as session:
+            # New-connection-per-request mode would throw the warm connections away
+            if self.warmup_connections and not self.force_close:
+                await self.warm_up(session)
+
+            start_time = time.monotonic()
+            if self.start_at is not None:
+                start_time += max(0, self.start_at - time.time())
+                await asyncio.sleep(start_time - time.monotonic())
+            end_time = start_time + self.duration
+            self._start_time = start_time
+            if self._sample_log is not None:
+                self._sample_log.start_time = time.time() - (time.monotonic() - start_time)
+            self._window.reset(start_time)
+            window_task = asyncio.create_task(self._window_loop(start_time))
+            self.monitor.start()
+            monitor_task = asyncio.create_task(self.monitor.run())
+
+            if self.mode == 'closed':
+                requests = self._requests()
+                users = [asyncio.create_task(self._virtual_user(session, end_time, requests))
+                         for _ in range(self.concurrency)]
+                # Users stop sending at the end time and then drain like the open loop
+                await self._drain(users, end_time - time.monotonic())
+                self.send_duration = time.monotonic() - start_time
+            else:
+                await self._run_schedule(session, start_time, end_time)
+
+            self.monitor.stop()
+            for task in (window_task, monitor_task):
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+            if self._window.requests:
+                self._close_window(start_time, time.monotonic())
+
+    async def _run_schedule(self, session, start_time: float, end_time: float):
+        """Open loop: send on the schedule whether or not earlier responses are back.
+
+        A semaphore holds the in-flight requests to ``concurrency``; sends
+        that find it full are dropped rather than queued.
+        """
+        tasks = set()
+        slots = asyncio.Semaphore(self.concurrency)
+        schedule = self._schedule()
+        offset, request = next(schedule, (math.inf, None))
+        next_send = start_time + offset
+
+        while next_send < end_time and not self.stop_requested:
+            # Send times are absolute offsets from the start of the test, so
+            # sleep overshoot and loop lag never accumulate into drift. When
+            # we wake up late, every overdue request goes out in one batch.
+            now = time.monotonic()
+            while next_send <= now and next_send < end_time:
+                if slots.locked():
+                    self.dropped_sends += 1
+                else:
+                    # A free slot is taken without suspending, so the batch stays within the limit
+                    await slots.acquire()
+                    task = asyncio.create_task(self.send_request(session, next_send, request))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    task.add_done_callback(lambda _: slots.release())
+                offset, request = next(schedule, (math.inf, None))
+                next_send = start_time + offset
+
+            delay = min(next_send, end_time) - time.monotonic()
+            await asyncio.sleep(min(max(0, delay), STOP_POLL_INTERVAL))
+
+        self.send_duration = time.monotonic() - start_time
+        await self._drain(tasks)
+
+    async def _drain(self, tasks: Iterable[asyncio.Task], extra_time: float = 0):
+        """Wait for ``tasks`` until ``drain_timeout`` (plus ``extra_time``) runs out, then cancel the rest.
+
+        Cancelled requests are recorded as timeouts by ``send_request``.
+        """
+        tasks = list(tasks)
+        if not tasks:
+            return
+        timeout = None if self.drain_timeout is None else max(0, extra_time) + self.drain_timeout
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        # Surface anything a task failed with, as gathering them would
+        for task in tasks:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    async def _virtual_user(self, session, end_time: float,
+                            requests: Iterator[PreparedRequest] = None):
+        """Closed loop: send, wait for the response, think, and repeat until ``end_time``.
+
+        Users with a think time start at a random point within their first
+        think time, so they do not all send at once. With a corpus or a
+        scenario, all users draw from one shared iterator and stop if it runs
+        out.
+        """
+        if self.think_time:
+            await self._think(random.uniform(0, self.think_time), end_time)
+        while time.monotonic() < end_time and not self.stop_requested:
+            if requests is None:
+                await self.send_request(session)
+            else:
+                request = next(requests, None)
+                if request is None:
+                    return
+                await self.send_request(session, None, request)
+            await self._think(self._think_time(), end_time)
+
+    def _think_time(self) -> float:
+        if self.think_time and self.think_time_distribution == 'exponential':
+            return random.expovariate(1 / self.think_time)
+        return self.think_time
+
+    async def _think(self, seconds: float, end_time: float):
+        wake_time = min(time.monotonic() + seconds, end_time)
+        while not self.stop_requested:
+            delay = wake_time - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(min(delay, STOP_POLL_INTERVAL))
+
+    async def _window_loop(self, start_time: float):
+        next_close = start_time + WINDOW_INTERVAL
+        while True:
+            await asyncio.sleep(max(0, next_close - time.monotonic()))
+            self._close_window(start_time, next_close)
+            next_close += WINDOW_INTERVAL
+
+    def _close_window(self, start_time: float, end: float):
+        summary = self._window.summary(self._window_count, start_time, end)
+        summary.update(self.monitor.close_window(summary['duration']))
+        self.windows.append(summary)
+        self._window_count += 1
+        self._window.reset(end)
+
+    def stop(self):
+        """Stop scheduling new requests; in-flight requests are still drained.
+
+        Safe to call from any thread while ``run_test`` is running.
+        """
+        self.stop_requested = True
+
+    def close(self):
+        """Release the request corpus file. ``run_test`` does this when it ends;
+        a tester that is never run (e.g. one that only merges results) must
+        call it itself.
+        """
+        if self.corpus:
+            self.corpus.close()
+
+    async def send_request(self, session, intended_time: float = None,
+                           request: PreparedRequest = None):
+        """Send one request.
+
+        ``intended_time`` is the ``time.monotonic()`` instant the schedule
+        wanted this request to go out. Latency is measured from the actual
+        send (service time); response time is measured from the intended send
+        so queueing delay in the generator is not silently omitted.
+        ``request`` replaces the configured url, method, headers and data.
+        """
+        start_time = time.monotonic()
+        drift_ms = None
+        if intended_time is None:
+            intended_time = start_time
+        else:
+            drift_ms = (start_time - intended_time) * 1000
+            if drift_ms > LATE_SEND_THRESHOLD_MS:
+                self.late_sends += 1
+        self.monitor.request_started(drift_ms)
+        breakdowns = self._breakdowns(intended_time, request)
+        if request is None:
+            method, url, headers, data = self.method, self.url, self.headers, self.data
+        else:
+            method, url, headers, data = request.method, request.url, request.headers, request.data
+        trace_marks = {} if self.phase_timings else None
+        try:
+            status, nbytes = await self.engine.send(session, method, url, headers, data, trace_marks)
+            end_time = time.monotonic()
+            if self.phase_timings:
+                self.phase_timings.record(trace_marks, end_time)
+            self.record_result((end_time - start_time) * 1000,  # Convert to milliseconds
+                               status,
+                               (end_time - intended_time) * 1000,
+                               nbytes, breakdowns)
+            if self._sample_log is not None:
+                self._sample_log.record(intended_time - self._start_time, start_time - self._start_time,
+                                        (end_time - start_time) * 1000, status, nbytes)
         except Exception as e:
-            self.error_count += 1
-            print(f"Error: {str(e)}")
+            error_class = classify_error(e)
+            self.record_error(breakdowns, type(e).__name__, error_class)
+            self.error_log.record(error_class, e)
+            self._log_failed_sample(intended_time, start_time, error_class)
+        except asyncio.CancelledError:
+            # Still in flight at the drain deadline
+            self.record_error(breakdowns, 'DrainTimeout', 'timeout')
+            self._log_failed_sample(intended_time, start_time, 'timeout')
+            raise
+        finally:
+            self.monitor.request_finished()
+
+    def _log_failed_sample(self, intended_time: float, start_time: float, error_class: str):
+        if self._sample_log is not None:
+            self._sample_log.record(intended_time - self._start_time, start_time - self._start_time,
+                                    (time.monotonic() - start_time) * 1000, error_class=error_class)
+
+    def _breakdowns(self, intended_time: float, request: PreparedRequest = None) -> List[BreakdownStats]:
+        """Return the breakdown slices a request scheduled at ``intended_time`` belongs to."""
+        breakdowns = []
+        if self.stage_stats is not None and self._start_time is not None:
+            breakdowns.append(self.stage_stats[self.load_profile.stage_at(intended_time - self._start_time)])
+        if request is not None and self.endpoint_stats is not None:
+            breakdowns.append(self._endpoint_stats(request.endpoint))
+        return breakdowns
+
+    def _endpoint_stats(self, endpoint: str) -> BreakdownStats:
+        stats = self.endpoint_stats.get(endpoint)
+        if stats is None:
+            stats = self.endpoint_stats[endpoint] = BreakdownStats(self._significant_digits)
+        return stats
+
+    def record_result(self, latency: float, status: int, response_time: float = None, nbytes: int = 0,
+                      breakdowns: Iterable[BreakdownStats] = ()):
+        """Record one completed request; times are in milliseconds.
+
+        Results recorded without a schedule have no queueing delay, so the
+        response time defaults to the latency. The request is also counted
+        in every slice in ``breakdowns``.
+        """
+        if response_time is None:
+            response_time = latency
+        self.bytes_received += nbytes
+        self.latency_histogram.record(latency)
+        self.response_time_histogram.record(response_time)
+        self.status_codes[status] += 1
+        self.timeseries.record(self._elapsed(), latency, status, nbytes)
+        for breakdown in breakdowns:
+            breakdown.record_result(latency, status)
+
+    def record_error(self, breakdowns: Iterable[BreakdownStats] = (), error_type: str = 'Exception',
+                     error_class: str = 'other'):
+        """Record one request that failed without a response.
+
+        ``error_type`` is the exception class name and ``error_class`` its
+        ``errors.ERROR_CLASSES`` class.
+        """
+        self.error_count += 1
+        self.error_types[error_type] += 1
+        self.error_classes[error_class] += 1
+        self.timeseries.record_error(self._elapsed(), error_class)
+        for breakdown in breakdowns:
+            breakdown.record_error()
+
+    def _elapsed(self) -> float:
+        """Seconds since the schedule started, or 0 outside a run."""
+        return time.monotonic() - self._start_time if self._start_time is not None else 0
+
+    def export_state(self) -> Dict[str, Any]:
+        """Return the recorded results in a picklable, JSON-friendly form."""
+        return {
+            'latency_histogram': self.latency_histogram.to_dict(),
+            'response_time_histogram': self.response_time_histogram.to_dict(),
+            'status_codes': dict(self.status_codes),
+            'error_count': self.error_count,
+            'error_types': dict(self.error_types),
+            'error_classes': dict(self.error_classes),
+            'error_samples': self.error_log.export_state(),
+            'bytes_received': self.bytes_received,
+            'late_sends': self.late_sends,
+            'dropped_sends': self.dropped_sends,
+            'send_duration': self.send_duration,
+            'timeseries': self.timeseries.to_dict(),
+            'phase_timings': self.phase_timings.export_state() if self.phase_timings else None,
+            'stage_stats': [stats.export_state() for stats in self.stage_stats] if self.stage_stats else None,
+            'endpoint_stats': {endpoint: stats.export_state() for endpoint, stats in self.endpoint_stats.items()}
+            if self.endpoint_stats else None,
+            'engine_state': self.engine.export_state(),
+            'generator': self.monitor.export_state()
+        }
+
+    def merge_state(self, state: Dict[str, Any]):
+        """Fold results exported by another tester (e.g. a worker) into this one."""
+        self.latency_histogram.merge(LatencyHistogram.from_dict(state['latency_histogram']))
+        self.response_time_histogram.merge(LatencyHistogram.from_dict(state['response_time_histogram']))
+        # JSON round trips turn the status code keys into strings
+        self.status_codes.update({int(code): count for code, count in state['status_codes'].items()})
+        self.error_count += state['error_count']
+        self.error_types.update(state.get('error_types') or {})
+        self.error_classes.update(state.get('error_classes') or {})
+        self.error_log.merge_state(state.get('error_samples'))
+        self.bytes_received += state['bytes_received']
+        self.late_sends += state['late_sends']
+        self.dropped_sends += state['dropped_sends']
+        # Workers and agents share one start time, so their intervals line up
+        if state.get('timeseries'):
+            self.timeseries.merge(TimeSeries.from_dict(state['timeseries']))
+        if self.phase_timings and state.get('phase_timings'):
+            self.phase_timings.merge_state(state['phase_timings'])
+        if self.stage_stats and state.get('stage_stats'):
+            for stats, stage_state in zip(self.stage_stats, state['stage_stats']):
+                stats.merge_state(stage_state)
+        if self.endpoint_stats is not None and state.get('endpoint_stats'):
+            for endpoint, endpoint_state in state['endpoint_stats'].items():
+                self._endpoint_stats(endpoint).merge_state(endpoint_state)
+        if state.get('engine_state') is not None:
+            self.engine.merge_state(state['engine_state'])
+        if state.get('generator'):
+            self.monitor.merge_state(state['generator'])
+        # Workers send in parallel, so the merged window is the longest one
+        if state['send_duration'] is not None:
+            self.send_duration = max(self.send_duration or 0, state['send_duration'])
 
     def generate_report(self):
-        total_requests = len(self.results) + self.error_count
+        total_requests = self.latency_histogram.count + self.error_count
         if total_requests == 0:
             return None
 
-        latencies = [result['latency'] for result in self.results]
-        statuses = [result['status'] for result in self.results]
-
         error_rate = self.error_count / total_requests if total_requests > 0 else 1
+        send_duration = self.send_duration or self.duration
+        latency = self.latency_histogram
+        response_time = self.response_time_histogram
+        p50, p90, p95, p99 = latency.percentiles([50, 90, 95, 99])
+        rt_p50, rt_p90, rt_p95, rt_p99 = response_time.percentiles([50, 90, 95, 99])
+        generator = self.monitor.report(self.dropped_sends)
 
-        return {
+        report = {
             'total_requests': total_requests,
+            # Closed-loop users have no target rate
+            'target_qps': self.qps if self.mode == 'open' else None,
+            'achieved_qps': total_requests / send_duration if send_duration else 0,
             'error_rate': error_rate,
-            'avg_latency': statistics.mean(latencies) if latencies else 0,
-            'median_latency': statistics.median(latencies) if latencies else 0,
-            'min_latency': min(latencies) if latencies else 0,
-            'max_latency': max(latencies) if latencies else 0,
-            'p50_latency': np.percentile(latencies, 50) if latencies else 0,
-            'p90_latency': np.percentile(latencies, 90) if latencies else 0,
-            'p95_latency': np.percentile(latencies, 95) if latencies else 0,
-            'p99_latency': np.percentile(latencies, 99) if latencies else 0,
-            'latencies': latencies,
-            'status_codes': dict(Counter(statuses))
+            'bytes_received': self.bytes_received,
+            'throughput_mb_per_s': self.bytes_received / send_duration / 1e6 if send_duration else 0,
+            'avg_latency': latency.mean,
+            'median_latency': p50,
+            'min_latency': latency.min if latency.count else 0,
+            'max_latency': latency.max if latency.count else 0,
+            'p50_latency': p50,
+            'p90_latency': p90,
+            'p95_latency': p95,
+            'p99_latency': p99,
+            'avg_response_time': response_time.mean,
+            'median_response_time': rt_p50,
+            'min_response_time': response_time.min if response_time.count else 0,
+            'max_response_time': response_time.max if response_time.count else 0,
+            'p50_response_time': rt_p50,
+            'p90_response_time': rt_p90,
+            'p95_response_time': rt_p95,
+            'p99_response_time': rt_p99,
+            'late_sends': self.late_sends,
+            'dropped_sends': self.dropped_sends,
+            'engine': self.engine.name,
+            'generator_bound': generator['bound'],
+            'generator': generator,
+            'latency_histogram': latency.to_dict(),
+            'response_time_histogram': response_time.to_dict(),
+            'status_codes': dict(self.status_codes),
+            'error_types': dict(self.error_types),
+            'error_classes': dict(self.error_classes),
+            'error_samples': self.error_log.export_state(),
+            'timeseries': self.timeseries.report()
         }
+        if self.phase_timings:
+            report.update(self.phase_timings.report())
+        report.update(self.engine.report())
+        if self.stage_stats:
+            report['stages'] = self.stage_report(send_duration)
+        if self.endpoint_stats is not None:
+            report['endpoints'] = {endpoint: stats.report(send_duration)
+                                   for endpoint, stats in sorted(self.endpoint_stats.items())}
+        return report
+
+    def stage_report(self, send_duration: float) -> List[Dict[str, Any]]:
+        """Break the results down by load profile stage.
+
+        Stages cut short by a stop only count the time they actually ran.
+        """
+        stages = []
+        for stage, stats in zip(self.load_profile.stages, self.stage_stats):
+            ran_for = min(stage['duration'], max(0, send_duration - stage['start']))
+            stages.append({
+                'name': stage['name'],
+                'ramp': stage['ramp'],
+                'start': stage['start'],
+                'duration': stage['duration'],
+                'start_rate': stage['start_rate'],
+                'target_rate': stage['rate'],
+                **stats.report(ran_for)
+            })
+        return stages
 
-    def plot_latency_distribution(self, latencies, p50, p90, p95, p99, output_path):
+    def plot_latency_distribution(self, histogram: LatencyHistogram, p50, p90, p95, p99, output_path):
         plt.figure(figsize=(12, 6))
 
-        # Plot histogram
-        n, bins, patches = plt.hist(latencies, bins=50, edgecolor='black', alpha=0.7)
+        # Plot histogram, rebinning the recorder's buckets into 50 linear bins
+        values, counts = histogram.buckets()
+        n, bins, patches = plt.hist(values, bins=50, weights=counts, edgecolor='black', alpha=0.7)
 
         # Color the bars based on percentiles
         for i, p in enumerate(patches):
@@ -117,6 +907,31 @@ class HTTPLoadTester:
         plt.show()
         plt.close()
 
+    def plot_timeline(self, timeseries: Dict[str, Any], output_path: str):
+        """Plot throughput, errors and latency percentiles over the run from a ``timeseries`` report."""
+        fig, (rate_ax, latency_ax) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
+        start = timeseries['start']
+        interval = timeseries['interval']
+
+        rate_ax.plot(start, timeseries['qps'], color='blue', label='Requests/s')
+        rate_ax.plot(start, [errors / interval for errors in timeseries['errors']], color='red',
+                     label='Errors/s')
+        rate_ax.set_title('Throughput over Time')
+        rate_ax.set_ylabel('Requests per second')
+        rate_ax.legend()
+
+        for percentile, color in (('p50', 'green'), ('p90', 'orange'), ('p99', 'red')):
+            latency_ax.plot(start, timeseries[f'{percentile}_latency'], color=color,
+                            label=f'{percentile} latency')
+        latency_ax.set_title('Latency over Time')
+        latency_ax.set_xlabel(f'Time since start (s, {interval:g} s intervals)')
+        latency_ax.set_ylabel('Latency (ms)')
+        latency_ax.legend()
+
+        plt.tight_layout()
+        plt.savefig(output_path)
+        plt.close(fig)
+
     def plot_status_code_distribution(self, statuses: List[int], output_path: str):
         status_counts = Counter(statuses)
 
@@ -178,7 +993,157 @@ class HTTPLoadTester:
         plt.show()
         plt.close()
 
-async def main():
+def split_evenly(total: int, parts: int) -> List[int]:
+    """Split ``total`` into ``parts`` integers that differ by at most one."""
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def shard_config(config: Dict[str, Any], parts: int) -> List[Dict[str, Any]]:
+    """Split the rate and pool sizes of a test config into ``parts`` slices.
+
+    Slices that would get no rate are left out, so fewer than ``parts``
+    slices come back when ``qps`` is smaller than ``parts``. A load profile
+    is split instead by scaling every stage's rate down by ``parts``; in
+    closed-loop mode the virtual users are split, and slices without any
+    are left out. A replayed corpus is split line by line (a scenario
+    interleaves its sequence numbers and CSV rows the same way), and
+    replayed at its timestamps every slice is kept whatever its rate.
+    """
+    closed_loop = config.get('mode', 'open') == 'closed'
+    profile = LoadProfile(config['load_profile']) if config.get('load_profile') else None
+    shares = {
+        'qps': split_evenly(config.get('qps') or 0, parts),
+        'concurrency': split_evenly(config.get('concurrency', 100), parts),
+        'warmup_connections': split_evenly(config.get('warmup_connections', 0), parts),
+    }
+    # 0 means "no limit" for the pool sizes, and stays that way in every slice
+    for limit, default in (('connection_limit', 100), ('connection_limit_per_host', 0), ('h2_connections', 1)):
+        if config.get(limit, default):
+            shares[limit] = split_evenly(config.get(limit, default), parts)
+
+    slices = []
+    for i in range(parts):
+        if closed_loop:
+            if shares['concurrency'][i] == 0:
+                continue
+        elif shares['qps'][i] == 0 and profile is None and not config.get('replay_timestamps'):
+            continue
+        shard = dict(config, **{key: values[i] for key, values in shares.items()})
+        if profile is not None:
+            shard['load_profile'] = profile.scaled(1 / parts)
+        for key in ('concurrency', 'connection_limit', 'connection_limit_per_host', 'h2_connections'):
+            if key in shares:
+                shard[key] = max(1, shard[key])
+        slices.append(shard)
+    if config.get('requests_file') or config.get('scenario'):
+        for i, shard in enumerate(slices):
+            shard['requests_shard'] = [i, len(slices)]
+    # Every slice writes its own sample log, e.g. samples.0.bin and samples.1.bin for samples.bin
+    if config.get('sample_log'):
+        root, extension = os.path.splitext(config['sample_log'])
+        for i, shard in enumerate(slices):
+            shard['sample_log'] = f'{root}.{i}{extension}'
+    return slices
+
+
+def _worker_process(config: Dict[str, Any], ready, start_event, start_at, results):
+    try:
+        load_tester = HTTPLoadTester(**config)
+        ready.wait(WORKER_STARTUP_TIMEOUT)
+        start_event.wait()
+        load_tester.start_at = start_at.value
+        asyncio.run(load_tester.run_test())
+        results.put(('ok', load_tester.export_state()))
+    except Exception as e:
+        results.put(('error', f"{type(e).__name__}: {e}"))
+        # Hand the error over before breaking the barrier, so the parent finds it
+        # instead of waiting out the startup timeout
+        results.close()
+        results.join_thread()
+        ready.abort()
+
+
+def _worker_results_timeout(tester: HTTPLoadTester, start_delay: float) -> Optional[float]:
+    """Return how long a worker running ``tester``'s config may take to report back, None for as long as it takes.
+
+    That is the warm-up (bounded by the total request timeout, if any),
+    the start delay, the test itself and the drain, plus a margin for
+    building the report.
+    """
+    if tester.drain_timeout is None:
+        return None
+    timeout = start_delay + tester.duration + tester.drain_timeout + WORKER_STARTUP_TIMEOUT
+    if tester.warmup_connections and not tester.force_close:
+        if tester.total_timeout is None:
+            return None
+        timeout += tester.total_timeout
+    return timeout
+
+
+def run_workers(config: Dict[str, Any], workers: int, start_delay: float = 0.2) -> HTTPLoadTester:
+    """Run one test sharded across ``workers`` processes.
+
+    ``qps``, ``concurrency`` and the connection pool sizes are split across
+    the workers (see ``shard_config``); each runs its
+    own event loop and engine session. Once every worker has
+    started up they are released onto a shared wall-clock start time, and
+    their results are merged into the returned tester, so ``generate_report``
+    on it has the usual schema.
+    """
+    worker_configs = shard_config(config, workers)
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Barrier(len(worker_configs) + 1)
+    start_event = ctx.Event()
+    start_at = ctx.Value('d', 0.0)
+    results = ctx.Queue()
+
+    processes = []
+    for worker_config in worker_configs:
+        process = ctx.Process(target=_worker_process,
+                              args=(worker_config, ready, start_event, start_at, results),
+                              daemon=True)
+        process.start()
+        processes.append(process)
+
+    merged = HTTPLoadTester(**config)
+    # Only the workers send; the merged tester never reads the corpus
+    merged.close()
+    try:
+        try:
+            ready.wait(WORKER_STARTUP_TIMEOUT)
+        except threading.BrokenBarrierError:
+            try:
+                while True:
+                    status, payload = results.get_nowait()
+                    if status == 'error':
+                        raise RuntimeError(f"Worker process failed to start: {payload}") from None
+            except queue.Empty:
+                pass
+            raise RuntimeError("Worker processes did not start in time") from None
+        start_at.value = time.time() + start_delay
+        start_event.set()
+
+        errors = []
+        for _ in processes:
+            try:
+                status, payload = results.get(timeout=_worker_results_timeout(merged, start_delay))
+            except queue.Empty:
+                raise RuntimeError("Timed out waiting for worker results") from None
+            if status == 'ok':
+                merged.merge_state(payload)
+            else:
+                errors.append(payload)
+        if errors:
+            raise RuntimeError(f"{len(errors)} worker(s) failed: {'; '.join(errors)}")
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+    return merged
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='HTTP Load Testing Tool')
     parser.add_argument('url', type=str, help='Target URL')
     parser.add_argument('--qps', type=int, default=10, help='Queries per second')
@@ -187,32 +1152,178 @@ async def main():
     parser.add_argument('--headers', type=json.loads, default={}, help='HTTP headers as JSON')
     parser.add_argument('--data', type=str, help='Request body data')
     parser.add_argument('--concurrency', type=int, default=100, help='Maximum number of concurrent requests')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes to shard qps and concurrency across')
+    parser.add_argument('--trace-phases', action='store_true',
+                        help='Time DNS, connection, TTFB and body phases separately')
+    parser.add_argument('--connection-limit', type=int, default=100,
+                        help='Total connection pool size (0 for no limit)')
+    parser.add_argument('--connection-limit-per-host', type=int, default=0,
+                        help='Connection pool size per host (0 for no limit)')
+    parser.add_argument('--keepalive-timeout', type=float, default=15,
+                        help='Seconds an idle pooled connection is kept open')
+    parser.add_argument('--dns-cache-ttl', type=int, default=10,
+                        help='Seconds DNS results are cached')
+    parser.add_argument('--force-close', action='store_true',
+                        help='Open a new connection for every request')
+    parser.add_argument('--warmup-connections', type=int, default=0,
+                        help='Connections to open before the measured window starts')
+    parser.add_argument('--connect-timeout', type=float, default=0,
+                        help='Seconds allowed to establish a connection, 0 for no limit')
+    parser.add_argument('--read-timeout', type=float, default=0,
+                        help='Longest wait in seconds for the next piece of a response, 0 for no limit')
+    parser.add_argument('--total-timeout', type=float, default=0,
+                        help='Seconds allowed for a whole request, 0 for no limit')
+    parser.add_argument('--drain-timeout', type=float, default=DRAIN_TIMEOUT,
+                        help='Seconds in-flight requests get to complete after sending ends, 0 for no limit; '
+                             'the rest are cancelled and counted as timeouts')
+    parser.add_argument('--body-mode', type=str, default='stream', choices=BODY_MODES,
+                        help='Stream and discard response bodies, or read and decode them in full for validation')
+    parser.add_argument('--engine', type=str, default='aiohttp', choices=list(ENGINES),
+                        help='HTTP client engine: aiohttp, raw for a lower-overhead HTTP/1.1 client '
+                             'without phase tracing, or h2 for HTTP/2 (needs the h2 package)')
+    parser.add_argument('--h2-connections', type=int, default=1,
+                        help='HTTP/2 engine: connections per origin that requests are multiplexed over')
+    parser.add_argument('--h2-max-streams', type=int, default=100,
+                        help='HTTP/2 engine: concurrent streams per connection (the server may allow fewer)')
+    parser.add_argument('--arrival', type=str, default='constant', choices=ARRIVAL_DISTRIBUTIONS,
+                        help='Inter-arrival distribution of the request schedule')
+    parser.add_argument('--mode', type=str, default='open', choices=LOAD_MODES,
+                        help='open: send at --qps regardless of responses; closed: run --concurrency virtual '
+                             'users that each wait for their response before sending again')
+    parser.add_argument('--think-time', type=float, default=0,
+                        help='Closed loop: mean pause in seconds between a response and the next request')
+    parser.add_argument('--think-time-distribution', type=str, default='fixed', choices=THINK_TIME_DISTRIBUTIONS,
+                        help='Closed loop: use exactly --think-time, or exponentially distributed pauses with that mean')
+    parser.add_argument('--requests-file', type=str,
+                        help='Replay requests from a JSONL file (method, url, headers, body, timestamp, weight, '
+                             'name per line) instead of sending url/--method/--headers/--data')
+    parser.add_argument('--requests-loop', action='store_true',
+                        help='Start the requests file over when it runs out instead of ending the test')
+    parser.add_argument('--requests-shuffle', action='store_true',
+                        help='Replay the requests file in a random order on every pass')
+    parser.add_argument('--replay-timestamps', action='store_true',
+                        help='Send requests at their recorded timestamps instead of at --qps')
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help='Speed-up factor for --replay-timestamps')
+    parser.add_argument('--scenario', type=load_json_argument,
+                        help='Weighted mix of templated requests replacing url/--method/--headers/--data: '
+                             'a JSON object or a path to a JSON file')
+    parser.add_argument('--profile', type=load_json_argument,
+                        help='Load profile replacing --qps and --duration: a JSON list of stages '
+                             '({"rate", "duration", "ramp": "step"|"linear", "name"}) or a path to a JSON file')
+    parser.add_argument('--sample-log', type=str,
+                        help='Stream every request as a binary record to this file (see src/sample_log.py)')
+
+    search = parser.add_argument_group('capacity search', 'Find the highest rate that meets a latency and error SLO '
+                                                          'with a series of short probes (single process only)')
+    search.add_argument('--search-p99', type=float, metavar='MS',
+                        help='Enable search mode with this p99 response time limit in milliseconds')
+    search.add_argument('--search-max-error-rate', type=float, default=0.01,
+                        help='Highest acceptable error rate, as a fraction')
+    search.add_argument('--search-strategy', type=str, default='bisect', choices=('bisect', 'aimd'),
+                        help='How the next probe rate is chosen')
+    search.add_argument('--search-min-qps', type=float, default=1, help='Lowest rate to probe')
+    search.add_argument('--search-max-qps', type=float, default=1000, help='Highest rate to probe')
+    search.add_argument('--search-tolerance', type=float, default=0.05,
+                        help='Stop once the limit is known to within this fraction of the rate')
+    search.add_argument('--probe-duration', type=float, default=10, help='Length of each probe in seconds')
+    search.add_argument('--max-probes', type=int, default=20, help='Most probes to run')
+
+    metrics = parser.add_argument_group('metrics exporter', 'Serve the running totals for Prometheus to scrape')
+    metrics.add_argument('--metrics-port', type=int, help='Serve /metrics on this port while the test runs')
+    metrics.add_argument('--metrics-host', type=str, default='0.0.0.0', help='Address to serve /metrics on')
+    metrics.add_argument('--metrics-linger', type=float, default=0,
+                         help='Seconds to keep serving /metrics after the test, so the final values get scraped')
+
+    history = parser.add_argument_group('run history', 'Keep finished runs for later comparison '
+                                                       '(see src/run_store.py)')
+    history.add_argument('--history-db', type=str, default=os.path.join('history', 'runs.db'),
+                         help='SQLite database finished runs are saved to')
+    history.add_argument('--no-history', action='store_true', help='Do not save this run to the history')
+    return parser
 
+
+def load_json_argument(value: str) -> Any:
+    """Parse a command-line value given either as inline JSON or as a path to a JSON file."""
+    if os.path.isfile(value):
+        with open(value) as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+async def main():
+    parser = build_parser()
     args = parser.parse_args()
+    if args.metrics_port and args.workers > 1:
+        parser.error("--metrics-port serves a single process; it cannot be combined with --workers")
 
-    load_tester = HTTPLoadTester(
+    config = dict(
         url=args.url,
         qps=args.qps,
         duration=args.duration,
         method=args.method,
         headers=args.headers,
         data=args.data,
-        concurrency=args.concurrency
+        concurrency=args.concurrency,
+        arrival=args.arrival,
+        trace_phases=args.trace_phases,
+        connection_limit=args.connection_limit,
+        connection_limit_per_host=args.connection_limit_per_host,
+        keepalive_timeout=args.keepalive_timeout,
+        dns_cache_ttl=args.dns_cache_ttl,
+        force_close=args.force_close,
+        warmup_connections=args.warmup_connections,
+        body_mode=args.body_mode,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        total_timeout=args.total_timeout,
+        drain_timeout=args.drain_timeout,
+        engine=args.engine,
+        h2_connections=args.h2_connections,
+        h2_max_streams=args.h2_max_streams,
+        load_profile=args.profile,
+        mode=args.mode,
+        think_time=args.think_time,
+        think_time_distribution=args.think_time_distribution,
+        requests_file=args.requests_file,
+        requests_loop=args.requests_loop,
+        requests_shuffle=args.requests_shuffle,
+        replay_timestamps=args.replay_timestamps,
+        replay_speed=args.replay_speed,
+        scenario=args.scenario,
+        sample_log=args.sample_log
     )
 
-    await load_tester.run_test()
+    if args.search_p99 is not None:
+        await run_search(config, args)
+        return
+
+    if args.workers > 1:
+        loop = asyncio.get_running_loop()
+        load_tester = await loop.run_in_executor(None, run_workers, config, args.workers)
+    else:
+        load_tester = HTTPLoadTester(**config)
+        if args.metrics_port:
+            await run_with_metrics(load_tester, args)
+        else:
+            await load_tester.run_test()
     results = load_tester.generate_report()
 
     if results:
         print(json.dumps(results, indent=2))
+        if results.get('generator_bound'):
+            print(f"\nWarning: the load generator was the bottleneck of this run "
+                  f"({', '.join(results['generator']['bound_reasons'])}); latencies may be inflated by the client")
 
         # Save plots
         os.makedirs('output', exist_ok=True)
         latency_plot_path = os.path.join('output', 'latency_distribution.png')
         status_plot_path = os.path.join('output', 'status_code_distribution.png')
+        timeline_plot_path = os.path.join('output', 'timeline.png')
 
         load_tester.plot_latency_distribution(
-            results['latencies'],
+            load_tester.latency_histogram,
             results['p50_latency'],
             results['p90_latency'],
             results['p95_latency'],
@@ -226,9 +1337,72 @@ async def main():
 
         print(f"\nLatency distribution plot saved to: {latency_plot_path}")
         print(f"Status code distribution plot saved to: {status_plot_path}")
+        if results.get('timeseries'):
+            load_tester.plot_timeline(results['timeseries'], timeline_plot_path)
+            print(f"Timeline plot saved to: {timeline_plot_path}")
+
+        if args.sample_log:
+            print(f"Raw samples saved to: {args.sample_log}" if args.workers <= 1 else
+                  f"Raw samples saved to one file per worker: "
+                  f"{', '.join(shard['sample_log'] for shard in shard_config(config, args.workers))}")
+        if not args.no_history:
+            save_to_history(args.history_db, config, load_tester, results)
     else:
         print("No results generated from the test.")
 
 
+def save_to_history(path: str, config: Dict[str, Any], load_tester: HTTPLoadTester, results: Dict[str, Any]):
+    try:
+        from .run_store import RunStore
+    except ImportError:
+        from run_store import RunStore
+
+    run_id = RunStore(path).save(config, load_tester, results)
+    print(f"Run saved to {path} as run {run_id}")
+
+
+async def run_with_metrics(load_tester: HTTPLoadTester, args: argparse.Namespace):
+    """Run the test while serving its running totals on ``/metrics``."""
+    try:
+        from .metrics_exporter import start_metrics_server
+    except ImportError:
+        from metrics_exporter import start_metrics_server
+
+    runner = await start_metrics_server(load_tester, args.metrics_port, args.metrics_host)
+    print(f"Serving metrics on http://{args.metrics_host}:{args.metrics_port}/metrics")
+    try:
+        await load_tester.run_test()
+        await asyncio.sleep(args.metrics_linger)
+    finally:
+        await runner.cleanup()
+
+
+async def run_search(config: Dict[str, Any], args: argparse.Namespace):
+    try:
+        from .capacity_search import CapacitySearch
+    except ImportError:
+        from capacity_search import CapacitySearch
+
+    search = CapacitySearch(
+        config,
+        max_p99_ms=args.search_p99,
+        max_error_rate=args.search_max_error_rate,
+        strategy=args.search_strategy,
+        min_qps=args.search_min_qps,
+        max_qps=args.search_max_qps,
+        probe_duration=args.probe_duration,
+        tolerance=args.search_tolerance,
+        max_probes=args.max_probes
+    )
+    results = await search.run()
+    print(json.dumps(results, indent=2))
+
+    if search.probes:
+        os.makedirs('output', exist_ok=True)
+        curve_plot_path = os.path.join('output', 'latency_curve.png')
+        search.plot_latency_curve(curve_plot_path)
+        print(f"\nLatency curve plot saved to: {curve_plot_path}")
+
+
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
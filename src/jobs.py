@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+try:
+    from .http_load_tester import HTTPLoadTester
+    from .metrics_exporter import metrics_snapshot
+except ImportError:
+    from http_load_tester import HTTPLoadTester
+    from metrics_exporter import metrics_snapshot
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+CANCELLING = 'cancelling'
+CANCELLED = 'cancelled'
+COMPLETED = 'completed'
+FAILED = 'failed'
+FINISHED_STATES = (CANCELLED, COMPLETED, FAILED)
+
+
+class TestJob:
+    """One load test submitted to a ``JobManager``."""
+
+    __test__ = False  # Not a pytest test class despite the name
+
+    def __init__(self, config: Dict[str, Any], job_id: str = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.config = config
+        # Dropped once the job has finished; the results, the live-metrics windows and a
+        # snapshot of the final metrics (for /metrics) are kept
+        self.load_tester = HTTPLoadTester(**config)
+        self.windows = self.load_tester.windows
+        self.metrics = None
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.results = None
+        self.error = None
+        # Extra fields added to the job view once the results are final
+        self.artifacts: Dict[str, Any] = {}
+        self.future = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        job = {
+            'id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        # Read the tester before the status: it is only dropped after the status is final
+        load_tester = self.load_tester
+        if self.status in (RUNNING, CANCELLING):
+            # Built on the test's own loop, which keeps mutating the state meanwhile
+            job['results'] = load_tester.read_live(load_tester.generate_report)
+        elif self.results is not None:
+            job['results'] = self.results
+            job.update(self.artifacts)
+        if self.error:
+            job['error'] = self.error
+        return job
+
+
+class JobManager:
+    """Runs load tests on a bounded pool of background threads.
+
+    At most ``max_concurrent_tests`` tests run at once; further jobs stay
+    queued. Each running job has its own event loop. ``on_finished`` is
+    called from the job's thread with the job once its final results are
+    known, and may return extra fields for the job view (e.g. plot URLs).
+    """
+
+    def __init__(self, max_concurrent_tests: int = 2, max_finished_jobs: int = 100,
+                 on_finished: Callable[[TestJob], Optional[Dict[str, Any]]] = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_tests, thread_name_prefix='load-test')
+        self.max_finished_jobs = max_finished_jobs
+        self.on_finished = on_finished
+        self.jobs: 'OrderedDict[str, TestJob]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, config: Dict[str, Any], job_id: str = None) -> TestJob:
+        """Queue a test; ``job_id`` lets the caller name files after the job before it exists."""
+        job = TestJob(config, job_id)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._evict_finished()
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[TestJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[TestJob]:
+        """Cancel a job: queued jobs never start, running jobs stop and drain."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self.lock:
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+                # A job the executor has already picked up sees the status in _run and never starts
+                if job.future.cancel():
+                    self._release(job)
+            elif job.status == RUNNING:
+                job.status = CANCELLING
+                job.load_tester.stop()
+        return job
+
+    def shutdown(self):
+        for job in self.list():
+            self.cancel(job.id)
+        self.executor.shutdown(wait=True)
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    @staticmethod
+    def _release(job: TestJob):
+        """Drop the tester of a finished job, keeping what /metrics needs; called under the lock."""
+        job.metrics = metrics_snapshot(job.load_tester)
+        job.load_tester.close()
+        job.load_tester = None
+
+    def _run(self, job: TestJob):
+        with self.lock:
+            if job.status != QUEUED:
+                self._release(job)
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+        try:
+            asyncio.run(job.load_tester.run_test())
+            job.results = job.load_tester.generate_report()
+            if job.results and self.on_finished:
+                job.artifacts = self.on_finished(job) or {}
+            final_status = CANCELLED if job.load_tester.stop_requested else COMPLETED
+        except Exception as e:
+            job.error = str(e)
+            final_status = FAILED
+        with self.lock:
+            job.status = final_status
+            job.finished_at = time.time()
+            self._release(job)
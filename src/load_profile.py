@@ -0,0 +1,104 @@
+import bisect
+import math
+from typing import Any, Dict, List, Optional
+
+# How a stage moves to its target rate: at once, or linearly from the rate
+# the previous stage ended at
+RAMP_TYPES = ('step', 'linear')
+
+
+class LoadProfile:
+    """Declarative request-rate schedule made of consecutive stages.
+
+    Each stage is a dict with a target ``rate`` (requests per second), a
+    ``duration`` in seconds, an optional ``ramp`` (``step`` by default, or
+    ``linear`` to ramp from the previous stage's rate, starting from 0) and
+    an optional ``name``. Ramp, step, spike and soak tests are all
+    sequences of such stages.
+
+    The scheduler works with the cumulative number of requests ``N(t)``
+    the profile asks for by time ``t``: ``time_at(n)`` inverts it, so
+    arrivals generated at unit rate become send times that follow the
+    profile exactly.
+    """
+
+    def __init__(self, stages: List[Dict[str, Any]]):
+        if not stages:
+            raise ValueError("A load profile needs at least one stage")
+
+        self.stages = []
+        self._start_times = []
+        self._start_counts = []
+        start_time = 0.0
+        start_count = 0.0
+        previous_rate = 0.0
+        for i, stage in enumerate(stages):
+            rate = float(stage['rate'])
+            duration = float(stage['duration'])
+            ramp = stage.get('ramp', 'step')
+            if rate < 0 or duration <= 0:
+                raise ValueError(f"Stage {i}: rate must be >= 0 and duration > 0")
+            if ramp not in RAMP_TYPES:
+                raise ValueError(f"Stage {i}: unknown ramp {ramp!r} (expected one of {', '.join(RAMP_TYPES)})")
+
+            start_rate = previous_rate if ramp == 'linear' else rate
+            count = (start_rate + rate) / 2 * duration
+            self.stages.append({
+                'name': stage.get('name', f'stage-{i}'),
+                'ramp': ramp,
+                'start_rate': start_rate,
+                'rate': rate,
+                'start': start_time,
+                'duration': duration,
+                'requests': count
+            })
+            self._start_times.append(start_time)
+            self._start_counts.append(start_count)
+            start_time += duration
+            start_count += count
+            previous_rate = rate
+
+        self.duration = start_time
+        self.total_requests = start_count
+
+    @classmethod
+    def constant(cls, rate: float, duration: float) -> 'LoadProfile':
+        return cls([{'rate': rate, 'duration': duration}])
+
+    @property
+    def mean_rate(self) -> float:
+        return self.total_requests / self.duration
+
+    def scaled(self, factor: float) -> List[Dict[str, Any]]:
+        """Return the stage definitions with every rate multiplied by ``factor``."""
+        return [{'name': stage['name'], 'ramp': stage['ramp'], 'rate': stage['rate'] * factor,
+                 'duration': stage['duration']} for stage in self.stages]
+
+    def stage_at(self, offset: float) -> int:
+        """Return the index of the stage running ``offset`` seconds into the test."""
+        return min(max(bisect.bisect_right(self._start_times, offset) - 1, 0), len(self.stages) - 1)
+
+    def rate_at(self, offset: float) -> float:
+        stage = self.stages[self.stage_at(offset)]
+        progress = min(max((offset - stage['start']) / stage['duration'], 0), 1)
+        return stage['start_rate'] + (stage['rate'] - stage['start_rate']) * progress
+
+    def time_at(self, count: float) -> Optional[float]:
+        """Return when the cumulative request count reaches ``count``.
+
+        Returns ``None`` once ``count`` reaches the end of the profile, so
+        trailing zero-rate stages never send.
+        """
+        if count >= self.total_requests:
+            return None
+        i = bisect.bisect_right(self._start_counts, count) - 1
+        stage = self.stages[i]
+        remaining = count - self._start_counts[i]
+        if remaining <= 0:
+            return stage['start']
+        # Solve remaining = a*t + b*t^2/2 for t, in the form that stays
+        # accurate when the rate is constant (b == 0)
+        a = stage['start_rate']
+        b = (stage['rate'] - a) / stage['duration']
+        elapsed = 2 * remaining / (a + math.sqrt(max(a * a + 2 * b * remaining, 0)))
+        return stage['start'] + min(elapsed, stage['duration'])
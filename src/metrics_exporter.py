@@ -0,0 +1,145 @@
+import math
+from typing import Any, Dict, Iterable, List, Tuple
+
+from aiohttp import web
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'loadtest'
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Upper bounds of the exported histogram buckets in milliseconds, from 1 ms to a minute
+BUCKET_BOUNDS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+def wants_openmetrics(accept: str) -> bool:
+    """Whether a scraper's Accept header asks for the OpenMetrics format."""
+    return 'application/openmetrics-text' in (accept or '')
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def metrics_snapshot(load_tester) -> Dict[str, Any]:
+    """Copy the running totals of a tester; they may be updated from another thread meanwhile.
+
+    Everything read here is kept up to date as requests complete, and the
+    histogram buckets come from one pass over the fixed-size latency
+    histogram counters, so a scrape costs the same however long the test
+    has been running. The copy is made on the test's loop (see
+    ``read_live``), so it is consistent.
+    """
+    return load_tester.read_live(lambda: _read_totals(load_tester))
+
+
+def _read_totals(load_tester) -> Dict[str, Any]:
+    return {
+        'status_codes': dict(load_tester.status_codes),
+        'error_types': dict(load_tester.error_types),
+        'bytes_received': load_tester.bytes_received,
+        'late_sends': load_tester.late_sends,
+        'dropped_sends': load_tester.dropped_sends,
+        'in_flight': load_tester.monitor.in_flight,
+        'target_qps': load_tester.qps if load_tester.mode == 'open' else None,
+        'latency': _buckets(load_tester.latency_histogram),
+        'response_time': _buckets(load_tester.response_time_histogram)
+    }
+
+
+def _buckets(histogram) -> Dict[str, Any]:
+    return {'cumulative_counts': histogram.cumulative_counts(BUCKET_BOUNDS_MS), 'total': histogram.total}
+
+
+def _histogram_samples(histogram: Dict[str, Any]) -> List[Tuple[str, Dict[str, str], float]]:
+    samples = []
+    for bound, cumulative in zip(BUCKET_BOUNDS_MS + (math.inf,), histogram['cumulative_counts']):
+        le = '+Inf' if bound == math.inf else repr(bound / 1000)
+        samples.append(('_bucket', {'le': le}, cumulative))
+    samples.append(('_sum', {}, histogram['total'] / 1000))
+    samples.append(('_count', {}, histogram['cumulative_counts'][-1]))
+    return samples
+
+
+# name, type, help and the samples of every exported metric family, as
+# (suffix, extra labels, value) lists built from a tester snapshot
+METRIC_FAMILIES = (
+    ('requests', 'counter', 'Requests that got a response, by status code',
+     lambda snapshot: [('_total', {'status': str(code)}, count)
+                       for code, count in sorted(snapshot['status_codes'].items())]),
+    ('errors', 'counter', 'Requests that failed without a response, by exception type',
+     lambda snapshot: [('_total', {'type': error_type}, count)
+                       for error_type, count in sorted(snapshot['error_types'].items())]),
+    ('received_bytes', 'counter', 'Response body bytes received',
+     lambda snapshot: [('_total', {}, snapshot['bytes_received'])]),
+    ('late_sends', 'counter', 'Sends that started more than 10 ms behind schedule',
+     lambda snapshot: [('_total', {}, snapshot['late_sends'])]),
+    ('dropped_sends', 'counter', 'Scheduled sends skipped at the concurrency limit',
+     lambda snapshot: [('_total', {}, snapshot['dropped_sends'])]),
+    ('in_flight_requests', 'gauge', 'Requests currently in flight',
+     lambda snapshot: [('', {}, snapshot['in_flight'])]),
+    ('target_qps', 'gauge', 'Target request rate of an open-loop test',
+     lambda snapshot: [('', {}, snapshot['target_qps'])] if snapshot['target_qps'] is not None else []),
+    ('request_latency_seconds', 'histogram', 'Service time from the actual send to the full response',
+     lambda snapshot: _histogram_samples(snapshot['latency'])),
+    ('response_time_seconds', 'histogram', 'Response time from the scheduled send, including queueing in the '
+                                           'generator',
+     lambda snapshot: _histogram_samples(snapshot['response_time'])),
+)
+
+
+def render_metrics(sources: Iterable[Tuple[Dict[str, str], Any]], openmetrics: bool = False) -> str:
+    """Render the running totals of ``(labels, load_tester)`` pairs in the Prometheus text format.
+
+    ``labels`` tell the testers apart (e.g. a job id). A ``metrics_snapshot``
+    can stand in for a tester that is gone, e.g. that of a finished job.
+    With ``openmetrics`` the output follows the OpenMetrics text format
+    instead.
+    """
+    snapshots = [(labels, source if isinstance(source, dict) else metrics_snapshot(source))
+                 for labels, source in sources]
+    lines = []
+    for name, metric_type, help_text, samples in METRIC_FAMILIES:
+        family = f'{METRIC_PREFIX}_{name}'
+        # OpenMetrics names counter families without the _total suffix of their samples
+        type_name = family if openmetrics or metric_type != 'counter' else f'{family}_total'
+        lines.append(f'# HELP {type_name} {help_text}')
+        lines.append(f'# TYPE {type_name} {metric_type}')
+        for labels, snapshot in snapshots:
+            for suffix, extra_labels, value in samples(snapshot):
+                lines.append(f'{family}{suffix}{_format_labels(dict(labels, **extra_labels))} '
+                             f'{_format_value(value)}')
+    if openmetrics:
+        lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+async def start_metrics_server(load_tester, port: int, host: str = '0.0.0.0') -> web.AppRunner:
+    """Serve ``/metrics`` for one tester on the running event loop; clean up the returned runner to stop."""
+    async def metrics(request):
+        openmetrics = wants_openmetrics(request.headers.get('Accept'))
+        body = render_metrics([({'url': load_tester.url}, load_tester)], openmetrics)
+        return web.Response(body=body.encode(), headers={
+            'Content-Type': OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,165 @@
+import itertools
+import json
+import mmap
+import os
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import numpy as np
+
+# Bytes scanned at a time when indexing a corpus, bounding the memory used for it
+INDEX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Distinct endpoints broken down in a report; the rest are counted as 'other'
+MAX_ENDPOINTS = 200
+
+
+class PreparedRequest(NamedTuple):
+    """One request ready to send: the body is already encoded."""
+    method: str
+    url: str
+    headers: Dict[str, str]
+    data: Optional[bytes]
+    # Key the request is broken down under in the report
+    endpoint: str
+
+
+class RequestCorpus:
+    """Requests replayed from a JSONL file without loading it into memory.
+
+    Every line is a JSON object with a ``url`` (absolute, or relative to
+    ``base_url``) and optionally ``method``, ``headers``, ``body`` (a string,
+    or any other JSON value to send as JSON), ``timestamp`` (seconds),
+    ``weight`` (times the line is sent per pass, default 1) and ``name``
+    (the endpoint the line is reported under, by default the method and
+    URL path).
+
+    The file is memory-mapped and only the start and end offsets of every
+    line are kept in memory, 16 bytes per line; lines are parsed when they
+    are sent, and a weighted line is repeated as it is read.
+    ``shard=(index, count)`` keeps every ``count``-th line starting at
+    ``index``, so workers replaying one corpus split it between them.
+    """
+
+    def __init__(self, path: str, base_url: str = None, loop: bool = False, shuffle: bool = False,
+                 replay_timestamps: bool = False, replay_speed: float = 1.0,
+                 shard: Tuple[int, int] = None):
+        if shuffle and replay_timestamps:
+            raise ValueError("A shuffled corpus cannot be replayed at its timestamps")
+        if replay_speed <= 0:
+            raise ValueError("replay_speed must be positive")
+        self.path = path
+        self.base_url = base_url
+        self.loop = loop
+        self.shuffle = shuffle
+        self.replay_timestamps = replay_timestamps
+        self.replay_speed = replay_speed
+
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        starts, ends = self._index_lines(size)
+        # Replayed timing spans the whole file, so that the shards of a corpus
+        # interleave into the recorded schedule
+        self._timeline = (starts[0], ends[0], starts[-1], ends[-1], len(starts)) if len(starts) else None
+        if shard is not None:
+            index, count = shard
+            starts, ends = starts[index::count], ends[index::count]
+        self._starts = starts
+        self._ends = ends
+        if not len(self._starts):
+            raise ValueError(f"No requests in {path}")
+        self._endpoints = set()
+
+    def _index_lines(self, size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the start and end offsets of every non-blank line."""
+        newlines = []
+        for offset in range(0, size, INDEX_CHUNK_SIZE):
+            chunk = np.frombuffer(self._mmap, dtype=np.uint8, count=min(INDEX_CHUNK_SIZE, size - offset),
+                                  offset=offset)
+            newlines.append(np.flatnonzero(chunk == 0x0A) + offset)
+        ends = np.concatenate(newlines + [np.array([size], dtype=np.int64)]).astype(np.int64)
+        starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)
+        # Blank lines (including the one after a final newline) carry no request;
+        # a JSON object takes at least two bytes, so only shorter lines are checked
+        non_blank = ends - starts > 2
+        for i in np.flatnonzero(~non_blank):
+            non_blank[i] = bool(self._mmap[starts[i]:ends[i]].strip())
+        return starts[non_blank], ends[non_blank]
+
+    def __len__(self) -> int:
+        """Return the number of lines, before weighting."""
+        return len(self._starts)
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+        self._file.close()
+
+    def _parse(self, start: int, end: int) -> Dict[str, Any]:
+        return json.loads(self._mmap[start:end])
+
+    def _prepare(self, record: Dict[str, Any]) -> PreparedRequest:
+        method = record.get('method', 'GET').upper()
+        url = urljoin(self.base_url, record['url']) if self.base_url else record['url']
+        headers = record.get('headers') or {}
+        body = record.get('body')
+        if body is None:
+            data = None
+        elif isinstance(body, str):
+            data = body.encode()
+        else:
+            data = json.dumps(body).encode()
+            if not any(name.lower() == 'content-type' for name in headers):
+                headers = dict(headers, **{'Content-Type': 'application/json'})
+        endpoint = record.get('name') or f"{method} {urlsplit(url).path or '/'}"
+        if endpoint not in self._endpoints:
+            if len(self._endpoints) >= MAX_ENDPOINTS:
+                endpoint = 'other'
+            else:
+                self._endpoints.add(endpoint)
+        return PreparedRequest(method, url, headers, data, endpoint)
+
+    def _order(self) -> np.ndarray:
+        if self.shuffle:
+            return np.random.permutation(len(self._starts))
+        return np.arange(len(self._starts))
+
+    def _records(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yield ``(pass, record)`` pairs, starting a new pass at the end of the file when looping.
+
+        A line is yielded ``weight`` times in a row. A pass that yields
+        nothing (every weight is 0) ends the corpus even when looping.
+        """
+        for n in itertools.count():
+            sent = 0
+            for i in self._order():
+                record = self._parse(self._starts[i], self._ends[i])
+                for _ in range(record.get('weight', 1)):
+                    sent += 1
+                    yield n, record
+            if not self.loop or not sent:
+                return
+
+    def requests(self) -> Iterator[PreparedRequest]:
+        """Yield the corpus in file (or shuffled) order, over and over when looping."""
+        for _, record in self._records():
+            yield self._prepare(record)
+
+    def timed_requests(self) -> Iterator[Tuple[float, PreparedRequest]]:
+        """Yield ``(offset, request)`` pairs that reproduce the recorded timing.
+
+        Offsets are seconds from the first timestamp divided by
+        ``replay_speed``; lines are expected in timestamp order. Each loop
+        starts one mean inter-arrival gap after the previous one ended.
+        A shard keeps the offsets of its lines in the whole file.
+        """
+        first_start, first_end, last_start, last_end, lines = self._timeline
+        first = self._parse(first_start, first_end)['timestamp']
+        last = self._parse(last_start, last_end)['timestamp']
+        gap = (last - first) / (lines - 1) if lines > 1 else 1
+        pass_length = last - first + gap
+
+        for n, record in self._records():
+            offset = n * pass_length + record['timestamp'] - first
+            yield offset / self.replay_speed, self._prepare(record)
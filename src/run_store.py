@@ -0,0 +1,353 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+try:
+    from .histogram import LatencyHistogram
+    from .timeseries import TimeSeries
+except ImportError:
+    from histogram import LatencyHistogram
+    from timeseries import TimeSeries
+
+DEFAULT_DB_PATH = os.path.join('history', 'runs.db')
+
+# Report fields kept in their own columns, so runs can be listed without decoding anything
+SUMMARY_FIELDS = ('total_requests', 'target_qps', 'achieved_qps', 'error_rate', 'p50_latency', 'p90_latency',
+                  'p99_latency', 'p99_response_time', 'engine', 'generator_bound')
+
+# Report fields stored as compressed blobs instead of in the report JSON
+HISTOGRAM_FIELDS = ('latency_histogram', 'response_time_histogram')
+
+# Metrics compared between runs, and whether a higher value is better
+COMPARED_METRICS = {
+    'achieved_qps': True,
+    'error_rate': False,
+    'p50_latency': False,
+    'p90_latency': False,
+    'p99_latency': False,
+    'p99_response_time': False
+}
+
+# p-value below which two latency distributions count as different
+SIGNIFICANCE_LEVEL = 0.01
+
+# Default limits of a check: relative percentile increases, an absolute error
+# rate increase and the lowest share of the baseline's rate; None disables one
+CHECK_THRESHOLDS = {
+    'max_p50_increase': None,
+    'max_p99_increase': 0.1,
+    'max_error_rate_increase': 0.01,
+    'min_qps_ratio': None
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    url TEXT NOT NULL,
+    method TEXT NOT NULL,
+    total_requests INTEGER,
+    target_qps REAL,
+    achieved_qps REAL,
+    error_rate REAL,
+    p50_latency REAL,
+    p90_latency REAL,
+    p99_latency REAL,
+    p99_response_time REAL,
+    engine TEXT,
+    generator_bound INTEGER,
+    config TEXT NOT NULL,
+    report BLOB NOT NULL,
+    latency_histogram BLOB NOT NULL,
+    response_time_histogram BLOB NOT NULL,
+    timeseries BLOB
+);
+CREATE INDEX IF NOT EXISTS runs_target ON runs (url, method);
+"""
+
+_SUMMARY_COLUMNS = ('id', 'created_at', 'url', 'method') + SUMMARY_FIELDS
+
+
+def _pack(data: Any) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(',', ':'), default=str).encode('utf-8'))
+
+
+def _unpack(blob: Optional[bytes]) -> Any:
+    return json.loads(zlib.decompress(blob)) if blob is not None else None
+
+
+class RunStore:
+    """History of finished runs in a local SQLite database.
+
+    Every run gets one row: its URL, method and headline numbers in indexed
+    columns for listing, and its config, the rest of its report, both
+    latency histograms and its time series as zlib-compressed JSON blobs.
+    The full histograms are what lets two runs be compared as distributions
+    rather than by a handful of percentiles. Connections are opened per
+    call, so one store can be shared by the API's request and job threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.executescript(_SCHEMA)
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _query(self, sql: str, parameters=()) -> List[sqlite3.Row]:
+        connection = self._connect()
+        try:
+            return connection.execute(sql, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def save(self, config: Dict[str, Any], load_tester, results: Optional[Dict[str, Any]] = None) -> int:
+        """Store a finished run and return its id.
+
+        ``results`` is the tester's report, generated again if not given.
+        """
+        results = results or load_tester.generate_report()
+        if not results:
+            raise ValueError("The run has no results to save")
+        report = {key: value for key, value in results.items()
+                  if key not in HISTOGRAM_FIELDS and key != 'timeseries'}
+        row = {
+            'created_at': time.time(),
+            'url': config['url'],
+            'method': config.get('method', 'GET'),
+            **{field: results.get(field) for field in SUMMARY_FIELDS},
+            'config': json.dumps(config, default=str),
+            'report': _pack(report),
+            'latency_histogram': _pack(load_tester.latency_histogram.to_dict()),
+            'response_time_histogram': _pack(load_tester.response_time_histogram.to_dict()),
+            'timeseries': _pack(load_tester.timeseries.to_dict())
+        }
+        connection = self._connect()
+        try:
+            with connection:
+                cursor = connection.execute(
+                    f"INSERT INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                    tuple(row.values())
+                )
+            return cursor.lastrowid
+        finally:
+            connection.close()
+
+    def list(self, url: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Return the summaries of the latest runs, newest first, optionally only those of ``url``."""
+        where, parameters = ('WHERE url = ?', (url,)) if url else ('', ())
+        rows = self._query(f"SELECT {', '.join(_SUMMARY_COLUMNS)} FROM runs {where} "
+                           f"ORDER BY id DESC LIMIT ?", parameters + (limit,))
+        return [self._summary(row) for row in rows]
+
+    @staticmethod
+    def _summary(row: sqlite3.Row) -> Dict[str, Any]:
+        summary = {column: row[column] for column in _SUMMARY_COLUMNS}
+        if summary['generator_bound'] is not None:
+            summary['generator_bound'] = bool(summary['generator_bound'])
+        return summary
+
+    def _row(self, run_id: int) -> sqlite3.Row:
+        rows = self._query('SELECT * FROM runs WHERE id = ?', (run_id,))
+        if not rows:
+            raise KeyError(f'Unknown run: {run_id}')
+        return rows[0]
+
+    def get(self, run_id: int) -> Optional[Dict[str, Any]]:
+        """Return a run's summary, config and full report, time series included, or None if unknown."""
+        try:
+            row = self._row(run_id)
+        except KeyError:
+            return None
+        results = _unpack(row['report'])
+        for field in HISTOGRAM_FIELDS:
+            results[field] = _unpack(row[field])
+        if row['timeseries'] is not None:
+            results['timeseries'] = TimeSeries.from_dict(_unpack(row['timeseries'])).report()
+        return {**self._summary(row), 'config': json.loads(row['config']), 'results': results}
+
+    def latest_id(self) -> Optional[int]:
+        return self._query('SELECT MAX(id) FROM runs')[0][0]
+
+    def previous_id(self, run_id: int) -> Optional[int]:
+        """Return the id of the latest earlier run against the same URL and method, the natural baseline."""
+        row = self._row(run_id)
+        rows = self._query('SELECT id FROM runs WHERE url = ? AND method = ? AND id < ? ORDER BY id DESC LIMIT 1',
+                           (row['url'], row['method'], run_id))
+        return rows[0]['id'] if rows else None
+
+    def diff(self, baseline_id: int, run_id: int, alpha: float = SIGNIFICANCE_LEVEL) -> Dict[str, Any]:
+        """Compare a run against a baseline run.
+
+        Every metric in COMPARED_METRICS gets its relative ``change`` and
+        whether it is ``better``. The latency and response time
+        distributions get a two-sample Kolmogorov-Smirnov test on the full
+        histograms, ``significant`` when its p-value is below ``alpha``.
+        """
+        baseline, run = self._row(baseline_id), self._row(run_id)
+        metrics = []
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, after = baseline[metric], run[metric]
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else None
+            metrics.append({
+                'metric': metric,
+                'baseline': before,
+                'current': after,
+                'change': change,
+                'better': None if after == before else (after > before) == higher_is_better
+            })
+
+        distributions = {}
+        for field in HISTOGRAM_FIELDS:
+            before = LatencyHistogram.from_dict(_unpack(baseline[field]))
+            after = LatencyHistogram.from_dict(_unpack(run[field]))
+            statistic, p_value = before.ks_test(after)
+            distributions[field.replace('_histogram', '')] = {
+                'ks_statistic': statistic,
+                'p_value': p_value,
+                'significant': p_value < alpha,
+                'baseline_count': before.count,
+                'current_count': after.count
+            }
+        return {
+            'baseline': self._summary(baseline),
+            'current': self._summary(run),
+            'alpha': alpha,
+            'metrics': metrics,
+            'distributions': distributions
+        }
+
+    def check(self, run_id: int, baseline_id: Optional[int] = None, alpha: float = SIGNIFICANCE_LEVEL,
+              **thresholds: Optional[float]) -> Dict[str, Any]:
+        """Decide whether a run passes against a baseline, by default the previous run of the same target.
+
+        Thresholds default to CHECK_THRESHOLDS. A latency percentile only
+        fails when it grew past its limit *and* the latency distribution
+        changed significantly, so run-to-run noise does not fail a build.
+        """
+        unknown = set(thresholds) - set(CHECK_THRESHOLDS)
+        if unknown:
+            raise ValueError(f"Unknown thresholds: {', '.join(sorted(unknown))}")
+        limits = {**CHECK_THRESHOLDS, **thresholds}
+        for name, limit in limits.items():
+            if limit is not None and limit < 0:
+                raise ValueError(f"{name} cannot be negative")
+        if baseline_id is None:
+            baseline_id = self.previous_id(run_id)
+            if baseline_id is None:
+                raise ValueError(f"Run {run_id} has no earlier run of the same URL and method to compare against")
+
+        diff = self.diff(baseline_id, run_id, alpha)
+        metrics = {metric['metric']: metric for metric in diff['metrics']}
+        latency_shifted = diff['distributions']['latency']['significant']
+        failures = []
+        for percentile in ('p50', 'p99'):
+            limit = limits[f'max_{percentile}_increase']
+            metric = metrics.get(f'{percentile}_latency')
+            if limit is not None and metric and metric['change'] is not None and metric['change'] > limit \
+                    and latency_shifted:
+                failures.append(f"{percentile} latency rose {metric['change']:.1%} "
+                                f"({metric['baseline']:.2f} ms -> {metric['current']:.2f} ms), "
+                                f"more than the allowed {limit:.1%}")
+        limit = limits['max_error_rate_increase']
+        metric = metrics.get('error_rate')
+        if limit is not None and metric and metric['current'] - metric['baseline'] > limit:
+            failures.append(f"error rate rose from {metric['baseline']:.2%} to {metric['current']:.2%}, "
+                            f"more than the allowed {limit:.2%}")
+        limit = limits['min_qps_ratio']
+        metric = metrics.get('achieved_qps')
+        if limit is not None and metric and metric['current'] < metric['baseline'] * limit:
+            failures.append(f"achieved rate fell to {metric['current']:.1f} QPS, "
+                            f"below {limit:.0%} of the baseline's {metric['baseline']:.1f}")
+        return {
+            'passed': not failures,
+            'run_id': run_id,
+            'baseline_id': baseline_id,
+            'thresholds': limits,
+            'failures': failures,
+            'diff': diff
+        }
+
+
+def _run_id(store: RunStore, value: str) -> int:
+    if value == 'latest':
+        run_id = store.latest_id()
+        if run_id is None:
+            raise ValueError("The run history is empty")
+        return run_id
+    return int(value)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Browse and compare the history of load test runs')
+    parser.add_argument('--db', type=str, default=DEFAULT_DB_PATH, help='Run history database')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = commands.add_parser('list', help='List the latest runs')
+    list_parser.add_argument('--url', type=str, help='Only list runs against this URL')
+    list_parser.add_argument('--limit', type=int, default=20, help='Most runs to list')
+
+    show_parser = commands.add_parser('show', help="Print a run's config and full report")
+    show_parser.add_argument('run', type=str, help="Run id, or 'latest'")
+
+    diff_parser = commands.add_parser('diff', help='Compare a run against a baseline run')
+    diff_parser.add_argument('baseline', type=str, help="Baseline run id, or 'latest'")
+    diff_parser.add_argument('run', type=str, help="Run id, or 'latest'")
+    diff_parser.add_argument('--alpha', type=float, default=SIGNIFICANCE_LEVEL,
+                             help='Significance level of the distribution tests')
+
+    check_parser = commands.add_parser('check', help='Exit with status 1 if a run regressed against a baseline')
+    check_parser.add_argument('run', type=str, nargs='?', default='latest', help="Run id, or 'latest' (default)")
+    check_parser.add_argument('--baseline', type=str,
+                              help='Baseline run id (default: the previous run of the same URL and method)')
+    check_parser.add_argument('--alpha', type=float, default=SIGNIFICANCE_LEVEL,
+                              help='Significance level of the latency distribution test')
+    for name, default in CHECK_THRESHOLDS.items():
+        check_parser.add_argument('--' + name.replace('_', '-'), type=float, default=default,
+                                  help=f'Check threshold (default: {default})')
+    args = parser.parse_args(argv)
+
+    store = RunStore(args.db)
+    try:
+        if args.command == 'list':
+            output = store.list(args.url, args.limit)
+        elif args.command == 'show':
+            run_id = _run_id(store, args.run)
+            output = store.get(run_id)
+            if output is None:
+                raise KeyError(f'Unknown run: {run_id}')
+        elif args.command == 'diff':
+            output = store.diff(_run_id(store, args.baseline), _run_id(store, args.run), args.alpha)
+        else:
+            output = store.check(_run_id(store, args.run),
+                                 _run_id(store, args.baseline) if args.baseline else None, args.alpha,
+                                 **{name: getattr(args, name) for name in CHECK_THRESHOLDS})
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e.args[0] if e.args else e}", file=sys.stderr)
+        return 2
+
+    print(json.dumps(output, indent=2))
+    if args.command == 'check':
+        for failure in output['failures']:
+            print(f"FAIL: {failure}", file=sys.stderr)
+        return 0 if output['passed'] else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
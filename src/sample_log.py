@@ -0,0 +1,128 @@
+import os
+import struct
+from typing import Optional
+
+import numpy as np
+
+try:
+    from .errors import ERROR_CLASSES
+except ImportError:
+    from errors import ERROR_CLASSES
+
+# File header: magic, format version, record size and the wall-clock
+# (time.time()) start of the run the record times are relative to
+SAMPLE_LOG_MAGIC = b'HLTSMPL\x00'
+SAMPLE_LOG_VERSION = 1
+_HEADER = struct.Struct('<8sHHxxxxd8x')
+HEADER_SIZE = _HEADER.size
+
+# One little-endian record per request: intended and actual send time in
+# seconds since the start of the run, bytes received, latency in
+# milliseconds (until the failure for failed requests), status (0 if
+# failed) and error class (0, or 1 + its index in errors.ERROR_CLASSES)
+_RECORD = struct.Struct('<ddQfHBx')
+SAMPLE_DTYPE = np.dtype({
+    'names': ['intended_time', 'send_time', 'bytes', 'latency_ms', 'status', 'error_class'],
+    'formats': ['<f8', '<f8', '<u8', '<f4', '<u2', 'u1'],
+    'offsets': [0, 8, 16, 24, 28, 30],
+    'itemsize': _RECORD.size
+})
+
+# Records buffered in memory between writes (128 KiB)
+SAMPLE_LOG_CHUNK = 4096
+
+_ERROR_CODES = {error_class: code for code, error_class in enumerate(ERROR_CLASSES, 1)}
+
+
+class SampleLog:
+    """Every request of a run as a fixed-width binary record, streamed to a file.
+
+    Records are packed into a preallocated chunk buffer and written out
+    whenever ``chunk_records`` of them have piled up, so memory stays
+    fixed and a record costs one ``struct.pack_into``. The header is
+    written with the first chunk, once ``start_time`` is known. The file
+    is a header followed by an array of SAMPLE_DTYPE; ``load_samples``
+    memory-maps it.
+    """
+
+    def __init__(self, path: str, chunk_records: int = SAMPLE_LOG_CHUNK):
+        if chunk_records < 1:
+            raise ValueError("chunk_records must be at least 1")
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.start_time = 0.0
+        self.records = 0
+        self._buffer = bytearray(chunk_records * _RECORD.size)
+        self._offset = 0
+        self._file = open(path, 'wb', buffering=0)
+        self._header_written = False
+
+    def record(self, intended_time: float, send_time: float, latency_ms: float, status: int = 0,
+               nbytes: int = 0, error_class: Optional[str] = None):
+        """Add one request; times are seconds since ``start_time``."""
+        _RECORD.pack_into(self._buffer, self._offset, intended_time, send_time, nbytes, latency_ms, status,
+                          _ERROR_CODES[error_class] if error_class else 0)
+        self._offset += _RECORD.size
+        self.records += 1
+        if self._offset == len(self._buffer):
+            self.flush()
+
+    def flush(self):
+        if not self._header_written:
+            self._file.write(_HEADER.pack(SAMPLE_LOG_MAGIC, SAMPLE_LOG_VERSION, _RECORD.size, self.start_time))
+            self._header_written = True
+        if self._offset:
+            self._file.write(memoryview(self._buffer)[:self._offset])
+            self._offset = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+
+
+def read_start_time(path: str) -> float:
+    """Return the wall-clock (time.time()) start of the run a sample log's record times count from."""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        raise ValueError(f"{path} is not a sample log: too short")
+    magic, version, record_size, start_time = _HEADER.unpack(header)
+    if magic != SAMPLE_LOG_MAGIC:
+        raise ValueError(f"{path} is not a sample log")
+    if version != SAMPLE_LOG_VERSION or record_size != SAMPLE_DTYPE.itemsize:
+        raise ValueError(f"{path} has unsupported sample log version {version}")
+    return start_time
+
+
+def load_samples(*paths: str, mmap: bool = True) -> np.ndarray:
+    """Return the records of one or more sample logs as a structured SAMPLE_DTYPE array.
+
+    A single log is memory-mapped read-only unless ``mmap`` is False, so
+    even huge logs load instantly and only the pages touched are read.
+    Several logs (e.g. one per worker, which share a start time) are
+    concatenated into a new array. A partial record at the end of a log
+    that was still being written is ignored.
+    """
+    if not paths:
+        raise ValueError("At least one sample log is required")
+    arrays = []
+    for path in paths:
+        read_start_time(path)
+        records = (os.path.getsize(path) - HEADER_SIZE) // SAMPLE_DTYPE.itemsize
+        if not records:
+            arrays.append(np.empty(0, dtype=SAMPLE_DTYPE))
+        elif mmap:
+            arrays.append(np.memmap(path, dtype=SAMPLE_DTYPE, mode='r', offset=HEADER_SIZE, shape=(records,)))
+        else:
+            arrays.append(np.fromfile(path, dtype=SAMPLE_DTYPE, count=records, offset=HEADER_SIZE))
+    return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+
+def error_class_names(samples: np.ndarray) -> np.ndarray:
+    """Return the error class of every record as a string array, '' for requests that got a response."""
+    return np.array(('',) + ERROR_CLASSES)[samples['error_class']]
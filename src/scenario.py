@@ -0,0 +1,161 @@
+import bisect
+import csv
+import itertools
+import json
+import random
+import re
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+from urllib.parse import urljoin
+
+try:
+    from .request_sources import PreparedRequest
+except ImportError:
+    from request_sources import PreparedRequest
+
+# {{seq}}, {{uuid}}, {{random_int(1, 1000)}} or {{csv.column}}
+PLACEHOLDER = re.compile(r'\{\{\s*(.*?)\s*\}\}')
+RANDOM_INT = re.compile(r'random_int\(\s*(-?\d+)\s*,\s*(-?\d+)\s*\)$')
+
+# A placeholder's value for one request, given its sequence number and CSV row
+Field = Callable[[int, Dict[str, str]], str]
+
+
+def _compile_field(expression: str, columns: Sequence[str]) -> Field:
+    if expression == 'seq':
+        return lambda seq, row: str(seq)
+    if expression == 'uuid':
+        return lambda seq, row: uuid.uuid4().hex
+    match = RANDOM_INT.match(expression)
+    if match:
+        low, high = int(match.group(1)), int(match.group(2))
+        return lambda seq, row: str(random.randint(low, high))
+    if expression.startswith('csv.'):
+        column = expression[4:]
+        if column not in columns:
+            raise ValueError(f"Unknown CSV column in placeholder {{{{{expression}}}}}")
+        return lambda seq, row: row[column]
+    raise ValueError(f"Unknown placeholder: {{{{{expression}}}}}")
+
+
+class CompiledText:
+    """A string with placeholders, split once into literal parts and fields.
+
+    Rendering only joins the literals with the field values; with
+    ``encode`` the literals are pre-encoded and bytes come out. ``escape``
+    is applied to field values, e.g. to keep them valid inside JSON strings.
+    """
+
+    def __init__(self, text: str, columns: Sequence[str], encode: bool = False,
+                 escape: Callable[[str], str] = None):
+        parts = PLACEHOLDER.split(text)
+        self.fields = [_compile_field(expression, columns) for expression in parts[1::2]]
+        self.encode = encode
+        self.escape = escape
+        literals = parts[0::2]
+        self.literals = [literal.encode() for literal in literals] if encode else literals
+        self.static = self.literals[0] if not self.fields else None
+
+    def render(self, seq: int, row: Dict[str, str]):
+        if not self.fields:
+            return self.static
+        values = (field(seq, row) for field in self.fields)
+        if self.escape:
+            values = (self.escape(value) for value in values)
+        if self.encode:
+            values = (value.encode() for value in values)
+        parts = [self.literals[0]]
+        for value, literal in zip(values, self.literals[1:]):
+            parts.append(value)
+            parts.append(literal)
+        return (b'' if self.encode else '').join(parts)
+
+
+def _json_escape(value: str) -> str:
+    return json.dumps(value)[1:-1]
+
+
+class RequestTemplate:
+    """One weighted request of a scenario, compiled once and rendered per request."""
+
+    def __init__(self, spec: Dict[str, Any], base_url: str = None, columns: Sequence[str] = ()):
+        self.name = spec.get('name') or f"{spec.get('method', 'GET').upper()} {spec['url']}"
+        self.weight = spec.get('weight', 1)
+        if self.weight < 0:
+            raise ValueError(f"Template {self.name!r}: weight must be >= 0")
+        self.method = spec.get('method', 'GET').upper()
+        self.url = CompiledText(urljoin(base_url, spec['url']) if base_url else spec['url'], columns)
+
+        headers = dict(spec.get('headers') or {})
+        body = spec.get('body')
+        if body is None:
+            self.body = None
+        elif isinstance(body, str):
+            self.body = CompiledText(body, columns, encode=True)
+        else:
+            # Encoded once; placeholders inside JSON strings are escaped per request
+            self.body = CompiledText(json.dumps(body), columns, encode=True, escape=_json_escape)
+            if not any(name.lower() == 'content-type' for name in headers):
+                headers['Content-Type'] = 'application/json'
+        # Headers without placeholders are shared by every request as is
+        self.headers = headers
+        self.header_fields = {name: CompiledText(value, columns) for name, value in headers.items()
+                              if PLACEHOLDER.search(value)}
+
+    def render(self, seq: int, row: Dict[str, str]) -> PreparedRequest:
+        headers = self.headers
+        if self.header_fields:
+            headers = dict(headers)
+            for name, value in self.header_fields.items():
+                headers[name] = value.render(seq, row)
+        data = self.body.render(seq, row) if self.body else None
+        return PreparedRequest(self.method, self.url.render(seq, row), headers, data, self.name)
+
+
+class Scenario:
+    """A weighted mix of request templates.
+
+    ``spec`` holds a ``templates`` list and optionally a ``csv`` file whose
+    rows feed ``{{csv.<column>}}`` placeholders. Each template has a
+    ``url`` (absolute or relative to ``base_url``) and optionally a
+    ``name``, ``weight`` (default 1), ``method``, ``headers`` and ``body``
+    (a string, or any other JSON value to send as JSON). Placeholders are
+    ``{{seq}}`` (a per-template sequence number), ``{{uuid}}``,
+    ``{{random_int(low, high)}}`` and ``{{csv.<column>}}`` (the next CSV
+    row for every request of a template, cycling).
+
+    ``shard=(index, count)`` interleaves sequence numbers and CSV rows
+    between workers, so they do not send the same values.
+    """
+
+    def __init__(self, spec: Dict[str, Any], base_url: str = None, shard: Tuple[int, int] = None):
+        self.rows: List[Dict[str, str]] = []
+        columns: Sequence[str] = ()
+        if spec.get('csv'):
+            with open(spec['csv'], newline='') as f:
+                reader = csv.DictReader(f)
+                self.rows = list(reader)
+                columns = reader.fieldnames or ()
+            if not self.rows:
+                raise ValueError(f"No rows in {spec['csv']}")
+
+        self.templates = [RequestTemplate(template, base_url, columns) for template in spec.get('templates', [])]
+        if not self.templates:
+            raise ValueError("A scenario needs at least one template")
+        names = [template.name for template in self.templates]
+        if len(set(names)) != len(names):
+            raise ValueError("Scenario template names must be unique")
+        self.cum_weights = list(itertools.accumulate(template.weight for template in self.templates))
+        if not self.cum_weights[-1] > 0:
+            raise ValueError("At least one template needs a positive weight")
+        self.shard_index, self.shard_count = shard or (0, 1)
+
+    def requests(self) -> Iterator[PreparedRequest]:
+        """Yield an endless stream of requests drawn by weight."""
+        counters = [itertools.count(self.shard_index, self.shard_count) for _ in self.templates]
+        total = self.cum_weights[-1]
+        rows = self.rows or [{}]
+        while True:
+            i = bisect.bisect_right(self.cum_weights, random.random() * total)
+            seq = next(counters[i])
+            yield self.templates[i].render(seq, rows[seq % len(rows)])
@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import time
+import tracemalloc
+from typing import Any, Dict, List, Sequence
+
+try:
+    from .engine_benchmark import run_stub_server, wait_for_server
+    from .http_load_tester import HTTPLoadTester
+except ImportError:
+    from engine_benchmark import run_stub_server, wait_for_server
+    from http_load_tester import HTTPLoadTester
+
+# Metrics compared between two result files, and whether higher values are better
+COMPARED_METRICS = {
+    'achieved_qps': True,
+    'requests_per_cpu_second': True,
+    'jitter_p99_ms': False,
+    'report_ms': False,
+    'peak_bytes_per_request': False,
+    'retained_bytes_per_request': False
+}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _run_case(tester: HTTPLoadTester) -> Dict[str, Any]:
+    """Run one test and return its throughput, CPU cost and report-generation time."""
+    cpu_start = time.process_time()
+    await tester.run_test()
+    cpu_seconds = time.process_time() - cpu_start
+
+    report_start = time.perf_counter()
+    results = tester.generate_report()
+    report_ms = (time.perf_counter() - report_start) * 1000
+    total_requests = results['total_requests'] if results else 0
+    return {
+        'total_requests': total_requests,
+        'achieved_qps': results['achieved_qps'] if results else 0,
+        'error_rate': results['error_rate'] if results else 0,
+        'p99_latency': results['p99_latency'] if results else 0,
+        'cpu_seconds': cpu_seconds,
+        'requests_per_cpu_second': total_requests / cpu_seconds if cpu_seconds else 0,
+        'report_ms': report_ms
+    }
+
+
+async def open_loop_case(url: str, qps: float, concurrency: int, duration: float, engine: str) -> Dict[str, Any]:
+    """Send at ``qps`` and measure how far sends drift from their schedule."""
+    tester = HTTPLoadTester(url=url, qps=qps, duration=duration, concurrency=concurrency,
+                            connection_limit=concurrency, engine=engine)
+    case = {'case': 'open_loop', 'target_qps': qps, 'concurrency': concurrency}
+    case.update(await _run_case(tester))
+    # Scheduling jitter is the generator monitor's send drift
+    jitter = tester.monitor.send_drift
+    case.update({
+        'jitter_p50_ms': jitter.percentile(50),
+        'jitter_p99_ms': jitter.percentile(99),
+        'jitter_max_ms': jitter.max if jitter.count else 0,
+        'late_sends': tester.late_sends,
+        'dropped_sends': tester.dropped_sends,
+        'event_loop_lag_p99_ms': tester.monitor.loop_lag.percentile(99)
+    })
+    return case
+
+
+async def closed_loop_case(url: str, concurrency: int, duration: float, engine: str) -> Dict[str, Any]:
+    """Run ``concurrency`` users without think time: the achieved rate is the generator's ceiling."""
+    tester = HTTPLoadTester(url=url, qps=0, duration=duration, mode='closed', concurrency=concurrency,
+                            connection_limit=concurrency, engine=engine)
+    case = {'case': 'max_rps', 'concurrency': concurrency}
+    case.update(await _run_case(tester))
+    return case
+
+
+async def memory_case(url: str, qps: float, concurrency: int, duration: float, engine: str) -> Dict[str, Any]:
+    """Trace Python allocations over a run at ``qps``.
+
+    ``peak_bytes_per_request`` spreads the peak above the starting point
+    over the requests sent; ``retained_bytes_per_request`` is what was
+    still allocated once the test was over, which should stay near zero
+    because results go into fixed-size histograms. Tracing slows the
+    generator down, so this case runs on its own.
+    """
+    tracemalloc.start()
+    try:
+        tester = HTTPLoadTester(url=url, qps=qps, duration=duration, concurrency=concurrency,
+                                connection_limit=concurrency, engine=engine)
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await tester.run_test()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    total_requests = tester.latency_histogram.count + tester.error_count
+    return {
+        'case': 'memory',
+        'target_qps': qps,
+        'concurrency': concurrency,
+        'total_requests': total_requests,
+        'peak_bytes': peak - before,
+        'peak_bytes_per_request': (peak - before) / total_requests if total_requests else 0,
+        'retained_bytes_per_request': (after - before) / total_requests if total_requests else 0
+    }
+
+
+def run_benchmark(qps_levels: Sequence[float] = (100, 500, 1000, 2000),
+                  concurrency_levels: Sequence[int] = (10, 50, 100), duration: float = 2,
+                  latency_ms: float = 0, payload_size: int = 64, engine: str = 'aiohttp',
+                  port: int = 8099) -> Dict[str, Any]:
+    """Benchmark the load generator itself against a local stub server.
+
+    Open-loop cases run at every rate in ``qps_levels`` (with the highest
+    concurrency level), closed-loop cases at every level in
+    ``concurrency_levels``, and one memory case at the lowest rate. The
+    server runs in its own process, so CPU times only count the generator;
+    ``port`` 0 runs it on any free port.
+    """
+    # Bound here, so that port 0 picks a free port the URL can name
+    sock = socket.create_server(('127.0.0.1', port))
+    port = sock.getsockname()[1]
+    url = f'http://127.0.0.1:{port}/'
+    max_concurrency = max(concurrency_levels)
+    server = multiprocessing.Process(target=run_stub_server, args=(port, payload_size, latency_ms / 1000, sock),
+                                     daemon=True)
+    server.start()
+    sock.close()
+    try:
+        asyncio.run(wait_for_server(url))
+        cases = [asyncio.run(open_loop_case(url, qps, max_concurrency, duration, engine)) for qps in qps_levels]
+        cases += [asyncio.run(closed_loop_case(url, concurrency, duration, engine))
+                  for concurrency in concurrency_levels]
+        cases.append(asyncio.run(memory_case(url, min(qps_levels), max_concurrency, duration, engine)))
+    finally:
+        server.terminate()
+        server.join()
+
+    return {
+        'commit': _git_commit(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'qps_levels': list(qps_levels),
+            'concurrency_levels': list(concurrency_levels),
+            'duration': duration,
+            'latency_ms': latency_ms,
+            'payload_size': payload_size,
+            'engine': engine
+        },
+        'cases': cases
+    }
+
+
+def _case_key(case: Dict[str, Any]) -> tuple:
+    return case['case'], case.get('target_qps'), case.get('concurrency')
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Pair up the cases of two benchmark results and compute the change of every compared metric.
+
+    ``change`` is the relative difference from the baseline; ``better``
+    says whether it goes in the good direction for the metric.
+    """
+    baseline_cases = {_case_key(case): case for case in baseline['cases']}
+    comparison = []
+    for case in current['cases']:
+        before = baseline_cases.get(_case_key(case))
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if metric not in case or metric not in before:
+                continue
+            change = (case[metric] - before[metric]) / before[metric] if before[metric] else None
+            comparison.append({
+                'case': case['case'],
+                'target_qps': case.get('target_qps'),
+                'concurrency': case.get('concurrency'),
+                'metric': metric,
+                'baseline': before[metric],
+                'current': case[metric],
+                'change': change,
+                'better': None if change is None else (change > 0) == higher_is_better
+            })
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the load generator's own limits against a local "
+                                                 "stub server")
+    parser.add_argument('--qps', type=float, nargs='+', default=[100, 500, 1000, 2000],
+                        help='Rates of the open-loop (scheduling jitter) cases')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 100],
+                        help='Virtual users of the closed-loop (maximum RPS) cases')
+    parser.add_argument('--duration', type=float, default=2, help='Seconds to run each case')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Stub server response delay in milliseconds')
+    parser.add_argument('--payload-size', type=int, default=64, help='Stub server response body size in bytes')
+    parser.add_argument('--engine', type=str, default='aiohttp', choices=['aiohttp', 'raw'],
+                        help='HTTP client engine to benchmark')
+    parser.add_argument('--port', type=int, default=8099, help='Port of the local stub server (0 for any free port)')
+    parser.add_argument('--output', type=str, default='output/self_benchmark.json',
+                        help='File to write the results to as JSON')
+    parser.add_argument('--compare', type=str, help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.qps, args.concurrency, args.duration, args.latency_ms, args.payload_size,
+                            args.engine, args.port)
+    if args.compare:
+        with open(args.compare) as f:
+            results['comparison'] = compare_results(json.load(f), results)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
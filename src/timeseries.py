@@ -0,0 +1,266 @@
+import base64
+import math
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .errors import ERROR_CLASSES
+except ImportError:
+    from errors import ERROR_CLASSES
+
+# Length of an interval at the start of a run, and how many intervals are
+# kept before adjacent ones are merged
+TIMESERIES_INTERVAL = 1.0
+TIMESERIES_CAPACITY = 3600
+
+# Per-interval latency buckets: log-spaced, 20 per decade (about 12% wide),
+# from 10 microseconds up to about 17 minutes
+LATENCY_LOWEST_MS = 0.01
+LATENCY_BUCKETS_PER_DECADE = 20
+LATENCY_BUCKET_COUNT = 160
+
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+
+
+def bucket_percentiles(latency: np.ndarray, percentiles: Iterable[float]) -> np.ndarray:
+    """Return every row of per-bucket latency counts (rows) by percentile (columns).
+
+    Values are the upper bound of the matching latency bucket, and 0 for
+    rows without responses.
+    """
+    percentiles = np.asarray(list(percentiles), dtype=float)
+    cumulative = np.cumsum(latency, axis=1, dtype=np.int64)
+    counts = cumulative[:, -1:] if len(latency) else np.zeros((0, 1), dtype=np.int64)
+    ranks = np.maximum(np.ceil(counts * percentiles / 100), 1)
+    # Index of the first bucket whose cumulative count reaches each rank
+    indices = (cumulative[:, np.newaxis, :] < ranks[:, :, np.newaxis]).sum(axis=2)
+    upper_bounds = LATENCY_LOWEST_MS * 10 ** (np.arange(1, LATENCY_BUCKET_COUNT + 1) / LATENCY_BUCKETS_PER_DECADE)
+    return np.where(counts > 0, upper_bounds[np.minimum(indices, LATENCY_BUCKET_COUNT - 1)], 0)
+
+
+class TimeSeries:
+    """Per-interval counters and latency histograms over the course of a run.
+
+    Every interval holds the number of requests, errors per error class,
+    bytes received, responses per status class and a coarse latency
+    histogram, all in arrays preallocated for ``capacity`` intervals. A
+    run that outgrows them merges every pair of adjacent intervals and
+    doubles the interval length, so memory stays fixed however long the
+    test runs while the whole run, warm-up included, stays visible.
+
+    The interval being recorded is counted in plain Python ints, which
+    are much cheaper to bump than numpy elements, and added to the arrays
+    when recording moves on to another interval. Reads add the pending
+    counts to what they return without moving them, so reading from
+    another thread never loses a record.
+    """
+
+    def __init__(self, interval: float = TIMESERIES_INTERVAL, capacity: int = TIMESERIES_CAPACITY):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if capacity < 2 or capacity % 2:
+            raise ValueError("capacity must be an even number of at least 2")
+        self.base_interval = interval
+        self.interval = interval
+        self.capacity = capacity
+        self.requests = np.zeros(capacity, dtype=np.int64)
+        self.errors = np.zeros(capacity, dtype=np.int64)
+        self.error_classes = np.zeros((capacity, len(ERROR_CLASSES)), dtype=np.int64)
+        self.bytes_received = np.zeros(capacity, dtype=np.int64)
+        self.status_classes = np.zeros((capacity, len(STATUS_CLASSES)), dtype=np.int64)
+        self.latency = np.zeros((capacity, LATENCY_BUCKET_COUNT), dtype=np.uint32)
+        # Intervals in use, up to the last one anything was recorded in
+        self.length = 0
+        # Interval the pending counts below belong to, None when there are none
+        self._pending_row = None
+        self._reset_pending()
+
+    def _reset_pending(self):
+        self._pending_requests = 0
+        self._pending_errors = 0
+        self._pending_error_classes = [0] * len(ERROR_CLASSES)
+        self._pending_bytes = 0
+        self._pending_status_classes = [0] * len(STATUS_CLASSES)
+        self._pending_latency = [0] * LATENCY_BUCKET_COUNT
+
+    def flush(self):
+        """Add the pending counts of the interval being recorded to the arrays; only the recorder calls this."""
+        row = self._pending_row
+        if row is None:
+            return
+        self.requests[row] += self._pending_requests
+        self.errors[row] += self._pending_errors
+        self.error_classes[row] += self._pending_error_classes
+        self.bytes_received[row] += self._pending_bytes
+        self.status_classes[row] += self._pending_status_classes
+        self.latency[row] += np.array(self._pending_latency, dtype=np.uint32)
+        self._pending_row = None
+        self._reset_pending()
+
+    def _pending(self) -> Tuple[Optional[int], Dict[str, Any]]:
+        """Return the pending interval and a copy of its counts, leaving them in place."""
+        return self._pending_row, {
+            'requests': self._pending_requests,
+            'errors': self._pending_errors,
+            'error_classes': list(self._pending_error_classes),
+            'bytes_received': self._pending_bytes,
+            'status_classes': list(self._pending_status_classes),
+            'latency': list(self._pending_latency)
+        }
+
+    def _snapshot(self) -> Tuple[float, Dict[str, np.ndarray]]:
+        """Return the interval length and copies of the intervals in use, pending counts included."""
+        interval = self.interval
+        row, pending = self._pending()
+        n = self.length
+        arrays = {name: array[:n].copy() for name, array in zip(pending, self._arrays())}
+        if row is not None and row < n:
+            for name, counts in pending.items():
+                arrays[name][row] += np.asarray(counts, dtype=arrays[name].dtype)
+        return interval, arrays
+
+    def _arrays(self) -> List[np.ndarray]:
+        return [self.requests, self.errors, self.error_classes, self.bytes_received, self.status_classes,
+                self.latency]
+
+    def _row(self, elapsed: float):
+        """Make the interval ``elapsed`` seconds into the run falls in the pending one, merging intervals if needed."""
+        row = int(elapsed / self.interval) if elapsed > 0 else 0
+        if row == self._pending_row:
+            return
+        self.flush()
+        while row >= self.capacity:
+            self._coarsen()
+            row = int(elapsed / self.interval)
+        if row >= self.length:
+            self.length = row + 1
+        self._pending_row = row
+
+    def _coarsen(self):
+        """Merge every pair of adjacent intervals into one of twice the length."""
+        self.flush()
+        half = self.capacity // 2
+        for array in self._arrays():
+            array[:half] = array[0::2] + array[1::2]
+            array[half:] = 0
+        self.interval *= 2
+        self.length = (self.length + 1) // 2
+
+    @staticmethod
+    def latency_bucket(latency_ms: float) -> int:
+        if latency_ms <= LATENCY_LOWEST_MS:
+            return 0
+        return min(int(math.log10(latency_ms / LATENCY_LOWEST_MS) * LATENCY_BUCKETS_PER_DECADE),
+                   LATENCY_BUCKET_COUNT - 1)
+
+    def record(self, elapsed: float, latency_ms: float, status: int, nbytes: int = 0):
+        """Count a response completed ``elapsed`` seconds into the run."""
+        self._row(elapsed)
+        self._pending_requests += 1
+        self._pending_bytes += nbytes
+        self._pending_status_classes[min(max(status // 100, 1), len(STATUS_CLASSES)) - 1] += 1
+        self._pending_latency[self.latency_bucket(latency_ms)] += 1
+
+    def record_error(self, elapsed: float, error_class: str = 'other'):
+        """Count a request that failed without a response ``elapsed`` seconds into the run."""
+        self._row(elapsed)
+        self._pending_requests += 1
+        self._pending_errors += 1
+        self._pending_error_classes[ERROR_CLASSES.index(error_class)] += 1
+
+    def percentiles(self, percentiles: Iterable[float]) -> np.ndarray:
+        """Return an array of every interval in use (rows) by percentile (columns), as ``bucket_percentiles``."""
+        return bucket_percentiles(self._snapshot()[1]['latency'], percentiles)
+
+    def totals(self) -> Dict[str, np.ndarray]:
+        """Return every counter summed over the run so far.
+
+        Merging intervals keeps the totals, so the difference of two calls
+        covers what was recorded in between; live windows are read this way.
+        """
+        row, pending = self._pending()
+        n = self.length
+        totals = {
+            'requests': self.requests[:n].sum(),
+            'errors': self.errors[:n].sum(),
+            'error_classes': self.error_classes[:n].sum(axis=0),
+            'bytes_received': self.bytes_received[:n].sum(),
+            'status_classes': self.status_classes[:n].sum(axis=0),
+            'latency': self.latency[:n].sum(axis=0, dtype=np.int64)
+        }
+        if row is not None:
+            for name, counts in pending.items():
+                totals[name] = totals[name] + np.asarray(counts, dtype=np.int64)
+        return totals
+
+    def merge(self, other: 'TimeSeries') -> 'TimeSeries':
+        """Add another run's intervals (e.g. a worker's, started at the same instant) to this one."""
+        if (other.base_interval, other.capacity) != (self.base_interval, self.capacity):
+            raise ValueError("Cannot merge time series with different layouts")
+        self.flush()
+        # Work on a copy of ``other`` rather than flushing or coarsening it
+        if other._pending_row is not None or other.interval < self.interval:
+            other = TimeSeries.from_dict(other.to_dict())
+            while other.interval < self.interval:
+                other._coarsen()
+        while self.interval < other.interval:
+            self._coarsen()
+        for array, other_array in zip(self._arrays(), other._arrays()):
+            array += other_array
+        self.length = max(self.length, other.length)
+        return self
+
+    def report(self) -> Dict[str, Any]:
+        """Return the intervals in use as one list per metric; the last interval may be cut short."""
+        interval, arrays = self._snapshot()
+        n = len(arrays['requests'])
+        p50, p90, p99 = bucket_percentiles(arrays['latency'], [50, 90, 99]).T if n else ([], [], [])
+        error_classes, status_classes = arrays['error_classes'], arrays['status_classes']
+        return {
+            'interval': interval,
+            'start': [i * interval for i in range(n)],
+            'requests': arrays['requests'].tolist(),
+            'qps': (arrays['requests'] / interval).tolist(),
+            'errors': arrays['errors'].tolist(),
+            'error_classes': {name: error_classes[:, i].tolist()
+                              for i, name in enumerate(ERROR_CLASSES) if error_classes[:, i].any()},
+            'bytes_received': arrays['bytes_received'].tolist(),
+            'status_classes': {name: status_classes[:, i].tolist()
+                               for i, name in enumerate(STATUS_CLASSES) if status_classes[:, i].any()},
+            'p50_latency': list(map(float, p50)),
+            'p90_latency': list(map(float, p90)),
+            'p99_latency': list(map(float, p99))
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the intervals in use to a JSON-friendly dict with zlib-compressed histograms."""
+        interval, arrays = self._snapshot()
+        return {
+            'base_interval': self.base_interval,
+            'interval': interval,
+            'capacity': self.capacity,
+            'length': len(arrays['requests']),
+            'requests': arrays['requests'].tolist(),
+            'errors': arrays['errors'].tolist(),
+            'error_classes': arrays['error_classes'].tolist(),
+            'bytes_received': arrays['bytes_received'].tolist(),
+            'status_classes': arrays['status_classes'].tolist(),
+            'latency': base64.b64encode(zlib.compress(arrays['latency'].tobytes())).decode('ascii')
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TimeSeries':
+        timeseries = cls(data['base_interval'], data['capacity'])
+        timeseries.interval = data['interval']
+        n = timeseries.length = data['length']
+        timeseries.requests[:n] = data['requests']
+        timeseries.errors[:n] = data['errors']
+        timeseries.bytes_received[:n] = data['bytes_received']
+        if n:
+            timeseries.status_classes[:n] = data['status_classes']
+            timeseries.error_classes[:n] = data['error_classes']
+            latency = np.frombuffer(zlib.decompress(base64.b64decode(data['latency'])), dtype=np.uint32)
+            timeseries.latency[:n] = latency.reshape(n, LATENCY_BUCKET_COUNT)
+        return timeseries
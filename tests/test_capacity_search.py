@@ -0,0 +1,122 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+
+from src.capacity_search import CapacitySearch
+
+
+class FakeLoadTester:
+    """Stands in for HTTPLoadTester: p99 grows with the rate and crosses 100 ms at 337 req/s."""
+
+    CAPACITY = 337
+
+    def __init__(self, url, qps, duration, **kwargs):
+        self.qps = qps
+
+    async def run_test(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def generate_report(self):
+        p99 = 100 * self.qps / self.CAPACITY
+        return {
+            'total_requests': int(self.qps),
+            'achieved_qps': self.qps,
+            'error_rate': 0,
+            'dropped_sends': 0,
+            'p50_latency': p99 / 2,
+            'p90_latency': p99 * 0.8,
+            'p99_latency': p99,
+            'p99_response_time': p99
+        }
+
+
+class TestCapacitySearch(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.config = {'url': 'http://localhost:8087/'}
+
+    def _search(self, **options):
+        search = CapacitySearch(self.config, max_p99_ms=100, **options)
+        with patch('src.capacity_search.HTTPLoadTester', FakeLoadTester):
+            return search, self.loop.run_until_complete(search.run())
+
+    def test_bisect_finds_limit_within_tolerance(self):
+        search, report = self._search(min_qps=10, max_qps=1000, tolerance=0.02)
+
+        self.assertTrue(report['converged'])
+        self.assertLessEqual(report['sustainable_qps'], FakeLoadTester.CAPACITY)
+        self.assertGreater(report['limit_qps'], FakeLoadTester.CAPACITY)
+        self.assertLessEqual(report['limit_qps'] - report['sustainable_qps'], 0.02 * report['limit_qps'])
+        # Bounds first, then bisection
+        self.assertEqual([probe['target_qps'] for probe in report['probes'][:3]], [1000, 10, 505])
+        self.assertEqual(report['probes'][0]['violations'], ['p99_latency'])
+        rates = [point['target_qps'] for point in report['latency_curve']]
+        self.assertEqual(rates, sorted(rates))
+
+    def test_aimd_finds_limit_within_tolerance(self):
+        search, report = self._search(strategy='aimd', min_qps=10, max_qps=1000, tolerance=0.05)
+
+        self.assertTrue(report['converged'])
+        self.assertLessEqual(report['sustainable_qps'], FakeLoadTester.CAPACITY)
+        self.assertLessEqual(report['limit_qps'] - report['sustainable_qps'], 0.05 * report['limit_qps'])
+        # Additive increase from the lowest rate until the first failure
+        self.assertEqual([probe['target_qps'] for probe in report['probes'][:4]], [10, 109, 208, 307])
+
+    def test_stops_at_bounds(self):
+        _, report = self._search(min_qps=10, max_qps=200)
+        self.assertEqual(report['sustainable_qps'], 200)
+        self.assertEqual(len(report['probes']), 1)
+
+        _, report = self._search(min_qps=400, max_qps=1000)
+        self.assertEqual(report['sustainable_qps'], 0)
+        self.assertEqual(report['limit_qps'], 400)
+        self.assertTrue(report['converged'])
+
+    def test_max_probes(self):
+        _, report = self._search(min_qps=10, max_qps=1000, tolerance=0.0001, max_probes=5)
+
+        self.assertEqual(len(report['probes']), 5)
+        self.assertFalse(report['converged'])
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            CapacitySearch(self.config, max_p99_ms=100, strategy='random')
+        with self.assertRaises(ValueError):
+            CapacitySearch(self.config, max_p99_ms=100, min_qps=100, max_qps=10)
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_search_against_local_server(self):
+        async def handler(request):
+            return web.Response(text="ok")
+
+        app = web.Application()
+        app.router.add_get('/', handler)
+
+        async def run():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, 'localhost', 8087).start()
+            try:
+                search = CapacitySearch(self.config, max_p99_ms=1000, min_qps=5, max_qps=40,
+                                        probe_duration=0.5)
+                return await search.run()
+            finally:
+                await runner.cleanup()
+
+        report = self.loop.run_until_complete(run())
+
+        self.assertEqual(report['sustainable_qps'], 40)
+        self.assertEqual(report['probes'][0]['total_requests'], 20)
+        self.assertTrue(report['probes'][0]['passed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
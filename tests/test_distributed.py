@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+from werkzeug.serving import make_server
+
+from src.distributed import agent_stream, run_distributed
+from src.http_load_tester import HTTPLoadTester
+
+# api.py is written to run from inside src/, like in the Docker image
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import api  # noqa: E402
+
+
+async def stub_handler(request):
+    await asyncio.sleep(0.01)
+    return web.Response(text="stub")
+
+
+class TestDistributed(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # Registered first so it runs after the server cleanups
+        self.addCleanup(self.loop.close)
+
+    def _start_stub_server(self, port):
+        app = web.Application()
+        app.router.add_get('/', stub_handler)
+        runner = web.AppRunner(app)
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.TCPSite(runner, 'localhost', port).start())
+        self.addCleanup(lambda: self.loop.run_until_complete(runner.cleanup()))
+
+    def _start_agent(self):
+        server = make_server('localhost', 0, api.app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.shutdown)
+        return f"http://localhost:{server.server_port}"
+
+    def test_agent_stream(self):
+        self._start_stub_server(8082)
+        config = {'url': 'http://localhost:8082', 'qps': 20, 'duration': 1.5}
+
+        async def collect():
+            return await self.loop.run_in_executor(
+                None, lambda: [json.loads(line) for line in agent_stream(config, progress_interval=0.5)])
+
+        messages = self.loop.run_until_complete(collect())
+
+        self.assertGreaterEqual(len([m for m in messages if m['type'] == 'progress']), 1)
+        self.assertEqual(messages[-1]['type'], 'result')
+        self.assertEqual(messages[-1]['state']['status_codes'], {'200': 30})
+
+    def test_closed_agent_stream_stops_the_test(self):
+        self._start_stub_server(8082)
+        config = {'url': 'http://localhost:8082', 'qps': 20, 'duration': 30}
+
+        with patch.object(HTTPLoadTester, 'stop', autospec=True, side_effect=HTTPLoadTester.stop) as stop:
+            stream = agent_stream(config, progress_interval=0.2)
+            self.assertEqual(json.loads(next(stream))['type'], 'progress')
+            # What Flask does when the coordinator disconnects
+            stream.close()
+
+        stop.assert_called_once()
+
+    def test_progress_is_read_on_the_test_loop(self):
+        self._start_stub_server(8082)
+        config = {'url': 'http://localhost:8082', 'qps': 20, 'duration': 30}
+        threads = []
+
+        def export_state(tester):
+            threads.append(threading.get_ident())
+            return original(tester)
+
+        original = HTTPLoadTester.export_state
+        with patch.object(HTTPLoadTester, 'export_state', autospec=True, side_effect=export_state):
+            stream = agent_stream(config, progress_interval=0.2)
+            next(stream)
+            stream.close()
+
+        # Not on the streaming thread, but on the thread running the test
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_failed_agent_cancels_the_others(self):
+        cancelled = []
+
+        async def fake_run_on_agent(session, agent, config, on_progress):
+            if agent.endswith('bad'):
+                raise RuntimeError("Agent failed")
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.append(agent)
+                raise
+
+        async def no_offset(session, agent):
+            return 0.0
+
+        config = {'url': 'http://localhost:1', 'qps': 2, 'duration': 30, 'method': 'GET'}
+        with patch('src.distributed.run_on_agent', fake_run_on_agent), \
+                patch('src.distributed.measure_clock_offset', no_offset):
+            with self.assertRaises(RuntimeError):
+                self.loop.run_until_complete(
+                    run_distributed(config, ['http://good', 'http://bad'], start_delay=0))
+
+        self.assertEqual(cancelled, ['http://good'])
+
+    def test_run_distributed_across_local_agents(self):
+        self._start_stub_server(8083)
+        agents = [self._start_agent() for _ in range(3)]
+        progress = []
+        config = {'url': 'http://localhost:8083', 'qps': 90, 'duration': 2,
+                  'method': 'GET', 'concurrency': 30}
+
+        load_tester = self.loop.run_until_complete(
+            run_distributed(config, agents, start_delay=0.5,
+                            on_progress=lambda agent, state: progress.append(agent)))
+        report = load_tester.generate_report()
+
+        self.assertAlmostEqual(report['total_requests'], 180, delta=10)
+        self.assertEqual(report['error_rate'], 0)
+        self.assertEqual(report['status_codes'], {200: report['total_requests']})
+        self.assertEqual(report['target_qps'], 90)
+        self.assertEqual(set(progress), set(agents))
+
+    def test_agent_rejects_invalid_slice(self):
+        client = api.app.test_client()
+
+        response = client.post('/agent/run-test', json={'url': 'http://localhost:1', 'qps': 1,
+                                                        'duration': 1, 'method': 'GET',
+                                                        'arrival': 'bursty'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_coordinator_requires_agents(self):
+        client = api.app.test_client()
+
+        response = client.post('/coordinator/run-test', json={'url': 'http://localhost:1', 'qps': 1,
+                                                               'duration': 1, 'method': 'GET'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,377 @@
+import asyncio
+import os
+import socket
+import time
+import unittest
+
+from aiohttp import web
+
+from src.engines import ENGINES, H2Engine, HTTPResponseParser, RawHTTPEngine, h2
+from src.http_load_tester import HTTPLoadTester
+
+if h2 is not None:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.settings
+
+
+def listening_socket():
+    """Return a socket bound to a free port on localhost, for a test server to listen on."""
+    sock = socket.socket()
+    sock.bind(('localhost', 0))
+    return sock
+
+
+class TestHTTPResponseParser(unittest.TestCase):
+
+    def _feed(self, parser, data, step=1):
+        """Feed ``data`` a few bytes at a time and return whether the response completed."""
+        done = False
+        for i in range(0, len(data), step):
+            self.assertFalse(done, "Response completed before all of its bytes arrived")
+            done = parser.feed(data[i:i + step])
+        return done
+
+    def test_content_length(self):
+        parser = HTTPResponseParser(keep_body=True)
+        self.assertTrue(self._feed(parser, b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\nX-A: b\r\n\r\nhello'))
+        self.assertEqual(parser.status, 200)
+        self.assertEqual(parser.headers['x-a'], 'b')
+        self.assertEqual(parser.body, b'hello')
+        self.assertEqual(parser.nbytes, 5)
+        self.assertTrue(parser.keep_alive)
+
+    def test_chunked(self):
+        response = (b'HTTP/1.1 201 Created\r\nTransfer-Encoding: chunked\r\n\r\n'
+                    b'5;ext=1\r\nhello\r\n7\r\n, world\r\n0\r\nX-Trailer: 1\r\n\r\n')
+        for step in (1, 3, len(response)):
+            parser = HTTPResponseParser(keep_body=True)
+            self.assertTrue(self._feed(parser, response, step))
+            self.assertEqual(parser.status, 201)
+            self.assertEqual(parser.body, b'hello, world')
+            self.assertEqual(parser.nbytes, 12)
+
+    def test_streamed_body_is_counted_not_kept(self):
+        parser = HTTPResponseParser()
+        self.assertTrue(parser.feed(b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nabc'))
+        self.assertEqual(parser.nbytes, 3)
+        self.assertEqual(parser.body, b'')
+
+    def test_close_delimited(self):
+        parser = HTTPResponseParser()
+        self.assertFalse(parser.feed(b'HTTP/1.0 200 OK\r\n\r\nabc'))
+        self.assertFalse(parser.keep_alive)
+        self.assertTrue(parser.connection_lost())
+        self.assertEqual(parser.nbytes, 3)
+
+    def test_responses_without_body(self):
+        self.assertTrue(HTTPResponseParser().feed(b'HTTP/1.1 204 No Content\r\n\r\n'))
+        self.assertTrue(HTTPResponseParser('HEAD').feed(b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n'))
+
+    def test_connection_close(self):
+        parser = HTTPResponseParser()
+        self.assertTrue(parser.feed(b'HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 0\r\n\r\n'))
+        self.assertFalse(parser.keep_alive)
+
+
+class TestRawHTTPEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.sock = listening_socket()
+        self.addCleanup(self.sock.close)
+        self.port = self.sock.getsockname()[1]
+        self.url = f'http://localhost:{self.port}/echo?x=1'
+
+    def test_prepare(self):
+        tester = HTTPLoadTester(url=self.url, qps=1, engine='raw', method='POST', data='{"a": 1}',
+                                headers={'Content-Type': 'application/json'})
+        origin, payload = tester.engine.prepare(tester.method, tester.url, tester.headers, tester.data)
+
+        self.assertEqual(origin, ('http', 'localhost', self.port))
+        self.assertEqual(payload, f'POST /echo?x=1 HTTP/1.1\r\nHost: localhost:{self.port}\r\n'.encode() +
+                                  b'User-Agent: http-load-tester\r\nAccept: */*\r\n'
+                                  b'Content-Type: application/json\r\nContent-Length: 8\r\n\r\n{"a": 1}')
+        # The configured request is prepared once
+        self.assertIs(tester.engine.prepare(tester.method, tester.url, tester.headers, tester.data)[1], payload)
+
+    def test_engine_options(self):
+        self.assertEqual(set(ENGINES), {'aiohttp', 'raw', 'h2'})
+        self.assertIsInstance(HTTPLoadTester(url=self.url, qps=1, engine='raw').engine, RawHTTPEngine)
+        with self.assertRaises(ValueError):
+            HTTPLoadTester(url=self.url, qps=1, engine='curl')
+        with self.assertRaises(ValueError):
+            HTTPLoadTester(url=self.url, qps=1, engine='raw', trace_phases=True)
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_against_local_server(self):
+        peers = set()
+
+        async def echo(request):
+            peers.add(request.transport.get_extra_info('peername'))
+            body = await request.read()
+            return web.Response(body=body or b'empty', status=201 if body else 200)
+
+        async def chunked(request):
+            response = web.StreamResponse()
+            response.enable_chunked_encoding()
+            await response.prepare(request)
+            for _ in range(3):
+                await response.write(b'x' * 1000)
+            await response.write_eof()
+            return response
+
+        app = web.Application()
+        app.router.add_route('*', '/echo', echo)
+        app.router.add_get('/chunked', chunked)
+
+        async def run():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.SockSite(runner, self.sock).start()
+            try:
+                tester = HTTPLoadTester(url=self.url, qps=40, duration=0.5, engine='raw', connection_limit=2)
+                await tester.run_test()
+                post = HTTPLoadTester(url=self.url, qps=10, duration=0.2, engine='raw', method='POST',
+                                      data=b'payload', body_mode='full', force_close=True)
+                await post.run_test()
+                stream = HTTPLoadTester(url=f'http://localhost:{self.port}/chunked', qps=10, duration=0.2,
+                                        engine='raw')
+                await stream.run_test()
+                return tester, post, stream
+            finally:
+                await runner.cleanup()
+
+        tester, post, stream = self.loop.run_until_complete(run())
+
+        results = tester.generate_report()
+        self.assertEqual(results['engine'], 'raw')
+        self.assertEqual(results['total_requests'], 20)
+        self.assertEqual(results['status_codes'], {200: 20})
+        self.assertEqual(results['bytes_received'], 20 * len(b'empty'))
+        results = post.generate_report()
+        self.assertEqual(results['status_codes'], {201: 2})
+        self.assertEqual(results['bytes_received'], 2 * len(b'payload'))
+        results = stream.generate_report()
+        self.assertEqual(results['status_codes'], {200: 2})
+        self.assertEqual(results['bytes_received'], 2 * 3000)
+        # Keep-alive: the first test reused at most connection_limit connections;
+        # the POSTs opened one each
+        self.assertLessEqual(len(peers), 2 + 2)
+
+
+class TestEngineTimeouts(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.sock = listening_socket()
+        self.addCleanup(self.sock.close)
+        self.port = self.sock.getsockname()[1]
+
+    def _run(self, testers):
+        """Run ``testers`` against a server with a stalling endpoint and return how long they took."""
+        async def fast(request):
+            return web.Response(text='ok')
+
+        async def slow(request):
+            response = web.StreamResponse()
+            await response.prepare(request)
+            await response.write(b'first')
+            # Stalls after the first piece of the body
+            await asyncio.sleep(1)
+            return response
+
+        async def run():
+            app = web.Application()
+            app.router.add_get('/', fast)
+            app.router.add_get('/slow', slow)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.SockSite(runner, self.sock).start()
+            try:
+                started = time.monotonic()
+                for tester in testers:
+                    await tester.run_test()
+                return time.monotonic() - started
+            finally:
+                await runner.cleanup()
+
+        return self.loop.run_until_complete(run())
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_read_and_total_timeouts(self):
+        testers = [HTTPLoadTester(url=f'http://localhost:{self.port}/slow', qps=10, duration=0.3, engine=engine,
+                                  **timeout)
+                   for engine in ('aiohttp', 'raw') for timeout in ({'read_timeout': 0.2}, {'total_timeout': 0.2})]
+        fast = HTTPLoadTester(url=f'http://localhost:{self.port}/', qps=10, duration=0.3, engine='raw',
+                              read_timeout=0.2, total_timeout=0.5)
+
+        elapsed = self._run(testers + [fast])
+
+        # Every stalled response timed out instead of holding the test up
+        self.assertLess(elapsed, 3.5)
+        for tester in testers:
+            with self.subTest(engine=tester.engine.name, read_timeout=tester.read_timeout):
+                self.assertEqual(tester.error_classes, {'timeout': 3})
+                self.assertEqual(tester.latency_histogram.count, 0)
+        self.assertEqual(fast.status_codes, {200: 3})
+
+
+class H2StubServer(asyncio.Protocol):
+    """Cleartext HTTP/2 (h2c) server answering every request after ``delay`` seconds.
+
+    The response body is the size of the request body, or ``ok`` without one.
+    """
+
+    def __init__(self, peers, delay=0.05, max_streams=100):
+        self.peers = peers
+        self.delay = delay
+        self.connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        self.max_streams = max_streams
+        self.bodies = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peers.add(transport.get_extra_info('peername'))
+        self.connection.initiate_connection()
+        self.connection.update_settings({h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: self.max_streams})
+        transport.write(self.connection.data_to_send())
+
+    def data_received(self, data):
+        for event in self.connection.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                self.bodies[event.stream_id] = b''
+            elif isinstance(event, h2.events.DataReceived):
+                self.bodies[event.stream_id] += event.data
+                self.connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                asyncio.get_running_loop().call_later(self.delay, self.respond, event.stream_id)
+            elif isinstance(event, h2.events.StreamReset):
+                self.bodies.pop(event.stream_id, None)
+        self.transport.write(self.connection.data_to_send())
+
+    def respond(self, stream_id):
+        if stream_id not in self.bodies:
+            # Reset by the client meanwhile
+            return
+        received = len(self.bodies.pop(stream_id))
+        body = str(received).encode() if received else b'ok'
+        self.connection.send_headers(stream_id, [(':status', '200'), ('content-length', str(len(body)))])
+        self.connection.send_data(stream_id, body, end_stream=True)
+        self.transport.write(self.connection.data_to_send())
+
+
+@unittest.skipIf(h2 is None, "h2 is not installed")
+class TestH2Engine(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.sock = listening_socket()
+        self.addCleanup(self.sock.close)
+        self.port = self.sock.getsockname()[1]
+        self.url = f'http://localhost:{self.port}/items?x=1'
+
+    def test_prepare(self):
+        tester = HTTPLoadTester(url=self.url, qps=1, engine='h2', method='POST', data='{}',
+                                headers={'Content-Type': 'application/json', 'Connection': 'keep-alive'})
+        self.assertIsInstance(tester.engine, H2Engine)
+        origin, headers, body = tester.engine.prepare(tester.method, tester.url, tester.headers, tester.data)
+
+        self.assertEqual(origin, ('http', 'localhost', self.port))
+        self.assertEqual(headers[:4], [(':method', 'POST'), (':scheme', 'http'),
+                                       (':authority', f'localhost:{self.port}'), (':path', '/items?x=1')])
+        self.assertIn(('content-type', 'application/json'), headers)
+        self.assertIn(('content-length', '2'), headers)
+        self.assertNotIn('connection', dict(headers))
+        self.assertEqual(body, b'{}')
+
+    def _run(self, testers, max_streams=100, delay=0.05):
+        peers = set()
+
+        async def run():
+            server = await self.loop.create_server(lambda: H2StubServer(peers, delay, max_streams),
+                                                   sock=self.sock)
+            try:
+                for tester in testers:
+                    await tester.run_test()
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        self.loop.run_until_complete(run())
+        return peers
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_multiplexes_streams(self):
+        # 200 req/s against 50 ms responses keeps about 10 streams open
+        tester = HTTPLoadTester(url=self.url, qps=200, duration=0.5, engine='h2')
+        post = HTTPLoadTester(url=self.url, qps=20, duration=0.5, engine='h2', method='POST',
+                              data=b'x' * 100000, body_mode='full')
+        peers = self._run([tester, post])
+
+        results = tester.generate_report()
+        self.assertEqual(results['engine'], 'h2')
+        self.assertEqual(results['status_codes'], {200: 100})
+        self.assertEqual(results['bytes_received'], 100 * len(b'ok'))
+        connection, = results['h2_connections']
+        self.assertEqual(connection['streams'], 100)
+        self.assertGreater(connection['max_concurrent_streams'], 5)
+        self.assertGreater(connection['mean_concurrent_streams'], 1)
+        # Bodies larger than the initial 64 KiB flow-control window go through
+        results = post.generate_report()
+        self.assertEqual(results['status_codes'], {200: 10})
+        self.assertEqual(results['bytes_received'], 10 * len(b'100000'))
+        self.assertEqual(len(peers), 2)
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_connections_and_stream_limit(self):
+        tester = HTTPLoadTester(url=self.url, qps=400, duration=0.25, engine='h2', h2_connections=2,
+                                h2_max_streams=50)
+        peers = self._run([tester], max_streams=3)
+
+        results = tester.generate_report()
+        self.assertEqual(results['status_codes'], {200: 100})
+        self.assertEqual(len(peers), 2)
+        self.assertEqual(len(results['h2_connections']), 2)
+        # The server allows 3 streams per connection, below h2_max_streams
+        for connection in results['h2_connections']:
+            self.assertGreater(connection['streams'], 0)
+            self.assertLessEqual(connection['max_concurrent_streams'], 3)
+        self.assertEqual(sum(c['streams'] for c in results['h2_connections']), 100)
+
+    def test_timeouts_reset_streams(self):
+        tester = HTTPLoadTester(url=self.url, qps=20, duration=0.25, engine='h2', read_timeout=0.1)
+        total = HTTPLoadTester(url=self.url, qps=20, duration=0.25, engine='h2', total_timeout=0.1)
+        peers = self._run([tester, total], delay=1)
+
+        for timed_out in (tester, total):
+            self.assertEqual(timed_out.error_classes, {'timeout': 5})
+        # Abandoned streams are reset, and the connection stays in use
+        self.assertEqual(len(peers), 2)
+        connection, = tester.generate_report()['h2_connections']
+        self.assertEqual(connection['streams'], 5)
+        self.assertLessEqual(connection['max_concurrent_streams'], 3)
+
+    def test_failed_connections_are_not_reported(self):
+        # Nothing listens on port 1, so no connection gets as far as the server's settings
+        tester = HTTPLoadTester(url='http://localhost:1/', qps=20, duration=0.25, engine='h2')
+        self.loop.run_until_complete(tester.run_test())
+
+        self.assertEqual(tester.latency_histogram.count, 0)
+        self.assertEqual(tester.engine.connection_stats, [])
+
+    def test_state_round_trip(self):
+        tester = HTTPLoadTester(url=self.url, qps=10, duration=0.2, engine='h2')
+        merged = HTTPLoadTester(url=self.url, qps=1, engine='h2')
+        self._run([tester])
+        merged.merge_state(tester.export_state())
+        merged.merge_state(tester.export_state())
+        self.assertEqual(len(merged.generate_report()['h2_connections']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import asyncio
+import socket
+import ssl
+import unittest
+from unittest.mock import Mock, patch
+
+import aiohttp
+
+from src.errors import ErrorLog, classify_error
+from src.http_load_tester import HTTPLoadTester
+
+
+class TestClassifyError(unittest.TestCase):
+
+    def test_classes(self):
+        connection_key = Mock(host='localhost', port=80, ssl=True)
+        cases = [
+            (asyncio.TimeoutError(), 'timeout'),
+            (aiohttp.ServerTimeoutError('read timeout'), 'timeout'),
+            (ssl.SSLError('handshake failure'), 'tls'),
+            (socket.gaierror(-2, 'Name or service not known'), 'dns'),
+            (ConnectionRefusedError(111, 'Connection refused'), 'connection_refused'),
+            (aiohttp.ClientConnectorError(connection_key, ConnectionRefusedError(111, 'Connection refused')),
+             'connection_refused'),
+            (ConnectionResetError('Connection closed'), 'connection_reset'),
+            (aiohttp.ServerDisconnectedError(), 'connection_reset'),
+            (aiohttp.ClientPayloadError('Response payload is not completed'), 'payload'),
+            (ValueError("invalid literal for int() with base 16: b'zz'"), 'payload'),
+            (aiohttp.InvalidURL('not a url'), 'other'),
+            (RuntimeError('boom'), 'other'),
+        ]
+        for exception, expected in cases:
+            with self.subTest(exception=type(exception).__name__):
+                self.assertEqual(classify_error(exception), expected)
+
+    def test_wrapped_cause(self):
+        try:
+            try:
+                raise socket.gaierror(-2, 'Name or service not known')
+            except socket.gaierror as e:
+                raise RuntimeError('lookup failed') from e
+        except RuntimeError as e:
+            self.assertEqual(classify_error(e), 'dns')
+
+
+class TestErrorLog(unittest.TestCase):
+
+    def test_samples_and_rate_limit(self):
+        error_log = ErrorLog(samples=2, log_interval=60)
+        with self.assertLogs('http_load_tester.errors', 'WARNING') as logs:
+            for i in range(100):
+                error_log.record('connection_reset', ConnectionResetError(f'reset {i % 3}'))
+            error_log.record('timeout', asyncio.TimeoutError())
+
+        # One line per class within the interval, however many failures
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('connection_reset', logs.output[0])
+        self.assertEqual(error_log.samples['connection_reset'],
+                         ['ConnectionResetError: reset 0', 'ConnectionResetError: reset 1'])
+
+        error_log._next_log['connection_reset'] = 0
+        with self.assertLogs('http_load_tester.errors', 'WARNING') as logs:
+            error_log.record('connection_reset', ConnectionResetError('reset'))
+        self.assertIn('99 more since the last message', logs.output[0])
+
+    def test_merge_state(self):
+        error_log = ErrorLog(samples=2)
+        error_log.merge_state({'dns': ['a', 'b', 'c']})
+        error_log.merge_state({'dns': ['a'], 'tls': ['d']})
+        self.assertEqual(error_log.export_state(), {'dns': ['a', 'b'], 'tls': ['d']})
+
+
+class TestTesterErrorClasses(unittest.TestCase):
+
+    def test_refused_connections(self):
+        # Nothing listens on this port
+        tester = HTTPLoadTester(url='http://127.0.0.1:8095/', qps=20, duration=0.5)
+        with patch('builtins.print') as mock_print:
+            asyncio.run(tester.run_test())
+        results = tester.generate_report()
+
+        mock_print.assert_not_called()
+        self.assertEqual(results['error_classes'], {'connection_refused': tester.error_count})
+        self.assertEqual(len(results['error_samples']['connection_refused']), 1)
+        self.assertEqual(sum(results['timeseries']['error_classes']['connection_refused']), tester.error_count)
+        self.assertEqual(sum(window['error_classes'].get('connection_refused', 0) for window in tester.windows),
+                         tester.error_count)
+
+        merged = HTTPLoadTester(url='http://127.0.0.1:8095/', qps=20)
+        merged.merge_state(tester.export_state())
+        self.assertEqual(merged.generate_report()['error_samples'], results['error_samples'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,90 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from src.generator_monitor import GeneratorMonitor, LOOP_LAG_THRESHOLD_MS, SEND_DRIFT_THRESHOLD_MS
+from src.http_load_tester import HTTPLoadTester
+
+
+class TestGeneratorMonitor(unittest.TestCase):
+
+    def test_in_flight_and_drift(self):
+        monitor = GeneratorMonitor(concurrency=10)
+        monitor.request_started(5)
+        monitor.request_started(None)
+        monitor.request_finished()
+        monitor.request_started(50)
+
+        self.assertEqual(monitor.in_flight, 2)
+        self.assertEqual(monitor.max_in_flight, 2)
+        self.assertEqual(monitor.send_drift.count, 2)
+        window = monitor.close_window(1.0)
+        self.assertEqual(window['max_in_flight'], 2)
+        self.assertEqual(window['send_drift_ms'], 50)
+        # A new window starts from what is still in flight
+        self.assertEqual(monitor.close_window(1.0)['max_in_flight'], 2)
+
+    def test_bound_reasons(self):
+        monitor = GeneratorMonitor(concurrency=10)
+        self.assertEqual(monitor.bound_reasons(), [])
+        self.assertFalse(monitor.report()['bound'])
+
+        monitor.loop_lag.record(LOOP_LAG_THRESHOLD_MS * 5)
+        monitor.send_drift.record(SEND_DRIFT_THRESHOLD_MS * 5)
+        monitor.cpu_percent = 99
+        self.assertEqual(monitor.bound_reasons(dropped_sends=3),
+                         ['event_loop_lag', 'send_drift', 'cpu', 'concurrency_limit'])
+        report = monitor.report()
+        self.assertTrue(report['bound'])
+        self.assertEqual(report['in_flight']['limit'], 10)
+
+    def test_merge_state(self):
+        first, second = GeneratorMonitor(concurrency=10), GeneratorMonitor(concurrency=10)
+        first.request_started(1)
+        first.cpu_percent = 20
+        second.request_started(3)
+        second.request_started(3)
+        second.cpu_percent = 95
+
+        first.merge_state(second.export_state())
+
+        self.assertEqual(first.send_drift.count, 3)
+        self.assertEqual(first.max_in_flight, 2)
+        self.assertEqual(first.cpu_percent, 95)
+
+    def test_blocked_event_loop_is_generator_bound(self):
+        async def blocking_send(session, method, url, headers, data, trace_marks=None):
+            # Blocks the event loop the way an overloaded client does
+            time.sleep(0.03)
+            return 200, 0
+
+        tester = HTTPLoadTester(url='http://localhost:8080/', qps=100, duration=0.5)
+        with patch.object(tester.engine, 'send', blocking_send):
+            asyncio.run(tester.run_test())
+        results = tester.generate_report()
+
+        self.assertTrue(results['generator_bound'])
+        self.assertIn('event_loop_lag', results['generator']['bound_reasons'])
+        self.assertIn('send_drift', results['generator']['bound_reasons'])
+        self.assertGreater(results['generator']['event_loop_lag']['max'], LOOP_LAG_THRESHOLD_MS)
+        self.assertIn('event_loop_lag_ms', tester.windows[0])
+        self.assertIn('cpu_percent', tester.windows[0])
+
+    def test_idle_generator_is_not_bound(self):
+        async def send(session, method, url, headers, data, trace_marks=None):
+            await asyncio.sleep(0.01)
+            return 200, 0
+
+        tester = HTTPLoadTester(url='http://localhost:8080/', qps=20, duration=0.5)
+        with patch.object(tester.engine, 'send', send):
+            asyncio.run(tester.run_test())
+        results = tester.generate_report()
+
+        self.assertFalse(results['generator_bound'])
+        self.assertEqual(results['generator']['bound_reasons'], [])
+        self.assertGreaterEqual(results['generator']['in_flight']['max'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
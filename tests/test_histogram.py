@@ -0,0 +1,122 @@
+import unittest
+import json
+
+import numpy as np
+
+from src.histogram import LatencyHistogram
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.samples = rng.lognormal(mean=3, sigma=1, size=20000)
+
+    def _record_all(self, histogram, samples):
+        for sample in samples:
+            histogram.record(float(sample))
+        return histogram
+
+    def test_percentiles_within_precision(self):
+        histogram = self._record_all(LatencyHistogram(significant_digits=3), self.samples)
+
+        for p in (50, 90, 95, 99, 99.9):
+            with self.subTest(percentile=p):
+                expected = np.percentile(self.samples, p, method='inverted_cdf')
+                self.assertAlmostEqual(histogram.percentile(p), expected, delta=expected * 2e-3)
+
+    def test_exact_aggregates(self):
+        histogram = self._record_all(LatencyHistogram(), self.samples)
+
+        self.assertEqual(histogram.count, len(self.samples))
+        self.assertAlmostEqual(histogram.mean, self.samples.mean())
+        self.assertEqual(histogram.min, self.samples.min())
+        self.assertEqual(histogram.max, self.samples.max())
+        self.assertEqual(histogram.percentile(100), self.samples.max())
+
+    def test_memory_is_constant(self):
+        histogram = LatencyHistogram()
+        size = histogram.counts.nbytes
+        self._record_all(histogram, self.samples)
+        self.assertEqual(histogram.counts.nbytes, size)
+        self.assertLess(size, 512 * 1024)
+
+    def test_layout_tables_are_shared(self):
+        # Only the counters are per instance; the value lookup tables depend on the layout alone
+        first, second = LatencyHistogram(), LatencyHistogram()
+        self.assertIs(first._highest_values, second._highest_values)
+        self.assertIsNot(first._highest_values, LatencyHistogram(significant_digits=2)._highest_values)
+
+    def test_fewer_digits_use_less_memory(self):
+        self.assertLess(LatencyHistogram(significant_digits=2).counts.nbytes,
+                        LatencyHistogram(significant_digits=3).counts.nbytes)
+
+    def test_merge(self):
+        first = self._record_all(LatencyHistogram(), self.samples[:5000])
+        second = self._record_all(LatencyHistogram(), self.samples[5000:])
+        combined = self._record_all(LatencyHistogram(), self.samples)
+
+        first.merge(second)
+
+        self.assertEqual(first.count, combined.count)
+        self.assertEqual(first.min, combined.min)
+        self.assertEqual(first.max, combined.max)
+        np.testing.assert_array_equal(first.counts, combined.counts)
+
+    def test_merge_rejects_different_layout(self):
+        with self.assertRaises(ValueError):
+            LatencyHistogram(significant_digits=2).merge(LatencyHistogram(significant_digits=3))
+
+    def test_serialization_round_trip(self):
+        histogram = self._record_all(LatencyHistogram(), self.samples)
+
+        restored = LatencyHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+
+        np.testing.assert_array_equal(restored.counts, histogram.counts)
+        self.assertEqual(restored.percentiles([50, 99]), histogram.percentiles([50, 99]))
+        self.assertEqual((restored.min, restored.max), (histogram.min, histogram.max))
+
+    def test_ks_test(self):
+        first = self._record_all(LatencyHistogram(), self.samples[:10000])
+        second = self._record_all(LatencyHistogram(), self.samples[10000:])
+        shifted = self._record_all(LatencyHistogram(), self.samples[10000:] * 1.05)
+
+        # Two halves of one sample: the same distribution
+        statistic, p_value = first.ks_test(second)
+        values = np.sort(self.samples)
+        exact = np.abs(np.searchsorted(np.sort(self.samples[:10000]), values, side='right') / 10000 -
+                       np.searchsorted(np.sort(self.samples[10000:]), values, side='right') / 10000).max()
+        self.assertAlmostEqual(statistic, exact, delta=0.005)
+        self.assertGreater(p_value, 0.01)
+
+        statistic, p_value = first.ks_test(shifted)
+        self.assertGreater(statistic, 0.01)
+        self.assertLess(p_value, 1e-3)
+        self.assertEqual(first.ks_test(LatencyHistogram()), (0.0, 1.0))
+
+    def test_cumulative_counts(self):
+        histogram = LatencyHistogram()
+        for value in (0.5, 1, 5, 10, 11):
+            histogram.record(value)
+
+        # Bounds are inclusive, and the last entry is the total
+        self.assertEqual(histogram.cumulative_counts((1, 10)), [2, 4, 5])
+        self.assertEqual(histogram.cumulative_counts(()), [5])
+
+        histogram = self._record_all(LatencyHistogram(), self.samples)
+        bounds = (1, 2.5, 25, 100, 1000)
+        expected = [int((self.samples <= bound).sum()) for bound in bounds] + [len(self.samples)]
+        for count, exact in zip(histogram.cumulative_counts(bounds), expected):
+            self.assertAlmostEqual(count, exact, delta=exact * 1e-3 + 1)
+
+    def test_empty_histogram(self):
+        histogram = LatencyHistogram()
+
+        self.assertEqual(histogram.mean, 0)
+        self.assertEqual(histogram.percentiles([50, 99]), [0, 0])
+        restored = LatencyHistogram.from_dict(histogram.to_dict())
+        self.assertEqual(restored.count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -2,8 +2,13 @@ import unittest
 from unittest.mock import patch, MagicMock, AsyncMock
 import asyncio
 import os
+import time
 import json
-from src.http_load_tester import HTTPLoadTester, main
+import tempfile
+import threading
+from src.http_load_tester import (DRAIN_TIMEOUT, WORKER_STARTUP_TIMEOUT, HTTPLoadTester, PhaseTimings,
+                                  _worker_results_timeout, build_parser, main, run_workers, shard_config,
+                                  split_evenly)
 from aiohttp import web
 import pytest
 
@@ -128,22 +133,56 @@ class TestHTTPLoadTester(unittest.TestCase):
     def tearDown(self):
         self.loop.close()
 
+    def _mock_response(self, status=200, body=b"Test response"):
+        mock_response = AsyncMock()
+        mock_response.status = status
+        mock_response.read.return_value = body
+        mock_response.text.return_value = body.decode()
+
+        async def iter_chunked(size):
+            for start in range(0, len(body), size):
+                yield body[start:start + size]
+
+        mock_response.content.iter_chunked = iter_chunked
+        return mock_response
+
+    def _cli_args(self, *options):
+        # parse_args itself is patched in the main() tests
+        args, _ = build_parser().parse_known_args(
+            [self.url, '--qps', str(self.qps), '--duration', str(self.duration), *options])
+        return args
+
     @patch('aiohttp.ClientSession')
     def test_send_request(self, mock_session):
-        mock_response = AsyncMock()
-        mock_response.status = 200
-        mock_response.text.return_value = "Test response"
-        mock_session.request.return_value.__aenter__.return_value = mock_response
+        mock_session.request.return_value.__aenter__.return_value = self._mock_response()
 
         async def run_test():
             await self.tester.send_request(mock_session)
 
         self.loop.run_until_complete(run_test())
 
-        self.assertEqual(len(self.tester.results), 1)
-        self.assertIn('latency', self.tester.results[0])
-        self.assertIn('status', self.tester.results[0])
-        self.assertEqual(self.tester.results[0]['status'], 200)
+        self.assertEqual(self.tester.latency_histogram.count, 1)
+        self.assertEqual(self.tester.response_time_histogram.count, 1)
+        self.assertEqual(self.tester.status_codes, {200: 1})
+        self.assertEqual(self.tester.bytes_received, len(b"Test response"))
+
+    @patch('aiohttp.ClientSession')
+    def test_send_request_body_modes(self, mock_session):
+        body = b"x" * 200000
+        for body_mode in ('stream', 'full'):
+            with self.subTest(body_mode=body_mode):
+                tester = HTTPLoadTester(self.url, self.qps, self.duration, body_mode=body_mode)
+                mock_response = self._mock_response(body=body)
+                mock_session.request.return_value.__aenter__.return_value = mock_response
+
+                self.loop.run_until_complete(tester.send_request(mock_session))
+
+                self.assertEqual(tester.bytes_received, len(body))
+                # Only the validation mode pays for decoding the body
+                self.assertEqual(mock_response.text.await_count, 1 if body_mode == 'full' else 0)
+
+        with self.assertRaises(ValueError):
+            HTTPLoadTester(self.url, self.qps, self.duration, body_mode='discard')
 
     @patch('aiohttp.ClientSession')
     def test_send_request_error(self, mock_session):
@@ -155,14 +194,12 @@ class TestHTTPLoadTester(unittest.TestCase):
         self.loop.run_until_complete(run_test())
 
         self.assertEqual(self.tester.error_count, 1)
-        self.assertEqual(len(self.tester.results), 0)
+        self.assertEqual(self.tester.latency_histogram.count, 0)
 
     def test_generate_report(self):
-        self.tester.results = [
-            {'latency': 100, 'status': 200},
-            {'latency': 150, 'status': 200},
-            {'latency': 200, 'status': 404},
-        ]
+        self.tester.record_result(100, 200, nbytes=1000)
+        self.tester.record_result(150, 200, nbytes=1000)
+        self.tester.record_result(200, 404, nbytes=500)
         self.tester.error_count = 1
 
         report = self.tester.generate_report()
@@ -171,13 +208,20 @@ class TestHTTPLoadTester(unittest.TestCase):
         self.assertEqual(report['total_requests'], 4)
         self.assertAlmostEqual(report['error_rate'], 0.25)
         self.assertAlmostEqual(report['avg_latency'], 150)
-        self.assertEqual(report['median_latency'], 150)
+        # Percentiles come from the histogram, accurate to 3 significant digits
+        self.assertAlmostEqual(report['median_latency'], 150, delta=150 * 1e-3)
         self.assertEqual(report['min_latency'], 100)
         self.assertEqual(report['max_latency'], 200)
         self.assertEqual(report['status_codes'], {200: 2, 404: 1})
+        self.assertEqual(report['target_qps'], self.qps)
+        self.assertAlmostEqual(report['achieved_qps'], 4 / self.duration)
+        self.assertAlmostEqual(report['avg_response_time'], 150)
+        self.assertEqual(report['late_sends'], 0)
+        self.assertEqual(report['dropped_sends'], 0)
+        self.assertEqual(report['bytes_received'], 2500)
+        self.assertAlmostEqual(report['throughput_mb_per_s'], 2500 / self.duration / 1e6)
 
     def test_generate_report_no_results(self):
-        self.tester.results = []
         self.tester.error_count = 0
 
         report = self.tester.generate_report()
@@ -185,7 +229,6 @@ class TestHTTPLoadTester(unittest.TestCase):
         self.assertIsNone(report)
 
     def test_generate_report_all_errors(self):
-        self.tester.results = []
         self.tester.error_count = 10
 
         report = self.tester.generate_report()
@@ -199,15 +242,228 @@ class TestHTTPLoadTester(unittest.TestCase):
         self.assertEqual(report['max_latency'], 0)
         self.assertEqual(report['status_codes'], {})
 
+    def test_invalid_arrival_distribution(self):
+        with self.assertRaises(ValueError):
+            HTTPLoadTester(self.url, self.qps, self.duration, arrival='bursty')
+
+    def test_scheduler_reaches_target_rate(self):
+        for arrival in ('constant', 'poisson', 'uniform'):
+            with self.subTest(arrival=arrival):
+                tester = HTTPLoadTester(self.url, qps=500, duration=1, arrival=arrival)
+                sent = []
+
+                async def fake_send_request(session, intended_time=None, request=None):
+                    sent.append(intended_time)
+
+                with patch.object(tester, 'send_request', side_effect=fake_send_request), \
+                        patch('aiohttp.ClientSession'):
+                    self.loop.run_until_complete(tester.run_test())
+
+                # Open-loop schedule: the count must track the target, not lag it
+                self.assertGreater(len(sent), 500 * 0.8)
+                self.assertLess(len(sent), 500 * 1.2)
+                self.assertAlmostEqual(tester.send_duration, 1, delta=0.1)
+                self.assertEqual(tester.dropped_sends, 0)
+
+    def test_scheduler_follows_load_profile(self):
+        tester = HTTPLoadTester(self.url, qps=0, load_profile=[
+            {'rate': 200, 'duration': 0.5, 'ramp': 'linear', 'name': 'ramp'},
+            {'rate': 0, 'duration': 0.25},
+            {'rate': 400, 'duration': 0.25, 'name': 'spike'}
+        ])
+        sent = []
+
+        async def fake_send_request(session, intended_time=None, request=None):
+            sent.append(intended_time - tester._start_time)
+            tester.record_result(10, 200, breakdowns=tester._breakdowns(intended_time))
+
+        with patch.object(tester, 'send_request', side_effect=fake_send_request), \
+                patch('aiohttp.ClientSession'):
+            self.loop.run_until_complete(tester.run_test())
+
+        self.assertEqual(tester.duration, 1)
+        self.assertEqual(len(sent), 50 + 100)
+        # The ramp sends three times as much in its second half as in its first
+        self.assertEqual(sum(1 for offset in sent if offset < 0.25), 13)
+        self.assertFalse([offset for offset in sent if 0.5 < offset < 0.75])
+
+        report = tester.generate_report()
+        self.assertEqual(report['target_qps'], 150)
+        self.assertEqual([stage['name'] for stage in report['stages']], ['ramp', 'stage-1', 'spike'])
+        self.assertEqual([stage['total_requests'] for stage in report['stages']], [50, 0, 100])
+        self.assertEqual(report['stages'][2]['latency']['p50'], 10)
+        self.assertAlmostEqual(report['stages'][2]['achieved_qps'], 400, delta=40)
+
+    def test_stage_breakdown_counts_errors(self):
+        tester = HTTPLoadTester(self.url, qps=0, load_profile=[{'rate': 10, 'duration': 1},
+                                                               {'rate': 20, 'duration': 1}])
+        tester._start_time = 100.0
+        tester.record_result(5, 200, breakdowns=tester._breakdowns(100.5))
+        tester.record_error(tester._breakdowns(101.5))
+        tester.record_result(7, 503, breakdowns=tester._breakdowns(101.2))
+        tester.send_duration = 2
+
+        # Stage results survive the trip through a worker's exported state
+        merged = HTTPLoadTester(self.url, qps=0, load_profile=[{'rate': 10, 'duration': 1},
+                                                               {'rate': 20, 'duration': 1}])
+        merged.merge_state(json.loads(json.dumps(tester.export_state())))
+        first, second = merged.generate_report()['stages']
+
+        self.assertEqual((first['total_requests'], first['error_rate']), (1, 0))
+        self.assertEqual((second['total_requests'], second['error_rate']), (2, 0.5))
+        self.assertEqual(second['status_codes'], {503: 1})
+        self.assertEqual(second['start'], 1)
+
+    def test_load_profile_cli(self):
+        profile = [{'rate': 50, 'duration': 2, 'ramp': 'linear'}]
+        args = self._cli_args('--profile', json.dumps(profile))
+
+        self.assertEqual(args.profile, profile)
+
+    def test_closed_loop_users(self):
+        for think_time, expected in ((0, 40), (0.05, 20)):
+            with self.subTest(think_time=think_time):
+                tester = HTTPLoadTester(self.url, qps=0, duration=0.5, concurrency=4, mode='closed',
+                                        think_time=think_time)
+                in_flight = []
+
+                async def fake_send_request(session, intended_time=None, request=None):
+                    in_flight.append(1)
+                    self.assertLessEqual(len(in_flight), 4)
+                    await asyncio.sleep(0.05)
+                    in_flight.pop()
+                    tester.record_result(50, 200)
+
+                with patch.object(tester, 'send_request', side_effect=fake_send_request), \
+                        patch('aiohttp.ClientSession'):
+                    self.loop.run_until_complete(tester.run_test())
+
+                report = tester.generate_report()
+                # Each user waits for its response (and thinks) before sending again
+                self.assertAlmostEqual(report['total_requests'], expected, delta=expected * 0.2)
+                self.assertIsNone(report['target_qps'])
+                self.assertAlmostEqual(report['achieved_qps'], expected / 0.5, delta=expected * 0.5)
+                self.assertEqual(report['dropped_sends'], 0)
+
+    def test_think_time_distribution(self):
+        tester = HTTPLoadTester(self.url, qps=0, mode='closed', think_time=0.2,
+                                think_time_distribution='exponential')
+        samples = [tester._think_time() for _ in range(5000)]
+
+        self.assertAlmostEqual(sum(samples) / len(samples), 0.2, delta=0.02)
+        self.assertGreater(len(set(samples)), 1)
+        with self.assertRaises(ValueError):
+            HTTPLoadTester(self.url, qps=0, mode='closed', think_time_distribution='gaussian')
+        with self.assertRaises(ValueError):
+            HTTPLoadTester(self.url, qps=0, mode='closed', load_profile=[{'rate': 1, 'duration': 1}])
+
+    def test_closed_loop_stop(self):
+        tester = HTTPLoadTester(self.url, qps=0, duration=30, concurrency=2, mode='closed', think_time=10)
+
+        async def run_and_stop():
+            asyncio.get_running_loop().call_later(0.2, tester.stop)
+            started = time.monotonic()
+            await tester.run_test()
+            return time.monotonic() - started
+
+        with patch('aiohttp.ClientSession'):
+            elapsed = self.loop.run_until_complete(run_and_stop())
+
+        self.assertLess(elapsed, 1)
+
+    @patch('aiohttp.ClientSession')
+    def test_send_request_corrects_for_late_send(self, mock_session):
+        mock_session.request.return_value.__aenter__.return_value = self._mock_response()
+
+        async def run_test():
+            # Scheduled 50 ms ago: the queueing delay belongs in the response time
+            await self.tester.send_request(mock_session, time.monotonic() - 0.05)
+
+        self.loop.run_until_complete(run_test())
+
+        self.assertEqual(self.tester.late_sends, 1)
+        self.assertGreaterEqual(self.tester.response_time_histogram.max, 50)
+        self.assertLess(self.tester.latency_histogram.max, self.tester.response_time_histogram.max)
+
+    def test_scheduler_counts_dropped_sends(self):
+        tester = HTTPLoadTester(self.url, qps=100, duration=0.5, concurrency=1)
+
+        async def slow_send_request(session, intended_time=None, request=None):
+            await asyncio.sleep(0.2)
+
+        with patch.object(tester, 'send_request', side_effect=slow_send_request), \
+                patch('aiohttp.ClientSession'):
+            self.loop.run_until_complete(tester.run_test())
+
+        self.assertGreater(tester.dropped_sends, 0)
+
+    def test_in_flight_limit_and_drain_deadline(self):
+        tester = HTTPLoadTester(self.url, qps=50, duration=0.3, concurrency=3, drain_timeout=0.2)
+
+        async def hung_send(*args, **kwargs):
+            await asyncio.sleep(60)
+
+        started = time.monotonic()
+        with patch.object(tester.engine, 'send', side_effect=hung_send):
+            self.loop.run_until_complete(tester.run_test())
+
+        # The hung requests are cut off at the drain deadline, not waited for
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(tester.monitor.max_in_flight, 3)
+        self.assertEqual(tester.error_types, {'DrainTimeout': 3})
+        self.assertEqual(tester.error_classes, {'timeout': 3})
+        self.assertEqual(tester.dropped_sends, 15 - 3)
+
+    def test_closed_loop_drain_deadline(self):
+        tester = HTTPLoadTester(self.url, qps=0, duration=0.2, mode='closed', concurrency=2, drain_timeout=0.1)
+
+        async def hung_send(*args, **kwargs):
+            await asyncio.sleep(60)
+
+        started = time.monotonic()
+        with patch.object(tester.engine, 'send', side_effect=hung_send):
+            self.loop.run_until_complete(tester.run_test())
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(tester.error_types, {'DrainTimeout': 2})
+        self.assertEqual(tester.monitor.in_flight, 0)
+
+    def test_timeout_options(self):
+        tester = HTTPLoadTester(self.url, self.qps, self.duration, connect_timeout=1, read_timeout=2,
+                                total_timeout=0)
+
+        async def create():
+            async with tester._create_session() as session:
+                return session.timeout
+
+        timeout = self.loop.run_until_complete(create())
+        self.assertEqual((timeout.sock_connect, timeout.sock_read, timeout.total), (1, 2, None))
+        with self.assertRaises(ValueError):
+            HTTPLoadTester(self.url, self.qps, self.duration, drain_timeout=-1)
+
+        args = self._cli_args('--read-timeout', '5', '--drain-timeout', '0')
+        self.assertEqual((args.read_timeout, args.drain_timeout, args.total_timeout), (5, 0, 0))
+        # 0 means no limit for every timeout
+        self.assertIsNone(HTTPLoadTester(self.url, self.qps, self.duration, drain_timeout=0).drain_timeout)
+
+    def test_worker_results_timeout(self):
+        tester = HTTPLoadTester(self.url, self.qps, duration=100, drain_timeout=90)
+        self.assertEqual(_worker_results_timeout(tester, 0.2), 0.2 + 100 + 90 + WORKER_STARTUP_TIMEOUT)
+
+        tester = HTTPLoadTester(self.url, self.qps, duration=100, warmup_connections=4, total_timeout=5)
+        self.assertEqual(_worker_results_timeout(tester, 0), 100 + DRAIN_TIMEOUT + 5 + WORKER_STARTUP_TIMEOUT)
+
+        # Unbounded drains and warm-ups leave the wait unbounded too
+        self.assertIsNone(_worker_results_timeout(HTTPLoadTester(self.url, self.qps, 100, drain_timeout=None), 0))
+        self.assertIsNone(_worker_results_timeout(HTTPLoadTester(self.url, self.qps, 100, warmup_connections=4), 0))
+
     @patch('aiohttp.ClientSession')
     def test_different_http_methods(self, mock_session):
         methods = ['GET', 'POST', 'PUT', 'DELETE']
         for method in methods:
             self.tester.method = method
-            mock_response = AsyncMock()
-            mock_response.status = 200
-            mock_response.text.return_value = f"Test response for {method}"
-            mock_session.request.return_value.__aenter__.return_value = mock_response
+            mock_session.request.return_value.__aenter__.return_value = \
+                self._mock_response(body=f"Test response for {method}".encode())
 
             async def run_test():
                 await self.tester.send_request(mock_session)
@@ -222,10 +478,7 @@ class TestHTTPLoadTester(unittest.TestCase):
         self.tester.headers = {'Content-Type': 'application/json'}
         self.tester.data = '{"key": "value"}'
 
-        mock_response = AsyncMock()
-        mock_response.status = 200
-        mock_response.text.return_value = "Test response"
-        mock_session.request.return_value.__aenter__.return_value = mock_response
+        mock_session.request.return_value.__aenter__.return_value = self._mock_response()
 
         async def run_test():
             await self.tester.send_request(mock_session)
@@ -235,6 +488,253 @@ class TestHTTPLoadTester(unittest.TestCase):
         mock_session.request.assert_called_with('POST', self.url, headers={'Content-Type': 'application/json'},
                                                 data='{"key": "value"}')
 
+    def test_stop_ends_test_early(self):
+        tester = HTTPLoadTester(self.url, qps=100, duration=30)
+
+        async def fake_send_request(session, intended_time=None, request=None):
+            await asyncio.sleep(0.01)
+
+        async def run_test():
+            self.loop.call_later(0.3, tester.stop)
+            await tester.run_test()
+
+        started = time.monotonic()
+        with patch.object(tester, 'send_request', side_effect=fake_send_request), \
+                patch('aiohttp.ClientSession'):
+            self.loop.run_until_complete(run_test())
+
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertLess(tester.send_duration, 1)
+
+    def test_read_live_runs_on_the_test_loop(self):
+        tester = HTTPLoadTester(self.url, qps=50, duration=0.5)
+        reads = []
+
+        def read_from_another_thread():
+            reads.append(tester.read_live(lambda: (threading.get_ident(), tester.generate_report())))
+
+        async def run():
+            with patch.object(tester.engine, 'send', return_value=(200, 10)):
+                test = asyncio.ensure_future(tester.run_test())
+                await asyncio.sleep(0.2)
+                reader = threading.Thread(target=read_from_another_thread)
+                reader.start()
+                await test
+                reader.join()
+                return threading.get_ident()
+
+        loop_thread = self.loop.run_until_complete(run())
+
+        self.assertEqual(reads[0][0], loop_thread)
+        self.assertGreater(reads[0][1]['total_requests'], 0)
+        # Without a running test the read happens right away
+        self.assertEqual(tester.read_live(threading.get_ident), threading.get_ident())
+
+    def test_per_second_windows(self):
+        tester = HTTPLoadTester(self.url, qps=100, duration=2.5)
+        sent = []
+
+        async def fake_send_request(session, intended_time=None, request=None):
+            sent.append(intended_time)
+            if len(sent) % 10 == 0:
+                tester.record_error()
+            else:
+                tester.record_result(20, 200)
+
+        with patch.object(tester, 'send_request', side_effect=fake_send_request), \
+                patch('aiohttp.ClientSession'):
+            self.loop.run_until_complete(tester.run_test())
+
+        windows = list(tester.windows)
+        self.assertEqual([window['index'] for window in windows], [0, 1, 2])
+        for window in windows[:2]:
+            self.assertAlmostEqual(window['duration'], 1, delta=0.05)
+            self.assertAlmostEqual(window['qps'], 100, delta=10)
+            # Read off the time series, so accurate to a bucket width (about 12%)
+            self.assertAlmostEqual(window['p99_latency'], 20, delta=3)
+        self.assertEqual(sum(window['requests'] for window in windows), 250)
+        self.assertEqual(sum(window['errors'] for window in windows), tester.error_count)
+        self.assertEqual(sum(window['status_classes'].get('2xx', 0) for window in windows),
+                         tester.status_codes[200])
+        self.assertEqual(sum(window['requests'] for window in windows), tester.timeseries.totals()['requests'])
+
+    def test_phase_timings_record(self):
+        timings = PhaseTimings()
+        new_connection = {
+            'connection_create_start': 1.000,
+            'dns_resolvehost_start': 1.001,
+            'dns_resolvehost_end': 1.004,
+            'connection_create_end': 1.010,
+            'request_headers_sent': 1.011,
+            'request_end': 1.031,
+        }
+        reused_connection = {'request_headers_sent': 2.000, 'request_end': 2.010}
+
+        timings.record(new_connection, 1.036)
+        timings.record(reused_connection, 2.012)
+        report = timings.report()
+
+        self.assertAlmostEqual(report['phases']['dns']['max'], 3)
+        self.assertAlmostEqual(report['phases']['connect']['max'], 7)  # DNS is not counted twice
+        self.assertAlmostEqual(report['phases']['ttfb']['max'], 20)
+        self.assertAlmostEqual(report['phases']['body']['min'], 2)
+        self.assertEqual(report['phases']['ttfb']['count'], 2)
+        self.assertEqual(report['phases']['connection_acquire']['count'], 0)
+        self.assertEqual(report['new_connections'], 1)
+        self.assertEqual(report['reused_connections'], 1)
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_trace_phases_integration(self):
+        app = web.Application()
+        app.router.add_get('/', test_server)
+
+        async def run_test():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, 'localhost', 8085)
+            await site.start()
+            try:
+                tester = HTTPLoadTester('http://localhost:8085', qps=20, duration=1, trace_phases=True)
+                await tester.run_test()
+                return tester.generate_report()
+            finally:
+                await runner.cleanup()
+
+        report = self.loop.run_until_complete(run_test())
+
+        self.assertEqual(report['phases']['ttfb']['count'], 20)
+        self.assertEqual(report['phases']['body']['count'], 20)
+        self.assertGreater(report['phases']['ttfb']['p50'], 90)  # The handler sleeps 100 ms
+        self.assertGreaterEqual(report['phases']['connect']['count'], 1)
+        self.assertEqual(report['new_connections'] + report['reused_connections'], 20)
+        self.assertEqual(report['new_connections'], report['phases']['connect']['count'])
+
+    def test_split_evenly(self):
+        self.assertEqual(split_evenly(10, 3), [4, 3, 3])
+        self.assertEqual(sum(split_evenly(1001, 4)), 1001)
+
+    def test_shard_config(self):
+        config = {'url': self.url, 'qps': 10, 'concurrency': 7, 'connection_limit': 0,
+                  'connection_limit_per_host': 5, 'warmup_connections': 2}
+
+        shards = shard_config(config, 3)
+
+        self.assertEqual([shard['qps'] for shard in shards], [4, 3, 3])
+        self.assertEqual([shard['concurrency'] for shard in shards], [3, 2, 2])
+        self.assertEqual([shard['connection_limit'] for shard in shards], [0, 0, 0])
+        self.assertEqual([shard['connection_limit_per_host'] for shard in shards], [2, 2, 1])
+        self.assertEqual([shard['warmup_connections'] for shard in shards], [1, 1, 0])
+        # Shards without any rate are dropped
+        self.assertEqual(len(shard_config(dict(config, qps=2), 3)), 2)
+
+        # Load profiles are split by scaling every stage
+        profile = [{'rate': 30, 'duration': 10, 'ramp': 'linear'}, {'rate': 1, 'duration': 5}]
+        shards = shard_config(dict(config, qps=0, load_profile=profile), 3)
+        self.assertEqual(len(shards), 3)
+        self.assertEqual([stage['rate'] for stage in shards[0]['load_profile']], [10, 1 / 3])
+        self.assertEqual(shards[0]['load_profile'][0]['ramp'], 'linear')
+
+        # Closed-loop tests are split by virtual users, with no rate to share
+        shards = shard_config(dict(config, qps=0, mode='closed', concurrency=2), 3)
+        self.assertEqual([shard['concurrency'] for shard in shards], [1, 1])
+
+    def test_connector_options(self):
+        tester = HTTPLoadTester(self.url, self.qps, self.duration, connection_limit=10,
+                                connection_limit_per_host=5, keepalive_timeout=3, dns_cache_ttl=60)
+
+        async def create():
+            async with tester._create_session() as session:
+                connector = session.connector
+                return connector.limit, connector.limit_per_host, connector._keepalive_timeout, \
+                    connector._cached_hosts._ttl, connector.force_close
+
+        self.assertEqual(self.loop.run_until_complete(create()), (10, 5, 3, 60, False))
+
+        tester.force_close = True
+        self.assertTrue(self.loop.run_until_complete(create())[4])
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_warmup_and_force_close(self):
+        app = web.Application()
+        app.router.add_get('/', test_server)
+
+        async def run(**options):
+            tester = HTTPLoadTester('http://localhost:8086', qps=5, duration=1, trace_phases=True, **options)
+            await tester.run_test()
+            return tester.generate_report()
+
+        async def run_tests():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, 'localhost', 8086).start()
+            try:
+                return await run(warmup_connections=3), await run(force_close=True)
+            finally:
+                await runner.cleanup()
+
+        warm, closing = self.loop.run_until_complete(run_tests())
+
+        # Warm-up requests are not measured, and their connections are reused
+        self.assertEqual(warm['total_requests'], 5)
+        self.assertEqual(warm['new_connections'], 0)
+        self.assertEqual(closing['new_connections'], 5)
+
+    def test_merge_state(self):
+        worker = HTTPLoadTester(self.url, self.qps, self.duration)
+        worker.record_result(100, 200)
+        worker.record_result(300, 500)
+        worker.error_count = 2
+        worker.dropped_sends = 1
+        worker.send_duration = 4.5
+        self.tester.record_result(200, 200)
+        self.tester.send_duration = 5
+
+        # States travel between processes and machines as JSON
+        self.tester.merge_state(json.loads(json.dumps(worker.export_state())))
+        report = self.tester.generate_report()
+
+        self.assertEqual(report['total_requests'], 5)
+        self.assertEqual(report['status_codes'], {200: 2, 500: 1})
+        self.assertEqual(report['min_latency'], 100)
+        self.assertEqual(report['max_latency'], 300)
+        self.assertEqual(report['dropped_sends'], 1)
+        self.assertEqual(report['achieved_qps'], 1)
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_run_workers(self):
+        app = web.Application()
+        app.router.add_get('/', test_server)
+
+        async def run_test():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            try:
+                port = runner.addresses[0][1]
+                config = {'url': f'http://127.0.0.1:{port}', 'qps': 100, 'duration': 1, 'concurrency': 50}
+                return await self.loop.run_in_executor(None, run_workers, config, 2)
+            finally:
+                await runner.cleanup()
+
+        tester = self.loop.run_until_complete(run_test())
+        report = tester.generate_report()
+
+        self.assertAlmostEqual(report['total_requests'], 100, delta=10)
+        self.assertEqual(report['error_rate'], 0)
+        self.assertEqual(report['target_qps'], 100)
+        self.assertEqual(report['status_codes'], {200: report['total_requests']})
+
+    def test_run_workers_reports_a_worker_startup_error(self):
+        # The second worker's share of a one-line corpus is empty, so it fails to start
+        config = {'url': 'http://localhost:1', 'qps': 10, 'duration': 1,
+                  'requests_file': self._requests_file([{'url': '/a'}])}
+
+        started = time.monotonic()
+        with self.assertRaisesRegex(RuntimeError, 'failed to start: ValueError: No requests'):
+            run_workers(config, 2)
+        self.assertLess(time.monotonic() - started, 30)
+
     @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
     def test_integration(self):
         app = web.Application()
@@ -256,26 +756,143 @@ class TestHTTPLoadTester(unittest.TestCase):
                 self.assertIsNotNone(report)
                 self.assertGreater(report['total_requests'], 0)
                 self.assertLess(report['error_rate'], 0.1)  # Assuming less than 10% error rate
+                self.assertEqual(report['bytes_received'], len("Test response") * tester.latency_histogram.count)
             finally:
                 await runner.cleanup()
 
         self.loop.run_until_complete(run_test())
 
+    def _requests_file(self, records):
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(fd, 'w') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+        self.addCleanup(os.remove, path)
+        return path
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_replay_requests_file(self):
+        async def echo(request):
+            return web.Response(status=201 if request.method == 'POST' else 200, body=await request.read())
+
+        app = web.Application()
+        app.router.add_get('/items/{id}', echo)
+        app.router.add_post('/items', echo)
+        path = self._requests_file([
+            {'url': '/items/1'},
+            {'method': 'POST', 'url': '/items', 'body': {'id': 3}, 'weight': 2},
+            {'url': '/items/2', 'name': 'second item'}
+        ])
+
+        async def run_test():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, 'localhost', 8088).start()
+            try:
+                # The corpus does not loop, so the test ends after its 4 requests
+                tester = HTTPLoadTester('http://localhost:8088/', qps=50, duration=2, requests_file=path)
+                await tester.run_test()
+                return tester.generate_report()
+            finally:
+                await runner.cleanup()
+
+        report = self.loop.run_until_complete(run_test())
+
+        self.assertEqual(report['total_requests'], 4)
+        self.assertEqual(report['status_codes'], {200: 2, 201: 2})
+        self.assertEqual(report['bytes_received'], 2 * len(b'{"id": 3}'))
+        self.assertEqual(sorted(report['endpoints']), ['GET /items/1', 'POST /items', 'second item'])
+        self.assertEqual(report['endpoints']['POST /items']['total_requests'], 2)
+        self.assertEqual(report['endpoints']['POST /items']['status_codes'], {201: 2})
+
+    def test_close_releases_the_corpus(self):
+        path = self._requests_file([{'url': '/items/1'}])
+
+        tester = HTTPLoadTester('http://localhost:8088/', qps=50, duration=1, requests_file=path)
+        with patch.object(tester.engine, 'send', return_value=(200, 10)):
+            self.loop.run_until_complete(tester.run_test())
+        self.assertTrue(tester.corpus._file.closed)
+
+        # A tester that never runs releases it with close()
+        tester = HTTPLoadTester('http://localhost:8088/', qps=50, duration=1, requests_file=path)
+        tester.close()
+        self.assertTrue(tester.corpus._file.closed)
+        self.assertEqual(tester.endpoint_stats, {})
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_scenario(self):
+        received = []
+
+        async def handler(request):
+            received.append((request.path, request.headers.get('X-Seq'), await request.read()))
+            return web.Response(status=404 if request.path == '/missing' else 200)
+
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', handler)
+        scenario = {'templates': [
+            {'name': 'order', 'method': 'POST', 'url': '/orders', 'weight': 3,
+             'headers': {'X-Seq': '{{seq}}'}, 'body': {'id': '{{seq}}'}},
+            {'name': 'missing', 'url': '/missing'}
+        ]}
+
+        async def run_test():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, 'localhost', 8089).start()
+            try:
+                tester = HTTPLoadTester('http://localhost:8089/', qps=100, duration=1, scenario=scenario)
+                await tester.run_test()
+                return tester.generate_report()
+            finally:
+                await runner.cleanup()
+
+        report = self.loop.run_until_complete(run_test())
+
+        self.assertEqual(report['total_requests'], 100)
+        self.assertEqual(sorted(report['endpoints']), ['missing', 'order'])
+        orders = report['endpoints']['order']
+        self.assertEqual(orders['total_requests'] + report['endpoints']['missing']['total_requests'], 100)
+        self.assertEqual(orders['status_codes'], {200: orders['total_requests']})
+        self.assertEqual(report['endpoints']['missing']['status_codes'], {404: 100 - orders['total_requests']})
+        self.assertGreater(orders['total_requests'], 50)
+        bodies = sorted(json.loads(body)['id'] for path, _, body in received if path == '/orders')
+        self.assertEqual(bodies, sorted(str(i) for i in range(len(bodies))))
+        self.assertTrue(all(seq == json.loads(body)['id'] for path, seq, body in received if path == '/orders'))
+
+    def test_scenario_and_requests_file_are_exclusive(self):
+        path = self._requests_file([{'url': '/a'}])
+        with self.assertRaises(ValueError):
+            HTTPLoadTester(self.url, self.qps, requests_file=path, scenario={'templates': [{'url': '/b'}]})
+
+    def test_replay_timestamps_schedule(self):
+        path = self._requests_file([{'url': '/a', 'timestamp': 50}, {'url': '/b', 'timestamp': 50.2},
+                                    {'url': '/c', 'timestamp': 50.6}])
+        tester = HTTPLoadTester(self.url, qps=0, duration=0.5, requests_file=path, replay_timestamps=True,
+                                replay_speed=2)
+        sent = []
+
+        async def fake_send_request(session, intended_time=None, request=None):
+            sent.append((round(intended_time - tester._start_time, 3), request.url))
+
+        with patch.object(tester, 'send_request', side_effect=fake_send_request), \
+                patch('aiohttp.ClientSession'):
+            self.loop.run_until_complete(tester.run_test())
+
+        self.assertEqual(sent, [(0, 'https://example.com/a'), (0.1, 'https://example.com/b'),
+                                (0.3, 'https://example.com/c')])
+
+    def test_shard_requests_file(self):
+        shards = shard_config({'url': self.url, 'qps': 2, 'requests_file': 'corpus.jsonl'}, 3)
+
+        self.assertEqual([shard['requests_shard'] for shard in shards], [[0, 2], [1, 2]])
+
     @patch('src.http_load_tester.HTTPLoadTester.run_test')
     @patch('src.http_load_tester.HTTPLoadTester.generate_report')
     @patch('argparse.ArgumentParser.parse_args')
     @patch('json.dumps')
     @patch('builtins.print')
     def test_main(self, mock_print, mock_json_dumps, mock_parse_args, mock_generate_report, mock_run_test):
-        mock_parse_args.return_value = MagicMock(
-            url=self.url,
-            qps=self.qps,
-            duration=self.duration,
-            method='GET',
-            headers={},
-            data=None,
-            concurrency=100
-        )
+        # json.dumps is mocked, so the run history is tested on its own
+        mock_parse_args.return_value = self._cli_args('--no-history')
 
         mock_report = {
             'total_requests': 100,
@@ -288,7 +905,6 @@ class TestHTTPLoadTester(unittest.TestCase):
             'p90_latency': 200,
             'p95_latency': 250,
             'p99_latency': 290,
-            'latencies': [100, 120, 140, 160, 180, 200, 220, 240, 260, 280, 300],
             'status_codes': {200: 95, 404: 5}
         }
         mock_generate_report.return_value = mock_report
@@ -308,15 +924,7 @@ class TestHTTPLoadTester(unittest.TestCase):
     @patch('argparse.ArgumentParser.parse_args')
     @patch('builtins.print')
     def test_main_no_results(self, mock_print, mock_parse_args, mock_generate_report, mock_run_test):
-        mock_parse_args.return_value = MagicMock(
-            url=self.url,
-            qps=self.qps,
-            duration=self.duration,
-            method='GET',
-            headers={},
-            data=None,
-            concurrency=100
-        )
+        mock_parse_args.return_value = self._cli_args()
 
         mock_generate_report.return_value = None
 
@@ -398,7 +1006,7 @@ class TestHTTPLoadTester(unittest.TestCase):
                         self.assertIn('p90_latency', report)
                         self.assertIn('p95_latency', report)
                         self.assertIn('p99_latency', report)
-                        self.assertIn('latencies', report)
+                        self.assertIn('latency_histogram', report)
                         self.assertIn('status_codes', report)
 
                         tested_urls.add(adjusted_config['url'])
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import unittest
+
+from aiohttp import web
+
+from src.jobs import JobManager, TestJob, QUEUED, RUNNING, CANCELLED, COMPLETED
+
+# api.py is written to run from inside src/, like in the Docker image
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import api  # noqa: E402
+
+STUB_PORT = 8084
+
+
+async def stub_handler(request):
+    await asyncio.sleep(0.01)
+    return web.Response(text="stub")
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not met in time")
+        time.sleep(0.05)
+
+
+class TestJobManager(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # The jobs run their own event loops on background threads, so the
+        # stub server gets a loop and thread of its own
+        cls.server_loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get('/', stub_handler)
+        cls.runner = web.AppRunner(app)
+        cls.server_loop.run_until_complete(cls.runner.setup())
+        cls.server_loop.run_until_complete(web.TCPSite(cls.runner, 'localhost', STUB_PORT).start())
+        cls.server_thread = threading.Thread(target=cls.server_loop.run_forever, daemon=True)
+        cls.server_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run_coroutine_threadsafe(cls.runner.cleanup(), cls.server_loop).result()
+        cls.server_loop.call_soon_threadsafe(cls.server_loop.stop)
+        cls.server_thread.join()
+        cls.server_loop.close()
+
+    def setUp(self):
+        self.finished = []
+        self.manager = JobManager(max_concurrent_tests=1,
+                                  on_finished=lambda job: self.finished.append(job.id) or {'extra': 1})
+        self.addCleanup(self.manager.shutdown)
+
+    def _config(self, duration):
+        return {'url': f'http://localhost:{STUB_PORT}', 'qps': 20, 'duration': duration}
+
+    def test_job_completes(self):
+        job = self.manager.submit(self._config(1))
+
+        wait_for(lambda: job.status == COMPLETED)
+
+        view = job.to_dict()
+        self.assertEqual(view['results']['total_requests'], 20)
+        self.assertEqual(view['extra'], 1)
+        self.assertEqual(self.finished, [job.id])
+        # Only the results and the final metrics outlive the test
+        self.assertIsNone(job.load_tester)
+        self.assertEqual(sum(job.metrics['status_codes'].values()), 20)
+
+    def test_cancel_running_job_drains(self):
+        job = self.manager.submit(self._config(30))
+        wait_for(lambda: job.status == RUNNING and job.load_tester.latency_histogram.count > 0)
+
+        # Partial results are available while the test runs
+        self.assertIsNotNone(job.to_dict()['results'])
+        started = time.monotonic()
+        self.manager.cancel(job.id)
+        wait_for(lambda: job.status == CANCELLED)
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertGreater(job.results['total_requests'], 0)
+        self.assertEqual(job.results['error_rate'], 0)
+
+    def test_limits_concurrent_jobs(self):
+        running = self.manager.submit(self._config(30))
+        queued = self.manager.submit(self._config(30))
+        wait_for(lambda: running.status == RUNNING)
+
+        self.assertEqual(queued.status, QUEUED)
+        self.manager.cancel(queued.id)
+        self.assertEqual(queued.status, CANCELLED)
+        self.manager.cancel(running.id)
+
+    def test_cancel_job_the_executor_just_picked_up(self):
+        # Stand in for a queued job whose future can no longer be cancelled
+        queued = TestJob(self._config(30))
+        queued.future = self.manager.executor.submit(lambda: None)
+        queued.future.result()
+        self.manager.jobs[queued.id] = queued
+
+        self.manager.cancel(queued.id)
+        self.assertEqual(queued.status, CANCELLED)
+        # The executor then runs it, and it never starts
+        self.manager._run(queued)
+        self.assertIsNone(queued.started_at)
+        self.assertIsNone(queued.load_tester)
+
+    def test_cancel_unknown_job(self):
+        self.assertIsNone(self.manager.cancel('missing'))
+
+
+class TestJobsAPI(unittest.TestCase):
+
+    def setUp(self):
+        self.client = api.app.test_client()
+
+    def _submit(self, config):
+        response = self.client.post('/tests', json=config)
+        if response.status_code == 202:
+            # Finished jobs save their plots under src/output/<id>
+            job_output = os.path.join(api.current_dir, 'output', response.get_json()['id'])
+            self.addCleanup(shutil.rmtree, job_output, ignore_errors=True)
+        return response
+
+    def test_create_rejects_invalid_config(self):
+        response = self.client.post('/tests', json={'url': 'http://localhost:1', 'qps': 1,
+                                                    'duration': 1, 'method': 'GET', 'workers': 4})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/tests', json={'qps': 1, 'duration': 1, 'method': 'GET'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_get_and_cancel(self):
+        response = self._submit({'url': 'http://localhost:1', 'qps': 1, 'duration': 30, 'method': 'GET'})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['id']
+        self.assertEqual(response.headers['Location'], f'/tests/{job_id}')
+
+        self.assertEqual(self.client.get(f'/tests/{job_id}').get_json()['id'], job_id)
+        self.assertIn(job_id, [test['id'] for test in self.client.get('/tests').get_json()['tests']])
+
+        response = self.client.delete(f'/tests/{job_id}')
+        self.assertEqual(response.status_code, 202)
+        wait_for(lambda: self.client.get(f'/tests/{job_id}').get_json()['status'] == CANCELLED)
+
+    def test_events_stream_windows(self):
+        response = self._submit({'url': f'http://localhost:{STUB_PORT}', 'qps': 20,
+                                 'duration': 2, 'method': 'GET'})
+        job_id = response.get_json()['id']
+        wait_for(lambda: self.client.get(f'/tests/{job_id}').get_json()['status'] == COMPLETED)
+
+        response = self.client.get(f'/tests/{job_id}/events')
+        events = response.get_data(as_text=True).strip().split('\n\n')
+
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        windows = [json.loads(event[len('data: '):]) for event in events[:-1]]
+        self.assertGreaterEqual(len(windows), 2)
+        self.assertEqual(sum(window['requests'] for window in windows), 40)
+        self.assertEqual(events[-1], 'event: done\ndata: {"status": "completed"}')
+
+        # The finished job's tester is gone, and /metrics serves its final snapshot
+        metrics = self.client.get('/metrics').get_data(as_text=True)
+        responses = 40 - sum(window['errors'] for window in windows)
+        labels = f'job_id="{job_id}",url="http://localhost:{STUB_PORT}"'
+        self.assertIn(f'loadtest_request_latency_seconds_count{{{labels}}} {responses}', metrics)
+
+    def test_sample_log_is_written_where_the_server_chooses(self):
+        response = self._submit({'url': 'http://localhost:1', 'qps': 5, 'duration': 1,
+                                 'method': 'GET', 'sample_log': '/tmp/chosen-by-client.bin'})
+        job_id = response.get_json()['id']
+        path = os.path.join(api.SAMPLE_LOG_DIR, f'{job_id}.bin')
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+
+        self.assertEqual(response.get_json()['sample_logs'], [f'/output/samples/{job_id}.bin'])
+        wait_for(lambda: self.client.get(f'/tests/{job_id}').get_json()['status'] == COMPLETED)
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists('/tmp/chosen-by-client.bin'))
+        self.assertEqual(self.client.get(f'/output/samples/{job_id}.bin').status_code, 200)
+
+        response = self._submit({'url': 'http://localhost:1', 'qps': 1, 'duration': 30, 'method': 'GET'})
+        self.assertNotIn('sample_logs', response.get_json())
+        self.client.delete(f"/tests/{response.get_json()['id']}")
+
+    def test_requests_file_must_be_in_the_data_directory(self):
+        config = {'url': 'http://localhost:1', 'qps': 1, 'duration': 1, 'method': 'GET'}
+        for path in ('/etc/passwd', '../api.py', 'corpora/../../api.py'):
+            with self.subTest(path=path):
+                response = self.client.post('/tests', json={**config, 'requests_file': path})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('outside the data directory', response.get_json()['error'])
+
+        tester_config = api.build_tester_config({**config, 'requests_file': 'corpora/capture.jsonl'})
+        self.assertEqual(tester_config['requests_file'],
+                         os.path.join(os.path.realpath(api.DATA_DIR), 'corpora', 'capture.jsonl'))
+
+    def test_scenario_csv_must_be_in_the_data_directory(self):
+        config = {'url': 'http://localhost:1', 'qps': 1, 'duration': 1, 'method': 'GET'}
+        scenario = {'csv': '../api.py', 'templates': [{'url': '/users/{{csv.id}}'}]}
+        response = self.client.post('/tests', json={**config, 'scenario': scenario})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('outside the data directory', response.get_json()['error'])
+
+        tester_config = api.build_tester_config({**config, 'scenario': {**scenario, 'csv': 'users.csv'}})
+        self.assertEqual(tester_config['scenario']['csv'], os.path.join(os.path.realpath(api.DATA_DIR), 'users.csv'))
+        self.assertEqual(scenario['csv'], '../api.py')
+
+    def test_unknown_test(self):
+        self.assertEqual(self.client.get('/tests/missing').status_code, 404)
+        self.assertEqual(self.client.get('/tests/missing/events').status_code, 404)
+        self.assertEqual(self.client.delete('/tests/missing').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,68 @@
+import unittest
+
+from src.load_profile import LoadProfile
+
+
+class TestLoadProfile(unittest.TestCase):
+
+    def setUp(self):
+        # Ramp from 0 to 100/s, hold, pause, then spike
+        self.profile = LoadProfile([
+            {'rate': 100, 'duration': 10, 'ramp': 'linear', 'name': 'ramp'},
+            {'rate': 100, 'duration': 5},
+            {'rate': 0, 'duration': 2},
+            {'rate': 400, 'duration': 1, 'name': 'spike'}
+        ])
+
+    def test_stages(self):
+        self.assertEqual(self.profile.duration, 18)
+        self.assertEqual(self.profile.total_requests, 500 + 500 + 0 + 400)
+        self.assertEqual([stage['start'] for stage in self.profile.stages], [0, 10, 15, 17])
+        self.assertEqual(self.profile.stages[1]['name'], 'stage-1')
+        self.assertEqual(self.profile.stages[0]['start_rate'], 0)
+
+    def test_time_at_inverts_cumulative_count(self):
+        # Halfway through a linear ramp from 0, a quarter of its requests are sent
+        self.assertAlmostEqual(self.profile.time_at(125), 5)
+        self.assertAlmostEqual(self.profile.time_at(500), 10)
+        self.assertAlmostEqual(self.profile.time_at(750), 12.5)
+        # Requests after the pause start with the spike
+        self.assertAlmostEqual(self.profile.time_at(1000), 17)
+        self.assertAlmostEqual(self.profile.time_at(1200), 17.5)
+        self.assertIsNone(self.profile.time_at(1400))
+
+    def test_constant_profile_is_exact(self):
+        profile = LoadProfile.constant(20, 1.5)
+
+        self.assertEqual([profile.time_at(n) for n in range(30)], [n / 20 for n in range(30)])
+        self.assertIsNone(profile.time_at(30))
+
+    def test_linear_ramp_down(self):
+        profile = LoadProfile([{'rate': 100, 'duration': 1}, {'rate': 0, 'duration': 2, 'ramp': 'linear'}])
+
+        self.assertEqual(profile.total_requests, 200)
+        self.assertAlmostEqual(profile.time_at(175), 2)
+        self.assertAlmostEqual(profile.rate_at(2), 50)
+
+    def test_stage_at(self):
+        self.assertEqual(self.profile.stage_at(0), 0)
+        self.assertEqual(self.profile.stage_at(10), 1)
+        self.assertEqual(self.profile.stage_at(17.5), 3)
+        self.assertEqual(self.profile.stage_at(100), 3)
+
+    def test_scaled(self):
+        halves = LoadProfile(self.profile.scaled(0.5))
+
+        self.assertEqual(halves.total_requests, self.profile.total_requests / 2)
+        self.assertEqual(halves.stages[3]['name'], 'spike')
+
+    def test_invalid_stages(self):
+        for stages in ([], [{'rate': 10, 'duration': 0}], [{'rate': -1, 'duration': 1}],
+                       [{'rate': 10, 'duration': 1, 'ramp': 'exponential'}]):
+            with self.subTest(stages=stages):
+                with self.assertRaises(ValueError):
+                    LoadProfile(stages)
+
+
+if __name__ == '__main__':
+    unittest.main()
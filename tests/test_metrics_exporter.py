@@ -0,0 +1,116 @@
+import asyncio
+import unittest
+from threading import Thread
+from unittest.mock import patch
+
+import aiohttp
+from flask import Flask
+from werkzeug.serving import make_server
+
+from src.http_load_tester import HTTPLoadTester
+from src.metrics_exporter import render_metrics, start_metrics_server, wants_openmetrics
+
+
+class TestRenderMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tester = HTTPLoadTester(url='http://localhost/', qps=50, duration=1)
+        self.tester.record_result(12.0, 200, 12.0, 100)
+        self.tester.record_result(600.0, 503, 700.0, 10)
+        self.tester.record_error(error_type='ClientConnectorError')
+
+    def test_prometheus_format(self):
+        text = render_metrics([({'url': 'http://localhost/'}, self.tester)])
+
+        self.assertIn('# TYPE loadtest_requests_total counter', text)
+        self.assertIn('loadtest_requests_total{url="http://localhost/",status="200"} 1', text)
+        self.assertIn('loadtest_errors_total{url="http://localhost/",type="ClientConnectorError"} 1', text)
+        self.assertIn('loadtest_received_bytes_total{url="http://localhost/"} 110', text)
+        self.assertIn('loadtest_target_qps{url="http://localhost/"} 50', text)
+        self.assertIn('loadtest_request_latency_seconds_bucket{url="http://localhost/",le="0.025"} 1', text)
+        self.assertIn('loadtest_request_latency_seconds_bucket{url="http://localhost/",le="+Inf"} 2', text)
+        self.assertIn('loadtest_request_latency_seconds_count{url="http://localhost/"} 2', text)
+        self.assertIn('loadtest_response_time_seconds_sum{url="http://localhost/"} 0.712', text)
+        self.assertNotIn('# EOF', text)
+
+    def test_openmetrics_format(self):
+        text = render_metrics([({}, self.tester)], openmetrics=True)
+
+        self.assertIn('# TYPE loadtest_requests counter', text)
+        self.assertIn('loadtest_requests_total{status="503"} 1', text)
+        self.assertTrue(text.endswith('# EOF\n'))
+        self.assertTrue(wants_openmetrics('application/openmetrics-text; version=1.0.0'))
+        self.assertFalse(wants_openmetrics(None))
+
+    def test_label_escaping_and_closed_loop(self):
+        tester = HTTPLoadTester(url='http://localhost/', qps=0, mode='closed', concurrency=2)
+        text = render_metrics([({'url': 'a"b\\c'}, tester)])
+
+        self.assertIn('loadtest_in_flight_requests{url="a\\"b\\\\c"} 0', text)
+        # Closed-loop tests have no target rate
+        self.assertNotIn('loadtest_target_qps{', text)
+
+    def test_send_errors_counted_by_type(self):
+        tester = HTTPLoadTester(url='http://localhost/', qps=10, duration=0.2)
+
+        async def fail(*args, **kwargs):
+            raise asyncio.TimeoutError()
+
+        with patch.object(tester.engine, 'send', side_effect=fail):
+            asyncio.run(tester.run_test())
+
+        self.assertGreater(tester.error_types['TimeoutError'], 0)
+        self.assertEqual(sum(tester.error_types.values()), tester.error_count)
+        self.assertEqual(tester.generate_report()['error_types'], dict(tester.error_types))
+
+
+class TestMetricsServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = Flask(__name__)
+
+        @cls.app.route('/')
+        def hello():
+            return 'ok'
+
+        cls.server = make_server('localhost', 0, cls.app, threaded=True)
+        cls.url = f'http://localhost:{cls.server.server_port}/'
+        cls.server_thread = Thread(target=cls.server.serve_forever)
+        cls.server_thread.daemon = True
+        cls.server_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def test_scrape_during_test(self):
+        async def run():
+            tester = HTTPLoadTester(url=self.url, qps=20, duration=1)
+            runner = await start_metrics_server(tester, 0, '127.0.0.1')
+            metrics_url = f'http://127.0.0.1:{runner.addresses[0][1]}/metrics'
+            try:
+                test = asyncio.ensure_future(tester.run_test())
+                await asyncio.sleep(0.5)
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(metrics_url) as response:
+                        during = await response.text()
+                        content_type = response.headers['Content-Type']
+                    await test
+                    async with session.get(metrics_url, headers={'Accept': 'application/openmetrics-text'}) as response:
+                        after = await response.text()
+            finally:
+                await runner.cleanup()
+            return tester, during, content_type, after
+
+        tester, during, content_type, after = asyncio.run(run())
+
+        self.assertTrue(content_type.startswith('text/plain'))
+        self.assertIn(f'loadtest_requests_total{{url="{self.url}",status="200"}}', during)
+        self.assertIn(f'loadtest_request_latency_seconds_count{{url="{self.url}"}} '
+                      f'{tester.latency_histogram.count}', after)
+        self.assertTrue(after.endswith('# EOF\n'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.request_sources import RequestCorpus
+
+
+class TestRequestCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            {'url': '/users/1', 'timestamp': 100.0},
+            {'method': 'post', 'url': '/users', 'body': {'name': 'a'}, 'timestamp': 100.5},
+            {'url': 'http://other.example.com/health', 'headers': {'X-Test': '1'}, 'timestamp': 101.0},
+            {'url': '/users/2', 'body': 'raw', 'name': 'user', 'timestamp': 102.0}
+        ]
+
+    def _corpus(self, records=None, lines=None, **options):
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(lines if lines is not None else (json.dumps(r) for r in records or self.records)))
+            f.write('\n')
+        self.addCleanup(os.remove, path)
+        corpus = RequestCorpus(path, base_url='http://example.com/api/', **options)
+        self.addCleanup(corpus.close)
+        return corpus
+
+    def test_requests(self):
+        requests = list(self._corpus().requests())
+
+        self.assertEqual([r.url for r in requests], ['http://example.com/users/1', 'http://example.com/users',
+                                                     'http://other.example.com/health', 'http://example.com/users/2'])
+        self.assertEqual([r.method for r in requests], ['GET', 'POST', 'GET', 'GET'])
+        self.assertEqual(requests[1].data, b'{"name": "a"}')
+        self.assertEqual(requests[1].headers, {'Content-Type': 'application/json'})
+        self.assertEqual(requests[2].headers, {'X-Test': '1'})
+        self.assertEqual(requests[3].data, b'raw')
+        self.assertEqual([r.endpoint for r in requests], ['GET /users/1', 'POST /users', 'GET /health', 'user'])
+
+    def test_blank_lines_and_chunked_index(self):
+        lines = ['', json.dumps(self.records[0]), '  ', '\r', json.dumps(self.records[1]), '']
+        with patch('src.request_sources.INDEX_CHUNK_SIZE', 16):
+            corpus = self._corpus(lines=lines)
+
+        self.assertEqual(len(corpus), 2)
+        self.assertEqual([r.method for r in corpus.requests()], ['GET', 'POST'])
+
+    def test_weights_shard_and_loop(self):
+        records = [{'url': '/a', 'weight': 3}, {'url': '/b'}, {'url': '/c', 'weight': 0}]
+
+        self.assertEqual([r.url[-1] for r in self._corpus(records).requests()], ['a', 'a', 'a', 'b'])
+
+        corpus = self._corpus(shard=(1, 2))
+        self.assertEqual([r.url[-1] for r in corpus.requests()], ['s', '2'])
+
+        looped = self._corpus(loop=True).requests()
+        self.assertEqual(len([next(looped) for _ in range(10)]), 10)
+
+        # Nothing to send at all ends even a looping corpus
+        self.assertEqual(list(self._corpus([{'url': '/a', 'weight': 0}], loop=True).requests()), [])
+
+    def test_lines_are_parsed_lazily(self):
+        # Opening the corpus must not parse it, even when a body mentions "weight"
+        records = [{'url': '/a', 'body': {'weight': 2}}, {'url': '/b', 'weight': 2}]
+        with patch.object(RequestCorpus, '_parse', side_effect=AssertionError):
+            corpus = self._corpus(records)
+
+        self.assertEqual(len(corpus), 2)
+        self.assertEqual([r.url[-1] for r in corpus.requests()], ['a', 'b', 'b'])
+
+    def test_shuffle(self):
+        records = [{'url': f'/{i}'} for i in range(200)]
+        urls = [r.url for r in self._corpus(records, shuffle=True).requests()]
+
+        self.assertEqual(sorted(urls), sorted(f'http://example.com/{i}' for i in range(200)))
+        self.assertNotEqual(urls, [f'http://example.com/{i}' for i in range(200)])
+
+    def test_timed_requests(self):
+        timed = self._corpus(loop=True, replay_timestamps=True, replay_speed=2).timed_requests()
+        offsets = [next(timed)[0] for _ in range(6)]
+
+        # 2 s of recording at double speed; the next pass starts one mean gap (2/3 s) later
+        for offset, expected in zip(offsets, [0, 0.25, 0.5, 1.0, 4 / 3, 4 / 3 + 0.25]):
+            self.assertAlmostEqual(offset, expected)
+
+    def test_sharded_timed_requests_keep_the_whole_schedule(self):
+        records = [{'url': f'/{i}', 'timestamp': 10 * i} for i in range(4)]
+        offsets = []
+        for index in range(2):
+            timed = self._corpus(records, loop=True, replay_timestamps=True, shard=(index, 2)).timed_requests()
+            offsets += [next(timed)[0] for _ in range(4)]
+
+        # Together the shards replay 0/10/20/30, and the next pass 10 s after the last line
+        self.assertEqual(sorted(offsets), [0, 10, 20, 30, 40, 50, 60, 70])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self._corpus(lines=['', ' '])
+        with self.assertRaises(ValueError):
+            self._corpus(shuffle=True, replay_timestamps=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
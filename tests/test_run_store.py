@@ -0,0 +1,172 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.http_load_tester import HTTPLoadTester
+from src.run_store import RunStore, main
+
+# api.py is written to run from inside src/, like in the Docker image
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+import api  # noqa: E402
+
+URL = 'http://localhost/'
+
+
+def finished_tester(latencies, errors=0, url=URL):
+    """Return a tester holding a finished run with the given latencies, without sending anything."""
+    tester = HTTPLoadTester(url=url, qps=100, duration=len(latencies) / 100)
+    for latency in latencies:
+        tester.record_result(float(latency), 200, nbytes=10)
+    for _ in range(errors):
+        tester.record_error(error_class='timeout')
+    return tester
+
+
+class TestRunStore(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'history', 'runs.db')
+        self.store = RunStore(self.path)
+        rng = np.random.default_rng(7)
+        self.latencies = rng.lognormal(mean=3, sigma=0.5, size=4000)
+
+    def save(self, latencies, errors=0, url=URL):
+        tester = finished_tester(latencies, errors, url)
+        return self.store.save({'url': url, 'method': 'GET', 'qps': 100}, tester)
+
+    def test_save_list_and_get(self):
+        first = self.save(self.latencies)
+        other = self.save(self.latencies, url='http://localhost/other')
+        second = self.save(self.latencies * 2)
+
+        self.assertEqual([run['id'] for run in self.store.list()], [second, other, first])
+        self.assertEqual([run['id'] for run in self.store.list(url=URL, limit=1)], [second])
+
+        run = self.store.get(first)
+        tester = finished_tester(self.latencies)
+        results = tester.generate_report()
+        self.assertEqual(run['config'], {'url': URL, 'method': 'GET', 'qps': 100})
+        self.assertEqual(run['total_requests'], len(self.latencies))
+        self.assertEqual(run['p99_latency'], results['p99_latency'])
+        self.assertIs(run['generator_bound'], False)
+        self.assertEqual(run['results']['latency_histogram'], results['latency_histogram'])
+        self.assertEqual(run['results']['timeseries'], results['timeseries'])
+        self.assertEqual(run['results']['status_codes'], {'200': len(self.latencies)})
+        self.assertIsNone(self.store.get(12345))
+
+        # The history survives reopening the database
+        self.assertEqual(len(RunStore(self.path).list()), 3)
+
+    def test_diff(self):
+        baseline = self.save(self.latencies[:2000])
+        same = self.save(self.latencies[2000:])
+        slower = self.save(self.latencies[2000:] * 1.3)
+
+        diff = self.store.diff(baseline, same)
+        self.assertFalse(diff['distributions']['latency']['significant'])
+        self.assertGreater(diff['distributions']['latency']['p_value'], 0.01)
+
+        diff = self.store.diff(baseline, slower)
+        self.assertTrue(diff['distributions']['latency']['significant'])
+        p99 = next(metric for metric in diff['metrics'] if metric['metric'] == 'p99_latency')
+        self.assertGreater(p99['change'], 0.1)
+        self.assertFalse(p99['better'])
+        self.assertEqual((diff['baseline']['id'], diff['current']['id']), (baseline, slower))
+
+        with self.assertRaises(KeyError):
+            self.store.diff(baseline, 12345)
+
+    def test_check(self):
+        with self.assertRaises(ValueError):
+            self.store.check(self.save(self.latencies[:2000]))
+
+        same = self.save(self.latencies[2000:])
+        result = self.store.check(same)
+        self.assertTrue(result['passed'], result['failures'])
+        self.assertEqual(result['baseline_id'], same - 1)
+
+        # Each check compares against the previous run of the same target by default
+        slower = self.save(self.latencies[2000:] * 1.3, errors=100)
+        result = self.store.check(slower)
+        self.assertFalse(result['passed'])
+        self.assertEqual(result['baseline_id'], same)
+        self.assertEqual(len(result['failures']), 2)
+        self.assertIn('p99 latency rose', result['failures'][0])
+        self.assertIn('error rate rose', result['failures'][1])
+
+        self.assertTrue(self.store.check(slower, max_p99_increase=0.5, max_error_rate_increase=None)['passed'])
+        with self.assertRaises(ValueError):
+            self.store.check(slower, max_p95_increase=0.1)
+        with self.assertRaises(ValueError):
+            self.store.check(slower, min_qps_ratio=-1)
+
+    def test_cli(self):
+        baseline = self.save(self.latencies[:2000])
+        self.save(self.latencies[2000:] * 1.3)
+
+        def run(*argv):
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as err:
+                return main(['--db', self.path, *argv]), err.getvalue()
+
+        self.assertEqual(run('list')[0], 0)
+        self.assertEqual(run('show', 'latest')[0], 0)
+        self.assertEqual(run('diff', str(baseline), 'latest')[0], 0)
+        status, err = run('check')
+        self.assertEqual(status, 1)
+        self.assertIn('FAIL: p99 latency rose', err)
+        self.assertEqual(run('check', '--max-p99-increase', '1')[0], 0)
+        self.assertEqual(run('show', '12345')[0], 2)
+
+
+class TestRunHistoryApi(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        store = RunStore(os.path.join(tmp.name, 'runs.db'))
+        original, api.run_store = api.run_store, store
+        self.addCleanup(setattr, api, 'run_store', original)
+        self.client = api.app.test_client()
+
+        rng = np.random.default_rng(7)
+        latencies = rng.lognormal(mean=3, sigma=0.5, size=2000)
+        config = {'url': URL, 'method': 'GET'}
+        self.baseline = store.save(config, finished_tester(latencies))
+        self.run_id = store.save(config, finished_tester(latencies * 1.3))
+
+    def test_list_get_and_diff(self):
+        runs = self.client.get('/runs').get_json()['runs']
+        self.assertEqual([run['id'] for run in runs], [self.run_id, self.baseline])
+        self.assertEqual(len(self.client.get('/runs?limit=1').get_json()['runs']), 1)
+        self.assertEqual(self.client.get('/runs?limit=x').status_code, 400)
+
+        run = self.client.get(f'/runs/{self.run_id}').get_json()
+        self.assertEqual(run['config']['url'], URL)
+        self.assertIn('latency_histogram', run['results'])
+        self.assertEqual(self.client.get('/runs/12345').status_code, 404)
+
+        diff = self.client.get(f'/runs/{self.baseline}/diff/{self.run_id}').get_json()
+        self.assertTrue(diff['distributions']['latency']['significant'])
+        self.assertEqual(self.client.get(f'/runs/{self.baseline}/diff/12345').status_code, 404)
+
+    def test_check(self):
+        result = self.client.post(f'/runs/{self.run_id}/check', json={}).get_json()
+        self.assertFalse(result['passed'])
+        self.assertEqual(result['baseline_id'], self.baseline)
+
+        result = self.client.post(f'/runs/{self.run_id}/check',
+                                  json={'baseline_id': self.baseline, 'max_p99_increase': 1}).get_json()
+        self.assertTrue(result['passed'])
+        self.assertEqual(self.client.post(f'/runs/{self.run_id}/check', json={'max_p95': 1}).status_code, 400)
+        self.assertEqual(self.client.post('/runs/12345/check', json={}).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from src.http_load_tester import HTTPLoadTester, shard_config
+from src.sample_log import HEADER_SIZE, SampleLog, error_class_names, load_samples, read_start_time
+
+
+class TestSampleLog(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def write(self, name, count, chunk_records=3):
+        path = os.path.join(self.dir, name)
+        sample_log = SampleLog(path, chunk_records=chunk_records)
+        sample_log.start_time = 1700000000.5
+        for i in range(count):
+            if i % 4 == 3:
+                sample_log.record(i * 0.1, i * 0.1 + 0.002, 30.0, error_class='connection_reset')
+            else:
+                sample_log.record(i * 0.1, i * 0.1 + 0.001, 10.0 + i, 200, 512)
+        # Whole chunks are on disk before the log is closed
+        if count >= chunk_records:
+            self.assertEqual(os.path.getsize(path), HEADER_SIZE + count // chunk_records * chunk_records * 32)
+        sample_log.close()
+        return path
+
+    def test_round_trip(self):
+        path = self.write('samples.bin', 10)
+
+        samples = load_samples(path)
+        self.assertIsInstance(samples, np.memmap)
+        self.assertEqual(len(samples), 10)
+        self.assertEqual(read_start_time(path), 1700000000.5)
+        np.testing.assert_allclose(samples['intended_time'], np.arange(10) * 0.1)
+        failed = samples['status'] == 0
+        self.assertEqual(failed.sum(), 2)
+        self.assertTrue((samples['latency_ms'][failed] == 30).all())
+        self.assertEqual(samples['bytes'][~failed].tolist(), [512] * 8)
+        self.assertEqual(error_class_names(samples)[failed].tolist(), ['connection_reset'] * 2)
+        self.assertEqual(error_class_names(samples)[0], '')
+        # Vectorized analysis: queueing delay of every request in milliseconds
+        np.testing.assert_allclose((samples['send_time'] - samples['intended_time'])[~failed] * 1000, 1.0)
+
+        in_memory = load_samples(path, mmap=False)
+        self.assertNotIsInstance(in_memory, np.memmap)
+        np.testing.assert_array_equal(in_memory, samples)
+
+    def test_concatenate_and_truncated_logs(self):
+        first = self.write('samples.0.bin', 5)
+        second = self.write('samples.1.bin', 4)
+        with open(second, 'ab') as f:
+            f.write(b'\x00' * 10)  # A record cut short by a crash
+
+        samples = load_samples(first, second)
+        self.assertEqual(len(samples), 9)
+        self.assertEqual(len(load_samples(self.write('empty.bin', 0))), 0)
+
+    def test_invalid_files(self):
+        path = os.path.join(self.dir, 'other.bin')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+        with self.assertRaises(ValueError):
+            load_samples(path)
+        with self.assertRaises(ValueError):
+            load_samples()
+        with self.assertRaises(ValueError):
+            SampleLog(os.path.join(self.dir, 'samples.bin'), chunk_records=0)
+
+
+class TestTesterSampleLog(unittest.TestCase):
+
+    def test_run_writes_every_request(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'logs', 'samples.bin')
+            tester = HTTPLoadTester(url='http://localhost/', qps=50, duration=1, sample_log=path)
+            calls = 0
+
+            async def send(*args, **kwargs):
+                nonlocal calls
+                calls += 1
+                if calls % 5 == 0:
+                    raise ConnectionResetError()
+                return 200, 10
+
+            started = time.time()
+            with patch.object(tester.engine, 'send', side_effect=send):
+                asyncio.run(tester.run_test())
+            samples = load_samples(path, mmap=False)
+
+            self.assertEqual(len(samples), tester.generate_report()['total_requests'])
+            self.assertEqual((samples['status'] == 200).sum(), tester.status_codes[200])
+            self.assertEqual(error_class_names(samples).tolist().count('connection_reset'), tester.error_count)
+            self.assertTrue((samples['send_time'] >= samples['intended_time']).all())
+            # Open-loop sends follow the constant-rate schedule
+            np.testing.assert_allclose(np.sort(samples['intended_time']), np.arange(len(samples)) / 50, atol=1e-6)
+            self.assertAlmostEqual(read_start_time(path), started, delta=1)
+
+    def test_shards_get_their_own_files(self):
+        shards = shard_config({'url': 'http://localhost/', 'qps': 10, 'sample_log': 'out/samples.bin'}, 2)
+
+        self.assertEqual([shard['sample_log'] for shard in shards], ['out/samples.0.bin', 'out/samples.1.bin'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,88 @@
+import collections
+import json
+import os
+import tempfile
+import unittest
+
+from src.scenario import CompiledText, Scenario
+
+
+class TestScenario(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.csv_path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write('email,token\na@example.com,t1\n"quote""d@example.com",t2\n')
+        self.addCleanup(os.remove, self.csv_path)
+
+    def _scenario(self, templates, **options):
+        return Scenario({'csv': self.csv_path, 'templates': templates}, base_url='http://example.com/', **options)
+
+    def test_compiled_text(self):
+        text = CompiledText('/users/{{seq}}/{{ csv.email }}', ['email'])
+
+        self.assertEqual(text.render(7, {'email': 'a'}), '/users/7/a')
+        self.assertEqual(CompiledText('static', []).render(0, {}), 'static')
+        self.assertEqual(CompiledText('id={{random_int(5, 5)}}', [], encode=True).render(0, {}), b'id=5')
+        self.assertEqual(len(CompiledText('{{uuid}}', []).render(0, {})), 32)
+        for bad in ('{{nope}}', '{{csv.missing}}', '{{random_int(1)}}'):
+            with self.subTest(template=bad):
+                with self.assertRaises(ValueError):
+                    CompiledText(bad, ['email'])
+
+    def test_render_requests(self):
+        scenario = self._scenario([
+            {'name': 'create', 'method': 'post', 'url': '/users',
+             'headers': {'Authorization': 'Bearer {{csv.token}}', 'X-Static': 'yes'},
+             'body': {'email': '{{csv.email}}', 'ref': 'r-{{seq}}'}}
+        ])
+        requests = scenario.requests()
+        first, second, third = next(requests), next(requests), next(requests)
+
+        self.assertEqual(first.method, 'POST')
+        self.assertEqual(first.url, 'http://example.com/users')
+        self.assertEqual(first.endpoint, 'create')
+        self.assertEqual(json.loads(first.data), {'email': 'a@example.com', 'ref': 'r-0'})
+        # CSV values are escaped so the pre-encoded JSON body stays valid
+        self.assertEqual(json.loads(second.data), {'email': 'quote"d@example.com', 'ref': 'r-1'})
+        self.assertEqual(json.loads(third.data)['email'], 'a@example.com')
+        self.assertEqual(first.headers, {'Authorization': 'Bearer t1', 'X-Static': 'yes',
+                                         'Content-Type': 'application/json'})
+        self.assertEqual(second.headers['Authorization'], 'Bearer t2')
+
+    def test_static_parts_are_shared(self):
+        scenario = self._scenario([{'url': '/health', 'headers': {'Accept': 'text/plain'}, 'body': 'ping'}])
+        requests = scenario.requests()
+        first, second = next(requests), next(requests)
+
+        self.assertIs(first.headers, second.headers)
+        self.assertIs(first.data, second.data)
+        self.assertEqual(first.endpoint, 'GET /health')
+
+    def test_weights(self):
+        scenario = self._scenario([{'name': 'a', 'url': '/a', 'weight': 3}, {'name': 'b', 'url': '/b'},
+                                   {'name': 'never', 'url': '/c', 'weight': 0}])
+        requests = scenario.requests()
+        counts = collections.Counter(next(requests).endpoint for _ in range(8000))
+
+        self.assertAlmostEqual(counts['a'] / 8000, 0.75, delta=0.03)
+        self.assertEqual(counts['never'], 0)
+
+    def test_shard_interleaves_sequences(self):
+        scenario = self._scenario([{'url': '/items/{{seq}}/{{csv.token}}'}], shard=(1, 3))
+        requests = scenario.requests()
+
+        self.assertEqual([next(requests).url for _ in range(3)],
+                         ['http://example.com/items/1/t2', 'http://example.com/items/4/t1',
+                          'http://example.com/items/7/t2'])
+
+    def test_invalid_scenarios(self):
+        for templates in ([], [{'url': '/a', 'weight': 0}], [{'url': '/a'}, {'url': '/a'}],
+                          [{'url': '/a', 'weight': -1}]):
+            with self.subTest(templates=templates):
+                with self.assertRaises(ValueError):
+                    self._scenario(templates)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import unittest
+
+from src.self_benchmark import compare_results, run_benchmark
+
+
+class TestSelfBenchmark(unittest.TestCase):
+
+    def test_compare_results(self):
+        baseline = {'cases': [
+            {'case': 'open_loop', 'target_qps': 100, 'concurrency': 10, 'achieved_qps': 100, 'jitter_p99_ms': 2.0},
+            {'case': 'max_rps', 'concurrency': 10, 'achieved_qps': 4000, 'report_ms': 0}
+        ]}
+        current = {'cases': [
+            {'case': 'open_loop', 'target_qps': 100, 'concurrency': 10, 'achieved_qps': 100, 'jitter_p99_ms': 1.0},
+            {'case': 'max_rps', 'concurrency': 10, 'achieved_qps': 3000, 'report_ms': 1},
+            {'case': 'max_rps', 'concurrency': 50, 'achieved_qps': 5000}
+        ]}
+
+        comparison = {(row['case'], row['metric']): row for row in compare_results(baseline, current)}
+
+        self.assertEqual(len(comparison), 4)
+        self.assertEqual(comparison['open_loop', 'jitter_p99_ms']['change'], -0.5)
+        self.assertTrue(comparison['open_loop', 'jitter_p99_ms']['better'])
+        self.assertEqual(comparison['max_rps', 'achieved_qps']['change'], -0.25)
+        self.assertFalse(comparison['max_rps', 'achieved_qps']['better'])
+        self.assertIsNone(comparison['max_rps', 'report_ms']['change'])
+
+    @unittest.skipIf(os.environ.get('SKIP_INTEGRATION_TESTS'), "Skipping integration tests")
+    def test_run_benchmark(self):
+        results = run_benchmark(qps_levels=[50], concurrency_levels=[5], duration=0.4, latency_ms=5, port=0)
+
+        self.assertEqual(results['config']['latency_ms'], 5)
+        open_loop, max_rps, memory = results['cases']
+        self.assertEqual(open_loop['case'], 'open_loop')
+        self.assertEqual(open_loop['total_requests'], 20)
+        self.assertGreaterEqual(open_loop['jitter_p99_ms'], open_loop['jitter_p50_ms'])
+        self.assertGreater(open_loop['report_ms'], 0)
+        self.assertEqual(max_rps['case'], 'max_rps')
+        self.assertGreater(max_rps['achieved_qps'], 0)
+        self.assertGreaterEqual(max_rps['p99_latency'], 5)
+        self.assertEqual(memory['case'], 'memory')
+        self.assertGreater(memory['peak_bytes_per_request'], 0)
+        # Against itself every metric is unchanged
+        self.assertTrue(all(row['change'] in (0, None) for row in compare_results(results, results)))
+
+
+if __name__ == '__main__':
+    unittest.main()
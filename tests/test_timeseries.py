@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from src.http_load_tester import HTTPLoadTester
+from src.timeseries import TimeSeries
+
+
+class TestTimeSeries(unittest.TestCase):
+
+    def test_intervals(self):
+        timeseries = TimeSeries(interval=1.0, capacity=10)
+        timeseries.record(0.2, 10.0, 200, 100)
+        timeseries.record(0.7, 20.0, 503)
+        timeseries.record_error(2.5)
+
+        report = timeseries.report()
+        self.assertEqual(report['start'], [0, 1, 2])
+        self.assertEqual(report['requests'], [2, 0, 1])
+        self.assertEqual(report['errors'], [0, 0, 1])
+        self.assertEqual(report['bytes_received'], [100, 0, 0])
+        self.assertEqual(report['status_classes'], {'2xx': [1, 0, 0], '5xx': [1, 0, 0]})
+        # Interval percentiles are accurate to a bucket width (about 12%)
+        self.assertAlmostEqual(report['p50_latency'][0], 10.0, delta=1.5)
+        self.assertAlmostEqual(report['p99_latency'][0], 20.0, delta=3)
+        self.assertEqual(report['p99_latency'][1:], [0, 0])
+
+    def test_memory_stays_fixed(self):
+        timeseries = TimeSeries(interval=1.0, capacity=4)
+        for second in range(10):
+            timeseries.record(second + 0.5, 5.0, 200)
+
+        # Ten seconds do not fit in four one-second intervals, so they were merged twice
+        self.assertEqual(timeseries.interval, 4.0)
+        self.assertEqual(timeseries.requests.shape, (4,))
+        self.assertEqual(timeseries.report()['requests'], [4, 4, 2])
+
+    def test_totals_survive_merging_intervals(self):
+        timeseries = TimeSeries(interval=1.0, capacity=4)
+        timeseries.record(0.5, 5.0, 200, 10)
+        before = timeseries.totals()
+        for second in range(1, 10):
+            timeseries.record(second + 0.5, 5.0, 404, 10)
+        timeseries.record_error(9.9, 'timeout')
+
+        # The difference covers what was recorded in between, even across merges
+        after = timeseries.totals()
+        self.assertEqual(after['requests'] - before['requests'], 10)
+        self.assertEqual(after['bytes_received'] - before['bytes_received'], 90)
+        self.assertEqual((after['status_classes'] - before['status_classes']).tolist(), [0, 0, 0, 9, 0])
+        self.assertEqual((after['latency'] - before['latency']).sum(), 9)
+        self.assertEqual(after['error_classes'].sum(), 1)
+
+    def test_reads_from_another_thread_lose_nothing(self):
+        timeseries = TimeSeries(interval=1.0, capacity=10)
+        done = threading.Event()
+
+        def read():
+            while not done.is_set():
+                timeseries.totals()
+                timeseries.to_dict()
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        try:
+            for i in range(100000):
+                timeseries.record(i / 20000, 5.0, 200)
+        finally:
+            done.set()
+            reader.join()
+
+        totals = timeseries.totals()
+        self.assertEqual(totals['requests'], 100000)
+        self.assertEqual(totals['latency'].sum(), 100000)
+        self.assertEqual(sum(TimeSeries.from_dict(timeseries.to_dict()).report()['requests']), 100000)
+
+    def test_merge_and_round_trip(self):
+        fine = TimeSeries(interval=1.0, capacity=4)
+        fine.record(0.5, 5.0, 200)
+        fine.record(3.5, 5.0, 200)
+        coarse = TimeSeries(interval=1.0, capacity=4)
+        coarse.record(7.5, 50.0, 404)
+
+        merged = TimeSeries.from_dict(json.loads(json.dumps(fine.to_dict()))).merge(coarse)
+        self.assertEqual(merged.interval, 2.0)
+        self.assertEqual(merged.report()['requests'], [1, 1, 0, 1])
+        self.assertEqual(merged.report()['status_classes']['4xx'], [0, 0, 0, 1])
+        # The argument is left as it was
+        self.assertEqual(fine.interval, 1.0)
+        with self.assertRaises(ValueError):
+            merged.merge(TimeSeries(interval=0.5, capacity=4))
+
+    def test_invalid_layout(self):
+        with self.assertRaises(ValueError):
+            TimeSeries(capacity=3)
+        with self.assertRaises(ValueError):
+            TimeSeries(interval=0)
+
+
+class TestTesterTimeSeries(unittest.TestCase):
+
+    def test_report_and_plot(self):
+        tester = HTTPLoadTester(url='http://localhost/', qps=50, duration=1.2)
+        calls = 0
+
+        async def send(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            if calls % 5 == 0:
+                raise ConnectionResetError()
+            return 200, 10
+
+        with patch.object(tester.engine, 'send', side_effect=send):
+            asyncio.run(tester.run_test())
+        results = tester.generate_report()
+
+        timeseries = results['timeseries']
+        self.assertEqual(timeseries['interval'], 1.0)
+        self.assertEqual(len(timeseries['start']), 2)
+        self.assertEqual(sum(timeseries['requests']), results['total_requests'])
+        self.assertEqual(sum(timeseries['errors']), tester.error_count)
+        self.assertEqual(sum(timeseries['status_classes']['2xx']), tester.status_codes[200])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'timeline.png')
+            tester.plot_timeline(timeseries, path)
+            self.assertTrue(os.path.getsize(path) > 0)
+
+        # Workers' series are merged interval by interval
+        merged = HTTPLoadTester(url='http://localhost/', qps=50)
+        merged.merge_state(tester.export_state())
+        merged.merge_state(tester.export_state())
+        self.assertEqual(merged.generate_report()['timeseries']['requests'],
+                         [2 * requests for requests in timeseries['requests']])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)